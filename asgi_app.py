@@ -0,0 +1,415 @@
+"""
+Asyncio serving mode for ThapluBot.
+
+The chat endpoints run natively on the event loop: admission waits,
+upstream retries and the Gemini call (generate_content_async) are all awaited,
+so one worker can hold hundreds of in-flight conversations without pinning
+a thread per request. Everything else is forwarded to the Flask app in
+server.py through a small WSGI bridge, so both modes serve the same API.
+
+Run with any ASGI server, e.g.:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+"""
+import asyncio
+import io
+import json
+import math
+import sys
+import time
+
+import server
+from json_provider import dumps_bytes
+from rate_limiter import RateLimitExceeded
+from session_sequencer import SessionBusy
+from tracing import add_span, bind, span
+
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+async def wait_for_rate_limit_async(session_id=None):
+    """Wait for a session admission slot without blocking the event loop"""
+    with span('rate_limit_wait'):
+        waited = await server.scheduler.acquire_async(None, session_id)
+    server.STAGE_RATE_LIMIT.observe(waited)
+    return waited
+
+
+async def off_loop(func, *args):
+    """Run a pipeline step that may do session SQLite I/O on a thread
+
+    With SESSION_DB a cold session is loaded from SQLite; in cluster mode
+    every lookup checks the shared table. Without persistence the step only
+    touches memory and runs inline.
+    """
+    if server.chat_contexts.persistence is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, bind(lambda: func(*args)))
+
+
+async def generate_text_async(policy, full_prompt):
+    """Async twin of server.generate_text"""
+    upstream = server.upstream
+    text = await server.single_flight.do_async(
+        (policy.name, full_prompt), lambda: upstream.generate_async(full_prompt, **policy.kwargs)
+    )
+    retry = None if text.strip() else server.generation_policy.escalate(policy)
+    if retry is None:
+        return text
+    return await server.single_flight.do_async(
+        (retry.name, full_prompt), lambda: upstream.generate_async(full_prompt, **retry.kwargs)
+    )
+
+
+async def stream_text_async(policy, full_prompt):
+    """Async twin of server.stream_text"""
+    produced = False
+    async for text in server.upstream.stream_async(full_prompt, **policy.kwargs):
+        produced = True
+        yield text
+    retry = None if produced else server.generation_policy.escalate(policy)
+    if retry is not None:
+        async for text in server.upstream.stream_async(full_prompt, **retry.kwargs):
+            yield text
+
+
+async def generate_turn_async(user_message, session_id):
+    """Async twin of server.generate_turn"""
+    context, sentiment, policy, full_prompt = await off_loop(server.prepare_generation, user_message, session_id)
+
+    # Serve repeated messages from the cache, otherwise generate
+    bot_response, cache_keys = server.cached_response(user_message, sentiment, context.history)
+    if bot_response is None:
+        upstream_start = time.perf_counter()
+        with span('upstream_call', policy=policy.name):
+            bot_response = await generate_text_async(policy, full_prompt)
+        server.record_generation(policy, upstream_start, bot_response)
+        server.cache_response(cache_keys, bot_response)
+
+    return await off_loop(server.finish_response, user_message, session_id, context, sentiment, bot_response)
+
+
+async def generate_response_async(user_message, session_id):
+    """Async twin of server.generate_response"""
+    try:
+        await wait_for_rate_limit_async(session_id)
+
+        # One turn at a time per session, so every prompt sees the previous reply
+        with span('session_turn'):
+            result = await server.session_sequencer.run_async(
+                session_id, user_message, lambda: generate_turn_async(user_message, session_id)
+            )
+        return dict(result)
+
+    except (RateLimitExceeded, SessionBusy):
+        raise
+
+    except Exception as e:
+        return server.error_result(e)
+
+
+async def stream_response_async(user_message, session_id):
+    """Async twin of server.stream_response (caller handles admission and session order)"""
+    start_time = time.perf_counter()
+    first_token_ms = None
+    chunks = []
+
+    try:
+        context, sentiment, policy, full_prompt = await off_loop(server.prepare_generation, user_message, session_id)
+
+        yield server.sse_event('start', {'session_id': session_id, 'sentiment': sentiment})
+
+        # Relay partial text as it arrives
+        cached, cache_keys = server.cached_response(user_message, sentiment, context.history)
+        if cached is None:
+            upstream_start = time.perf_counter()
+            async for text in stream_text_async(policy, full_prompt):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start_time) * 1000, 1)
+                chunks.append(text)
+                yield server.sse_event('chunk', {'text': text})
+            add_span('upstream_stream', upstream_start, policy=policy.name)
+            server.record_generation(policy, upstream_start, ''.join(chunks))
+            server.cache_response(cache_keys, ''.join(chunks))
+        else:
+            first_token_ms = round((time.perf_counter() - start_time) * 1000, 1)
+            chunks.append(cached)
+            yield server.sse_event('chunk', {'text': cached})
+
+        # Flavor and store the complete response exactly once
+        result = await off_loop(server.finish_response, user_message, session_id, context, sentiment,
+                                ''.join(chunks))
+        event = 'done'
+
+    except Exception as e:
+        result = server.error_result(e)
+        event = 'error'
+
+    result['session_id'] = session_id
+    result['ttfb_ms'] = first_token_ms
+    result['total_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+    yield server.sse_event(event, result)
+
+
+# ==================== ASGI PLUMBING ====================
+
+async def read_body(receive):
+    """Read the full request body"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, status, payload, headers=()):
+    """Send a complete JSON response"""
+    body = dumps_bytes(payload)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            *CORS_HEADERS,
+            *headers,
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_rate_limited(send, error):
+    """Send a 429 with a Retry-After header"""
+    retry_after = str(max(1, math.ceil(error.retry_after)))
+    await send_json(send, 429, {
+        'success': False,
+        'error': 'Too many requests',
+        'reason': error.reason,
+        'response': "Arre yaar 😑 thoda saans le... Thodi der baad try kar 🙄",
+        'retry_after': round(error.retry_after, 2),
+        'timestamp': server.datetime.now().isoformat()
+    }, [(b'retry-after', retry_after.encode())])
+
+
+async def send_session_busy(send, error):
+    """Send a 409 for a busy session"""
+    await send_json(send, 409, server.session_busy_result(error))
+
+
+def parse_chat_request(body):
+    """Validate a chat request body; return (message, session_id, error)"""
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+
+    if not data or not isinstance(data, dict):
+        return None, None, 'No JSON data provided'
+
+    user_message = (data.get('message') or '').strip()
+    if not user_message:
+        return None, None, 'Message is required'
+
+    # Get or create session ID
+    try:
+        session_id = server.request_session_id(data.get('session_id'))
+    except ValueError as e:
+        return None, None, str(e)
+
+    return user_message, session_id, None
+
+
+async def chat(receive, send):
+    """Main chat endpoint (async)"""
+    user_message, session_id, error = parse_chat_request(await read_body(receive))
+    if error:
+        await send_json(send, 400, {'success': False, 'error': error})
+        return
+
+    try:
+        result = await generate_response_async(user_message, session_id)
+    except RateLimitExceeded as e:
+        await send_rate_limited(send, e)
+        return
+    except SessionBusy as e:
+        await send_session_busy(send, e)
+        return
+
+    result['session_id'] = session_id
+    await send_json(send, 200, result)
+
+
+async def chat_stream(receive, send):
+    """Streaming chat endpoint (async, Server-Sent Events)"""
+    user_message, session_id, error = parse_chat_request(await read_body(receive))
+    if error:
+        await send_json(send, 400, {'success': False, 'error': error})
+        return
+
+    # Admit before the stream starts so rejections can still be a 429 / 409
+    try:
+        await wait_for_rate_limit_async(session_id)
+        await server.session_sequencer.acquire_async(session_id)
+    except RateLimitExceeded as e:
+        await send_rate_limited(send, e)
+        return
+    except SessionBusy as e:
+        await send_session_busy(send, e)
+        return
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'x-session-id', session_id.encode()),
+                *CORS_HEADERS,
+            ],
+        })
+        async for event in stream_response_async(user_message, session_id):
+            await send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        server.session_sequencer.release(session_id)
+
+
+def call_wsgi(scope, body):
+    """Run the Flask app for one request; return (status, headers, body)"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_' + name
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = server.app(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers'], content
+
+
+def compressing_send(send, accept_encoding):
+    """Wrap send so complete (single-message) bodies are compressed like Flask's"""
+    encoding = server.compressor.negotiate(accept_encoding)
+    if encoding is None:
+        return send
+    held = []
+
+    async def send_compressed(message):
+        if message['type'] == 'http.response.start':
+            held.append(message)
+            return
+        if held:
+            start = held.pop()
+            headers = dict(start['headers'])
+            body = message.get('body', b'')
+            mimetype = headers.get(b'content-type', b'').decode('latin-1')
+            if (not message.get('more_body') and b'content-encoding' not in headers
+                    and server.compressor.eligible(mimetype, len(body))):
+                body = server.compressor.compress(body, encoding)
+                start = {**start, 'headers': [
+                    *((k, v) for k, v in start['headers'] if k != b'content-length'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'content-encoding', encoding.encode()),
+                    (b'vary', b'accept-encoding'),
+                ]}
+                message = {**message, 'body': body}
+            await send(start)
+        await send(message)
+
+    return send_compressed
+
+
+async def forward_to_flask(scope, receive, send):
+    """Serve a request with the sync Flask app on a worker thread"""
+    body = await read_body(receive)
+    status, headers, content = await asyncio.get_running_loop().run_in_executor(
+        None, call_wsgi, scope, body
+    )
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+}
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await forward_to_flask(scope, receive, send)
+        return
+
+    # Record the same request metrics the Flask hooks do
+    start_time = time.perf_counter()
+    status = [500]
+
+    headers = dict(scope.get('headers', []))
+    accept_encoding = headers[b'accept-encoding'].decode('latin-1') if b'accept-encoding' in headers else None
+    trace = server.tracer.begin(scope['path'], scope['method'], headers.get(b'x-profile') == b'1')
+    send_body = compressing_send(send, accept_encoding)
+
+    async def send_with_status(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        await send_body(message)
+
+    try:
+        await handler(receive, send_with_status)
+    except Exception as e:
+        await send_json(send_with_status, 500, {
+            'success': False,
+            'error': str(e),
+            'timestamp': server.datetime.now().isoformat()
+        })
+    finally:
+        server.REQUESTS.labels(scope['path'], scope['method'], status[0]).inc()
+        server.REQUEST_SECONDS.labels(scope['path']).observe(time.perf_counter() - start_time)
+        server.tracer.finish(trace, status[0])
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: whole-word sentiment matcher vs. the old substring scans.
+
+The matcher exists to fix false matches ("hi" in "this"), not for speed.
+This keeps its cost visible: it is roughly even on short messages and
+slower than the old scans on long messages and small keyword sets.
+
+    python benchmarks/bench_sentiment.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentiment import (GREETING_KEYWORDS, HELP_KEYWORDS, NEGATIVE_KEYWORDS,  # noqa: E402
+                       POSITIVE_KEYWORDS, SentimentMatcher, detect_sentiment)
+
+# The pre-matcher implementation, kept verbatim for comparison (including its
+# duplicated keywords)
+LEGACY_NEGATIVE = NEGATIVE_KEYWORDS + ['problem', 'tension']
+LEGACY_POSITIVE = POSITIVE_KEYWORDS + ['awesome']
+
+
+def legacy_detect_sentiment(message):
+    message_lower = message.lower()
+    negative_count = sum(1 for word in LEGACY_NEGATIVE if word in message_lower)
+    positive_count = sum(1 for word in LEGACY_POSITIVE if word in message_lower)
+    if '?' in message and any(word in message_lower for word in HELP_KEYWORDS):
+        return 'seeking_help'
+    if negative_count > positive_count and negative_count > 0:
+        return 'negative'
+    elif positive_count > negative_count and positive_count > 0:
+        return 'positive'
+    elif any(word in message_lower for word in GREETING_KEYWORDS):
+        return 'greeting'
+    else:
+        return 'neutral'
+
+
+FILLER = ('yaar aaj office mein bahut kaam tha and then we went for chai near the metro '
+          'station, this weather is wonder-ful honestly but the traffic was crazy').split()
+
+
+def make_message(words, rng):
+    vocab = FILLER + NEGATIVE_KEYWORDS + POSITIVE_KEYWORDS
+    return ' '.join(rng.choice(FILLER if rng.random() < 0.9 else vocab) for _ in range(words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'words':>7} {'legacy us':>10} {'matcher us':>11} {'ratio':>8}")
+    for words in (5, 50, 500, 2000):
+        messages = [make_message(words, rng) for _ in range(50)]
+        number = max(1, args.repeat // len(messages) // max(1, words // 50))
+        legacy = timeit.timeit(lambda: [legacy_detect_sentiment(m) for m in messages], number=number)
+        compiled = timeit.timeit(lambda: [detect_sentiment(m) for m in messages], number=number)
+        calls = number * len(messages)
+        print(f"{words:>7} {legacy / calls * 1e6:>10.1f} {compiled / calls * 1e6:>11.1f} "
+              f"{legacy / compiled:>7.1f}x")
+
+    # Cost as the keyword sets grow (e.g. a hot-reloaded keywords file)
+    print(f"\n{'keywords':>8} {'legacy us':>10} {'matcher us':>11} {'ratio':>8}")
+    messages = [make_message(200, rng).lower() for _ in range(50)]
+    for factor in (1, 5, 20):
+        extra = [f"{word}{i}" for i in range(factor - 1) for word in NEGATIVE_KEYWORDS]
+        keywords = NEGATIVE_KEYWORDS + extra
+        matcher = SentimentMatcher({'negative': keywords})
+        number = max(1, args.repeat // 200)
+        legacy = timeit.timeit(
+            lambda: [sum(1 for word in keywords if word in m) for m in messages], number=number)
+        compiled = timeit.timeit(lambda: [matcher.scan(m) for m in messages], number=number)
+        calls = number * len(messages)
+        print(f"{len(keywords):>8} {legacy / calls * 1e6:>10.1f} {compiled / calls * 1e6:>11.1f} "
+              f"{legacy / compiled:>7.1f}x")
+
+    # Substring false positives the old scans produced
+    for message in ('this is it', 'I wonder about it', 'sushi khana hai'):
+        print(f"{message!r}: legacy={legacy_detect_sentiment(message)} "
+              f"matcher={detect_sentiment(message)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Serialization and compression cost of the big read endpoints.
+
+Fills the session store with long Hinglish/emoji conversations, then
+times GET /api/context/<id> and GET /api/sessions through the Flask app
+with the stdlib provider vs the fast (orjson) provider, and with no
+compression vs gzip (and brotli when installed).
+
+    python benchmarks/bench_serialization.py [--sessions N] [--turns T] [--reply-chars C]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import compression  # noqa: E402
+import json_provider  # noqa: E402
+import server  # noqa: E402
+
+REPLY = ("Arre yaar 😅 tension mat le, sab theek ho jayega. **Step 1:** pehle ek deep breath le. "
+         "Phir mujhe bata exactly kya hua — main hoon na tere saath 💙\n\n")
+
+
+def fill_store(sessions, turns, reply_chars):
+    reply = (REPLY * (reply_chars // len(REPLY) + 1))[:reply_chars]
+    server.chat_contexts.history_limit = turns
+    server.chat_contexts.max_bytes = float('inf')
+    for i in range(sessions):
+        for t in range(turns):
+            server.chat_contexts.append_turn(f"bench-{i}", f"message {t} from user {i}, kya scene hai?", reply)
+
+
+def timed(client, path, accept_encoding, repeat):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    response = client.get(path, headers=headers)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(path, headers=headers).close()
+    return (time.perf_counter() - start) / repeat * 1000, len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--reply-chars', type=int, default=4000, help='~1000 output tokens per reply')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    fill_store(args.sessions, args.turns, args.reply_chars)
+    client = server.app.test_client()
+    providers = [('stdlib', DefaultJSONProvider(server.app))]
+    if json_provider.orjson is not None:
+        providers.append(('orjson', json_provider.FastJSONProvider(server.app)))
+    else:
+        print("orjson not installed: only the stdlib provider is measured")
+    encodings = [None, 'gzip'] + (['br'] if compression.brotli is not None else [])
+    paths = [('/api/context (1 session)', '/api/context/bench-0'),
+             ('/api/sessions (1000)', '/api/sessions?limit=1000')]
+
+    print(f"{'endpoint':<26} {'json':<7} {'coding':<9} {'ms/req':>8} {'bytes':>10}")
+    for label, path in paths:
+        for name, provider in providers:
+            server.app.json = provider
+            for encoding in encodings:
+                ms, size = timed(client, path, encoding, args.repeat)
+                print(f"{label:<26} {name:<7} {encoding or 'identity':<9} {ms:>8.2f} {size:>10}")
+
+    # Encoder alone, without the request/response machinery
+    print(f"\n{'payload':<26} {'json':<7} {'ms/dump':>8}")
+    for label, path in paths:
+        payload = client.get(path).get_json()
+        for name, provider in providers:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                provider.response(payload)
+            ms = (time.perf_counter() - start) / args.repeat * 1000
+            print(f"{label:<26} {name:<7} {ms:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Turn log write throughput and cold-start rebuild time.
+
+Writes N turns spread over S sessions through TurnLog (the request path
+only enqueues; the writer thread batches), then rebuilds a fresh
+SessionStore from the segments with the mmap reader and streams one
+session's turns.
+
+    python benchmarks/bench_turn_log.py [--turns 1000000] [--sessions 100000] [--dir PATH]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionStore  # noqa: E402
+from turn_log import TurnLog, TurnLogReader, segment_paths  # noqa: E402
+
+USER = "yaar aaj office mein bahut kaam tha, thak gaya hoon 😩"
+BOT = ("Arre yaar 💙 itna kaam karke thakna toh banta hai. Thoda rest kar, paani pi, "
+       "aur kal ke liye ek chhoti si list bana le - sab manageable lagega ✨")
+
+
+def write(log_dir, turns, sessions, segment_bytes):
+    log = TurnLog(log_dir, segment_bytes=segment_bytes, flush_interval=0.05, batch_size=5000)
+    rng = random.Random(0)
+    session_ids = [f"session-{rng.randrange(sessions)}" for _ in range(turns)]
+    now = time.time() - turns * 0.001
+    start = time.perf_counter()
+    for i, session_id in enumerate(session_ids):
+        log.append(session_id, now + i * 0.001, USER, BOT)
+    enqueued = time.perf_counter() - start
+    log.close()
+    total = time.perf_counter() - start
+    return log, enqueued, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=1_000_000)
+    parser.add_argument('--sessions', type=int, default=100_000)
+    parser.add_argument('--segment-mb', type=int, default=64)
+    parser.add_argument('--dir', help='log directory (default: a temporary one, removed afterwards)')
+    args = parser.parse_args()
+
+    log_dir = args.dir or tempfile.mkdtemp(prefix='turn-log-')
+    try:
+        log, enqueued, total = write(log_dir, args.turns, args.sessions, args.segment_mb * 1024 * 1024)
+        size = sum(os.path.getsize(p) for p in segment_paths(log_dir))
+        print(f"write    {args.turns} turns, {size / 1e6:.1f} MB in {len(segment_paths(log_dir))} segments")
+        print(f"  enqueue {enqueued / args.turns * 1e6:.2f} us/turn (request path)")
+        print(f"  drained {args.turns / total:,.0f} turns/s, {size / total / 1e6:.1f} MB/s "
+              f"in {log.batches} batches")
+
+        store = SessionStore(max_sessions=args.sessions * 2, max_bytes=float('inf'), ttl=0)
+        reader = TurnLogReader(log_dir)
+        start = time.perf_counter()
+        sessions, records = reader.rebuild(store)
+        elapsed = time.perf_counter() - start
+        print(f"rebuild  {sessions} sessions from {records} records in {elapsed:.2f}s "
+              f"({records / elapsed:,.0f} records/s, {store.nbytes / 1e6:.1f} MB resident)")
+
+        start = time.perf_counter()
+        count = sum(1 for _ in reader.session_turns('session-0'))
+        print(f"stream   session-0: {count} turns in {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        if not args.dir:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
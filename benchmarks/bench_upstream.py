@@ -0,0 +1,94 @@
+"""
+Tail latency of the upstream pool under quota pressure, against FakeGemini.
+
+Compares the old single-key recursive retry (fixed sleep) with the pool
+using one key, several keys, and several keys with hedging.
+
+    python benchmarks/bench_upstream.py [--requests N] [--concurrency C]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_gemini import FakeGemini  # noqa: E402
+from upstream import UpstreamClient, UpstreamPool, is_quota_error  # noqa: E402
+
+
+def fake(args, seed):
+    return FakeGemini(latency_ms=args.latency_ms, sigma=0.3, slow_rate=args.slow_rate,
+                      slow_factor=8, rpm=args.rpm, seed=seed)
+
+
+def legacy_call(model, prompt, retry_sleep, retry_count=0):
+    """The pre-pool behaviour: recurse after a fixed sleep on quota errors"""
+    try:
+        return model.generate_content(prompt).text
+    except Exception as e:
+        if is_quota_error(str(e)) and retry_count < 2:
+            time.sleep(retry_sleep)
+            return legacy_call(model, prompt, retry_sleep, retry_count + 1)
+        raise
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def run(name, call, args):
+    latencies, failures = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            call(f"prompt {i}")
+            return time.perf_counter() - start, True
+        except Exception:
+            return time.perf_counter() - start, False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        for latency, ok in executor.map(one, range(args.requests)):
+            latencies.append(latency)
+            failures += not ok
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {args.requests / elapsed:>7.1f} {statistics.median(latencies) * 1000:>8.0f} "
+          f"{percentile(latencies, 0.95) * 1000:>8.0f} {percentile(latencies, 0.99) * 1000:>8.0f} "
+          f"{failures:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--keys', type=int, default=3)
+    parser.add_argument('--rpm', type=int, default=150, help='per-key quota of the fake upstream')
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--retry-sleep', type=float, default=0.3, help='legacy fixed retry sleep (s)')
+    args = parser.parse_args()
+
+    print(f"{'mode':<22} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>6}")
+
+    model = fake(args, 0)
+    run('legacy 1 key', lambda p: legacy_call(model, p, args.retry_sleep), args)
+
+    def pool(keys, hedge):
+        clients = [UpstreamClient(f"fake#{i}", fake(args, i), reset_timeout=1.0) for i in range(keys)]
+        return UpstreamPool(clients, backoff_base=0.05, backoff_max=0.5, hedge=hedge)
+
+    for name, keys, hedge in (('pool 1 key', 1, None),
+                              (f'pool {args.keys} keys', args.keys, None),
+                              (f'pool {args.keys} keys + hedge', args.keys, 'auto')):
+        upstream = pool(keys, hedge)
+        run(name, upstream.generate, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Local stand-in for a Gemini GenerativeModel.
+
+FakeGemini implements generate_content / generate_content_async
+(including stream=True) with a configurable latency distribution, token
+rate, per-minute quota and error injection, so the upstream pool and the
+whole request path can be exercised offline without spending quota.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+
+QUOTA_ERROR = "429 Resource has been exhausted (e.g. check quota)."
+SERVER_ERROR = "503 The service is currently unavailable."
+
+WORDS = ('arre yaar dekh sab theek ho jayega tension mat le mai hoon na tera saath '
+         'mein chal chai peete hai aur baat karte hai').split()
+
+
+class FakeChunk:
+    """Mimics a response / stream chunk: only .text is used"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """Fake upstream model with latency, token rate, quota and error injection"""
+
+    def __init__(self, latency_ms=300.0, sigma=0.3, slow_rate=0.0, slow_factor=5.0,
+                 reply_tokens=60, tokens_per_second=None, rpm=None,
+                 error_rate=0.0, quota_error_rate=0.0, seed=None):
+        # Base latency is lognormal around latency_ms; slow_rate of calls take slow_factor x longer
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        # Output size and streaming speed (None = whole reply arrives after the latency)
+        self.reply_tokens = reply_tokens
+        self.tokens_per_second = tokens_per_second
+        # Requests per rolling minute before 429s (None = unlimited)
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = deque()
+        self.calls = 0
+        self.quota_errors = 0
+        self.errors = 0
+
+    def _admit(self):
+        """Count a call; return (error to fail with or None, latency in seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            if (self.rpm is not None and len(self._window) >= self.rpm) or roll < self.quota_error_rate:
+                self.quota_errors += 1
+                return QUOTA_ERROR, 0.0
+            self._window.append(now)
+            if roll < self.quota_error_rate + self.error_rate:
+                self.errors += 1
+                return SERVER_ERROR, 0.0
+            latency = self.latency_ms * math.exp(self._random.gauss(0, self.sigma)) / 1000
+            if self._random.random() < self.slow_rate:
+                latency *= self.slow_factor
+        return None, latency
+
+    def _reply(self, prompt, kwargs):
+        # A per-call max_output_tokens caps the reply, as it does upstream
+        cap = (kwargs.get('generation_config') or {}).get('max_output_tokens', self.reply_tokens)
+        words = [self._random.choice(WORDS) for _ in range(min(self.reply_tokens, cap))]
+        return f"{' '.join(words)} ({len(prompt)} chars seen)"
+
+    def _chunks(self, text, size=8):
+        words = text.split(' ')
+        return [' '.join(words[i:i + size]) + ' ' for i in range(0, len(words), size)]
+
+    def _chunk_delay(self, chunk):
+        if not self.tokens_per_second:
+            return 0.0
+        return len(chunk.split()) / self.tokens_per_second
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        error, latency = self._admit()
+        if error:
+            raise Exception(error)
+        time.sleep(latency)
+        text = self._reply(prompt, kwargs)
+        if not stream:
+            time.sleep(sum(self._chunk_delay(c) for c in self._chunks(text)))
+            return FakeChunk(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        for chunk in self._chunks(text):
+            time.sleep(self._chunk_delay(chunk))
+            yield FakeChunk(chunk)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        error, latency = self._admit()
+        if error:
+            raise Exception(error)
+        await asyncio.sleep(latency)
+        text = self._reply(prompt, kwargs)
+        if not stream:
+            await asyncio.sleep(sum(self._chunk_delay(c) for c in self._chunks(text)))
+            return FakeChunk(text)
+        return self._stream_async(text)
+
+    async def _stream_async(self, text):
+        for chunk in self._chunks(text):
+            await asyncio.sleep(self._chunk_delay(chunk))
+            yield FakeChunk(chunk)
+
+    def stats(self):
+        return {'calls': self.calls, 'quota_errors': self.quota_errors, 'errors': self.errors}
@@ -0,0 +1,221 @@
+"""
+Offline load test of /api/chat against FakeGemini.
+
+Drives the real Flask app in-process with many concurrent sessions, each
+sending a multi-turn conversation, so rate limiting, session handling,
+prompt building and the upstream pool are all on the path. Reports RPS,
+p50/p95/p99 latency, per-stage time and chat_contexts memory growth.
+
+    python benchmarks/load_test.py [--sessions N] [--turns T] [--concurrency C]
+    python benchmarks/load_test.py --quota-error-rate 0.1 --json results.json
+
+Service limits are opened up by default so the fake upstream is the
+bottleneck; set GEMINI_RPM, SESSION_RPM, ... in the environment to
+measure the limiter instead.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('GEMINI_API_KEY', 'offline-load-test')
+for name, value in (('GEMINI_RPM', '1000000'), ('GEMINI_BURST', '100000'),
+                    ('SESSION_RPM', '1000000'), ('SESSION_BURST', '100000'),
+                    ('RATE_LIMIT_MAX_QUEUE', '100000')):
+    os.environ.setdefault(name, value)
+
+import server  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+from upstream import UpstreamClient, UpstreamPool  # noqa: E402
+
+# Openers and follow-ups covering every sentiment bucket
+OPENERS = ['hi', 'hello bhai', 'kya hal hai', 'I failed my exam and I am so sad',
+           'got the job, so happy!', 'how do I talk to my parents about this?',
+           'bored yaar', 'mast din tha aaj', 'my breakup is hurting a lot']
+FOLLOW_UPS = ['hmm', 'aur bata', 'why does this keep happening?', 'thanks bhai, that helps',
+              'I am still worried about tomorrow', 'haha sahi hai', 'what should I do next?',
+              'tell me something fun', 'feeling better now']
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def conversation(rng, turns, unique):
+    """Messages for one session; `unique` appends a nonce so the cache cannot help"""
+    messages = [rng.choice(OPENERS)] + [rng.choice(FOLLOW_UPS) for _ in range(turns - 1)]
+    if unique:
+        messages = [f"{m} #{rng.randrange(10 ** 9)}" for m in messages]
+    return messages
+
+
+def install_fake_upstream(args):
+    """Swap the Gemini pool for FakeGemini clients behind the same scheduler"""
+    clients = [
+        UpstreamClient(
+            f"fake#{i}",
+            FakeGemini(latency_ms=args.latency_ms, sigma=args.sigma, slow_rate=args.slow_rate,
+                       reply_tokens=args.reply_tokens, tokens_per_second=args.tokens_per_second,
+                       rpm=args.rpm, error_rate=args.error_rate,
+                       quota_error_rate=args.quota_error_rate, seed=args.seed + i),
+            api_key=f"fake-key-{i}",
+        )
+        for i in range(args.keys)
+    ]
+    server.upstream = UpstreamPool(clients, scheduler=server.scheduler,
+                                   backoff_base=0.05, backoff_max=1.0,
+                                   hedge='auto' if args.hedge else None)
+    return clients
+
+
+class Recorder:
+    """Latencies, statuses and periodic memory samples from all workers"""
+
+    def __init__(self, sample_every):
+        self.sample_every = sample_every
+        self.latencies = []
+        self.statuses = {}
+        self.failures = 0
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def record(self, latency, status, ok):
+        with self._lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.failures += not ok
+            if len(self.latencies) % self.sample_every == 0:
+                self.samples.append(memory_sample(len(self.latencies)))
+
+
+def memory_sample(requests):
+    current = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    return {
+        'requests': requests,
+        'sessions': len(server.chat_contexts),
+        'store_bytes': server.chat_contexts.nbytes,
+        'traced_bytes': current,
+    }
+
+
+def run_session(client, messages, session_id, recorder):
+    for message in messages:
+        start = time.perf_counter()
+        response = client.post('/api/chat', json={'message': message, 'session_id': session_id})
+        latency = time.perf_counter() - start
+        body = response.get_json(silent=True) or {}
+        recorder.record(latency, response.status_code, response.status_code == 200 and body.get('success'))
+
+
+def stage_means():
+    """Mean seconds per pipeline stage, from the server's own histograms"""
+    means = {}
+    for (stage,), cell in server.STAGE_SECONDS.values().items():
+        if cell[-1]:
+            means[stage] = cell[-2] / cell[-1]
+    return means
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=6, help='messages per session')
+    parser.add_argument('--concurrency', type=int, default=32, help='sessions in flight at once')
+    parser.add_argument('--unique', action='store_true', help='make every message unique (no cache hits)')
+    parser.add_argument('--keys', type=int, default=1, help='fake upstream keys in the pool')
+    parser.add_argument('--hedge', action='store_true', help='enable auto hedging in the pool')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--sigma', type=float, default=0.3, help='lognormal latency spread')
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--reply-tokens', type=int, default=60)
+    parser.add_argument('--tokens-per-second', type=float, default=None)
+    parser.add_argument('--rpm', type=int, default=None, help='per-key quota of the fake upstream')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--quota-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracemalloc', action='store_true', help='also trace Python heap growth (slower)')
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='keep server log output')
+    args = parser.parse_args()
+
+    fakes = install_fake_upstream(args)
+    rng = random.Random(args.seed)
+    conversations = [conversation(rng, args.turns, args.unique) for _ in range(args.sessions)]
+    total = args.sessions * args.turns
+    recorder = Recorder(sample_every=max(1, total // 10))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    baseline = memory_sample(0)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def worker(item):
+        index, messages = item
+        run_session(server.app.test_client(), messages, f"load-{args.seed}-{index}", recorder)
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with quiet, ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(worker, enumerate(conversations)))
+    elapsed = time.perf_counter() - start
+
+    final = memory_sample(total)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = recorder.latencies
+    results = {
+        'requests': total,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'failures': recorder.failures,
+        'statuses': {str(k): v for k, v in sorted(recorder.statuses.items())},
+        'stage_ms': {k: round(v * 1000, 3) for k, v in sorted(stage_means().items())},
+        'sessions': final['sessions'],
+        'store_bytes': final['store_bytes'],
+        'store_bytes_per_session': final['store_bytes'] // max(1, final['sessions']),
+        'rss_growth_kb': rss_after - rss_before,
+        'memory_samples': [baseline] + recorder.samples,
+        'upstream_calls': sum(fake.model.calls for fake in fakes),
+        'response_cache': server.response_cache.stats(),
+        'semantic_cache': server.semantic_cache.stats(),
+    }
+    if args.tracemalloc:
+        results['traced_growth_bytes'] = final['traced_bytes'] - baseline['traced_bytes']
+        tracemalloc.stop()
+
+    print(f"{total} requests over {args.sessions} sessions x {args.turns} turns, "
+          f"concurrency {args.concurrency}")
+    print(f"  rps {results['rps']}   p50 {results['p50_ms']} ms   p95 {results['p95_ms']} ms   "
+          f"p99 {results['p99_ms']} ms   failures {results['failures']}   statuses {results['statuses']}")
+    print(f"  upstream calls {results['upstream_calls']}   "
+          f"cache hit rate {results['response_cache']['hit_rate']}")
+    print("  stage means: " + '   '.join(f"{k} {v} ms" for k, v in results['stage_ms'].items()))
+    print(f"  chat_contexts: {results['sessions']} sessions, {results['store_bytes']} bytes "
+          f"({results['store_bytes_per_session']} per session), max RSS +{results['rss_growth_kb']} KB"
+          + (f", traced heap +{results['traced_growth_bytes']} bytes" if args.tracemalloc else ''))
+    print(f"  {'requests':>9} {'sessions':>9} {'store bytes':>12}")
+    for sample in results['memory_samples']:
+        print(f"  {sample['requests']:>9} {sample['sessions']:>9} {sample['store_bytes']:>12}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Stress test for per-session ordering under concurrent /api/chat traffic.
+
+Several client threads share each session and fire messages at it at the
+same time. Afterwards every session's history is checked:
+
+  lost    a successful message is missing from the history (or duplicated)
+  order   one client's messages are stored out of the order it sent them
+  stale   a reply was generated without seeing the turn stored before it
+
+The fake model echoes the last history turn it saw in its prompt, which
+is how stale reads are detected.
+
+    python benchmarks/stress_sessions.py [--sessions N] [--clients C] [--messages M]
+    python benchmarks/stress_sessions.py --policy off     # no sequencing, to compare
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('GEMINI_API_KEY', 'offline-stress-test')
+for name, value in (('GEMINI_RPM', '1000000'), ('GEMINI_BURST', '100000'),
+                    ('SESSION_RPM', '1000000'), ('SESSION_BURST', '100000'),
+                    ('RATE_LIMIT_MAX_QUEUE', '100000'),
+                    # Summary calls would reach the echo model and change the prompt layout
+                    ('SUMMARY_ENABLED', '0')):
+    os.environ.setdefault(name, value)
+
+import server  # noqa: E402
+from fake_gemini import FakeChunk  # noqa: E402
+from prompt_builder import CURRENT_MESSAGE, HISTORY_PREFIX  # noqa: E402
+from session_sequencer import SessionSequencer  # noqa: E402
+from upstream import UpstreamClient, UpstreamPool  # noqa: E402
+
+
+class EchoHistoryModel:
+    """Replies with a marker naming the last history turn present in the prompt"""
+
+    def __init__(self, latency_ms, seed):
+        self.latency_ms = latency_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        seen = ''
+        if prompt.startswith(HISTORY_PREFIX):
+            history = prompt[len(HISTORY_PREFIX):prompt.index(CURRENT_MESSAGE)]
+            users = [line[len('User: '):] for line in history.split('\n') if line.startswith('User: ')]
+            seen = users[-1] if users else ''
+        with self._lock:
+            latency = self._random.uniform(0.2, 1.8) * self.latency_ms / 1000
+        time.sleep(latency)
+        return FakeChunk(f"theek hai [seen:{seen}]")
+
+
+class Unsequenced:
+    """Stand-in sequencer that lets every request through (the old behaviour)"""
+
+    policy = 'off'
+
+    def run(self, session_id, message, func):
+        return func()
+
+    def acquire(self, session_id):
+        pass
+
+    def release(self, session_id, result=None, error=None):
+        pass
+
+    def stats(self):
+        return {'policy': self.policy}
+
+
+def client(session_id, client_id, messages, statuses, sent, lock):
+    http = server.app.test_client()
+    for n in range(messages):
+        message = f"{session_id}-c{client_id}-m{n}"
+        response = http.post('/api/chat', json={'message': message, 'session_id': session_id})
+        body = response.get_json(silent=True) or {}
+        with lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200 and body.get('success'):
+                sent.append((session_id, client_id, n, message))
+
+
+def check(sent):
+    """Return (lost, order, stale) violation counts"""
+    lost = order = stale = 0
+    expected = {}
+    for session_id, client_id, n, message in sent:
+        expected.setdefault(session_id, []).append((client_id, n, message))
+
+    for session_id, messages in expected.items():
+        context = server.chat_contexts.get(session_id)
+        history = context.history if context else []
+        stored = [turn.user for turn in history]
+        positions = {user: i for i, user in enumerate(stored)}
+
+        lost += len(set(m for _, _, m in messages) - set(stored)) + (len(stored) - len(set(stored)))
+
+        last_position = {}
+        for client_id, n, message in sorted(messages):
+            position = positions.get(message)
+            if position is None:
+                continue
+            if position < last_position.get(client_id, -1):
+                order += 1
+            last_position[client_id] = position
+
+        for i, turn in enumerate(history):
+            previous = history[i - 1].user if i else ''
+            if f"[seen:{previous}]" not in turn.bot:
+                stale += 1
+    return lost, order, stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients per session')
+    parser.add_argument('--messages', type=int, default=10, help='messages per client')
+    parser.add_argument('--latency-ms', type=float, default=10)
+    parser.add_argument('--policy', choices=('queue', 'reject', 'coalesce', 'off'), default='queue')
+    parser.add_argument('--verbose', action='store_true', help='keep server log output')
+    args = parser.parse_args()
+
+    server.upstream = UpstreamPool([UpstreamClient('echo', EchoHistoryModel(args.latency_ms, 0))],
+                                   scheduler=server.scheduler)
+    server.chat_contexts.history_limit = args.clients * args.messages + 1
+    server.prompt_builder.max_turns = 1
+    if args.policy == 'off':
+        server.session_sequencer = Unsequenced()
+    else:
+        server.session_sequencer = SessionSequencer(policy=args.policy, max_wait=60,
+                                                    max_queue=args.clients)
+
+    statuses, sent, lock = {}, [], threading.Lock()
+    threads = [
+        threading.Thread(target=client, args=(f"stress-{s}", c, args.messages, statuses, sent, lock))
+        for s in range(args.sessions)
+        for c in range(args.clients)
+    ]
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with quiet:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    lost, order, stale = check(sent)
+    total = args.sessions * args.clients * args.messages
+    print(f"policy {args.policy}: {total} messages, {args.sessions} sessions x {args.clients} clients "
+          f"in {elapsed:.2f}s")
+    print(f"  statuses {dict(sorted(statuses.items()))}   stored turns {len(sent)}")
+    print(f"  lost {lost}   out of order {order}   stale prompts {stale}")
+    print(f"  sequencer {server.session_sequencer.stats()}")
+    sys.exit(1 if lost or order or stale else 0)
+
+
+if __name__ == '__main__':
+    main()
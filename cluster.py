@@ -0,0 +1,118 @@
+"""
+Cluster mode: several ThapluBot nodes serving the same sessions.
+
+Shared state lives in one SQLite file (CLUSTER_DB): sessions in a
+versioned table (see SharedSQLiteSessions in session_store.py) and rate
+limit buckets (the scheduler's SQLite backend). Each node checks a
+session's version on every request and reloads the record only when
+another node has written a newer one, so any node can serve any session.
+
+The SQLite file runs in WAL mode, whose shared-memory index only works
+between processes on one machine. CLUSTER_DB is therefore for nodes on a
+single host (or a test stand-in for a real cluster): never put it on a
+network filesystem shared by several hosts, where updates can be lost or
+the file corrupted. Spanning hosts needs another shared backend. Anything
+with `shared = True` and the version / load / save (raising StaleSession
+on a version mismatch) / delete methods of SharedSQLiteSessions can
+stand in, e.g. one backed by Redis.
+
+Routing every message of a session to the same node keeps those local
+copies warm. HashRing maps session ids to nodes with consistent hashing,
+so adding or removing a node only moves about 1/N of the sessions. A load
+balancer or client can ask GET /api/cluster?session_id=... for the owner.
+"""
+import hashlib
+import os
+import socket
+from bisect import bisect
+
+DEFAULT_VNODES = 128
+
+
+def ring_hash(key):
+    """Stable 64-bit hash (the same on every node and every run)"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash ring of node ids with virtual nodes"""
+
+    def __init__(self, nodes=(), vnodes=DEFAULT_VNODES):
+        self.vnodes = vnodes
+        self.nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def _rebuild(self):
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def add(self, node):
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._rebuild()
+
+    def remove(self, node):
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._rebuild()
+
+    def node_for(self, key):
+        """Node that owns a key, or None for an empty ring"""
+        if not self._points:
+            return None
+        i = bisect(self._points, ring_hash(key)) % len(self._points)
+        return self._owners[i]
+
+
+class Cluster:
+    """This node's identity and view of the ring"""
+
+    def __init__(self, node_id, nodes=None, urls=None, vnodes=DEFAULT_VNODES):
+        self.node_id = node_id
+        # node id -> base URL, for redirects by a router
+        self.urls = dict(urls or {})
+        self.ring = HashRing(nodes or [node_id], vnodes)
+
+    def owner(self, session_id):
+        """Node id that should serve a session"""
+        return self.ring.node_for(session_id)
+
+    def is_local(self, session_id):
+        return self.owner(session_id) == self.node_id
+
+    def route(self, session_id):
+        """Routing answer for a session"""
+        owner = self.owner(session_id)
+        return {'session_id': session_id, 'node': owner, 'url': self.urls.get(owner), 'local': owner == self.node_id}
+
+    def stats(self):
+        return {'node_id': self.node_id, 'nodes': list(self.ring.nodes), 'urls': self.urls,
+                'vnodes': self.ring.vnodes}
+
+
+def parse_nodes(value):
+    """(node ids, {node id: url}) from 'a=http://10.0.0.1:5001,b=http://10.0.0.2:5001' or 'a,b'"""
+    nodes, urls = [], {}
+    for part in (value or '').split(','):
+        node, _, url = part.strip().partition('=')
+        if node:
+            nodes.append(node)
+            if url:
+                urls[node] = url
+    return nodes, urls
+
+
+def cluster_from_env():
+    """Build this node's cluster view, or None unless CLUSTER_DB is set"""
+    if not os.getenv('CLUSTER_DB'):
+        return None
+    node_id = os.getenv('NODE_ID') or socket.gethostname()
+    nodes, urls = parse_nodes(os.getenv('CLUSTER_NODES'))
+    if nodes and node_id not in nodes:
+        # Every node must see the same ring, so do not add ourselves silently
+        print(f"⚠️ NODE_ID {node_id} is not listed in CLUSTER_NODES - no sessions will route here")
+    return Cluster(node_id, nodes, urls, vnodes=int(os.getenv('CLUSTER_VNODES', str(DEFAULT_VNODES))))
@@ -0,0 +1,112 @@
+"""
+Negotiated response compression.
+
+Picks brotli (if the brotli package is installed) or gzip from the
+client's Accept-Encoding, and only compresses complete text/JSON bodies
+above a size threshold; small bodies are cheaper to send as they are and
+streamed responses (SSE, NDJSON) are never buffered.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class Compressor:
+    """Chooses and applies a content coding for a response body"""
+
+    def __init__(self, min_size=1024, gzip_level=5, brotli_quality=4):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def negotiate(self, accept_encoding):
+        """Best supported coding the client accepts, or None"""
+        if self.min_size < 0:
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get('*', 0.0)
+        best, best_q = None, 0.0
+        # Server preference order breaks ties
+        for encoding in self.encodings:
+            q = accepted.get(encoding, wildcard)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def eligible(self, mimetype, size):
+        return size >= self.min_size and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            data = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            data = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        self.compressed += 1
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        return data
+
+    def stats(self):
+        return {
+            'encodings': list(self.encodings),
+            'min_size': self.min_size,
+            'compressed': self.compressed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None
+        }
+
+    def compress_response(self, response, accept_encoding):
+        """Compress a complete Flask response in place if worthwhile"""
+        if (response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers or response.status_code < 200):
+            return response
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if not self.eligible(response.mimetype or '', len(body)):
+            return response
+        response.set_data(self.compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def compressor_from_env():
+    """Build the compressor from environment variables (COMPRESS_MIN_SIZE=-1 disables)"""
+    return Compressor(
+        min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+        gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '5')),
+        brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '4')),
+    )
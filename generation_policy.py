@@ -0,0 +1,171 @@
+"""
+Adaptive generation settings per request.
+
+A "hi" does not need the same 4096-token budget as "how do I talk to my
+parents about this?". The selector picks an output cap (and optionally a
+faster model tier) from the detected sentiment, the message length and
+the history depth; smaller caps mean shorter generations and lower cost.
+Latency and output size are tracked per policy so caps can be tuned.
+
+GENERATION_POLICY=fixed turns this off (every request gets the full cap).
+
+The small caps only apply when a fast tier is configured
+(GEMINI_FAST_MODELS). On gemini-2.5-flash thinking tokens count toward
+max_output_tokens, so a low cap can end a reply before any text; without
+a fast tier every policy keeps the full cap unless GENERATION_MAX_TOKENS
+sets one explicitly. A reply that still comes back empty is retried once
+under the full policy (see escalate).
+"""
+import os
+import threading
+from collections import deque
+
+from prompt_builder import estimate_tokens
+
+# Model tiers understood by the upstream pool
+DEFAULT_TIER = 'default'
+FAST_TIER = 'fast'
+
+MODE_ADAPTIVE = 'adaptive'
+MODE_FIXED = 'fixed'
+
+
+class GenerationPolicy:
+    """Output cap and model tier for one class of request"""
+
+    __slots__ = ('name', 'max_output_tokens', 'tier', 'kwargs')
+
+    def __init__(self, name, max_output_tokens, tier=DEFAULT_TIER):
+        self.name = name
+        self.max_output_tokens = max_output_tokens
+        self.tier = tier
+        # Passed straight to UpstreamPool.generate / stream
+        self.kwargs = {'generation_config': {'max_output_tokens': max_output_tokens}, 'tier': tier}
+
+
+def fast_tier_configured():
+    """Whether the upstream pool has fast-tier models (GEMINI_FAST_MODELS)"""
+    return bool(os.getenv('GEMINI_FAST_MODELS', '').strip())
+
+
+def default_policies():
+    return {
+        'short': GenerationPolicy('short', 256, FAST_TIER),
+        'casual': GenerationPolicy('casual', 1024, FAST_TIER),
+        'extended': GenerationPolicy('extended', 2048),
+        'full': GenerationPolicy('full', 4096),
+    }
+
+
+class _PolicyStats:
+    __slots__ = ('requests', 'seconds', 'output_tokens', 'near_cap', 'truncated', 'latencies')
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.output_tokens = 0
+        self.near_cap = 0
+        # Replies cut off by the cap before any text
+        self.truncated = 0
+        self.latencies = deque(maxlen=256)
+
+
+class GenerationPolicySelector:
+    """Chooses a GenerationPolicy per request and keeps per-policy stats"""
+
+    def __init__(self, policies=None, mode=MODE_ADAPTIVE, short_message_chars=40,
+                 long_message_chars=280, deep_history_turns=6):
+        self.policies = policies or default_policies()
+        self.mode = mode
+        self.short_message_chars = short_message_chars
+        self.long_message_chars = long_message_chars
+        self.deep_history_turns = deep_history_turns
+        self._stats = {name: _PolicyStats() for name in self.policies}
+        self._lock = threading.Lock()
+
+    def select(self, sentiment, message, history_depth):
+        """Policy for a request"""
+        policies = self.policies
+        if self.mode == MODE_FIXED:
+            return policies['full']
+
+        # Questions and long messages deserve a full answer
+        if sentiment == 'seeking_help' or len(message) >= self.long_message_chars:
+            return policies['full']
+        # Someone who is struggling gets room for a proper reply
+        if sentiment == 'negative' or history_depth >= self.deep_history_turns:
+            return policies['extended']
+        if sentiment == 'greeting' and len(message) < self.short_message_chars:
+            return policies['short']
+        return policies['casual']
+
+    def escalate(self, policy):
+        """Policy to retry with after `policy` returned no text, or None if it already had the full cap"""
+        with self._lock:
+            self._stats[policy.name].truncated += 1
+        full = self.policies['full']
+        return None if policy.max_output_tokens >= full.max_output_tokens else full
+
+    def record(self, policy, seconds, text):
+        """Account one completed upstream generation made under a policy"""
+        tokens = estimate_tokens(text)
+        with self._lock:
+            stats = self._stats[policy.name]
+            stats.requests += 1
+            stats.seconds += seconds
+            stats.latencies.append(seconds)
+            stats.output_tokens += tokens
+            if tokens >= 0.9 * policy.max_output_tokens:
+                stats.near_cap += 1
+
+    def stats(self):
+        """Per-policy counters"""
+        result = {}
+        with self._lock:
+            for name, stats in self._stats.items():
+                policy = self.policies[name]
+                requests = stats.requests
+                latencies = sorted(stats.latencies)
+                result[name] = {
+                    'max_output_tokens': policy.max_output_tokens,
+                    'tier': policy.tier,
+                    'requests': requests,
+                    'avg_ms': round(stats.seconds / requests * 1000, 1) if requests else None,
+                    'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+                    'avg_output_tokens': round(stats.output_tokens / requests, 1) if requests else None,
+                    'output_tokens': stats.output_tokens,
+                    'near_cap': stats.near_cap,
+                    'truncated': stats.truncated
+                }
+        return {'mode': self.mode, 'policies': result}
+
+
+def parse_caps(value):
+    """{'short': 256, ...} from 'short=256,casual=1024'"""
+    caps = {}
+    for part in (value or '').split(','):
+        name, _, cap = part.partition('=')
+        if name.strip() and cap.strip():
+            caps[name.strip()] = int(cap)
+    return caps
+
+
+def generation_policy_from_env():
+    """Build the policy selector from environment variables"""
+    policies = default_policies()
+    caps = parse_caps(os.getenv('GENERATION_MAX_TOKENS'))
+    if 'full' in caps:
+        policies['full'] = GenerationPolicy('full', caps['full'])
+    if not fast_tier_configured() or os.getenv('GENERATION_FAST_TIER', '1') in ('0', 'false', 'no'):
+        # No small model to send short replies to: keep the thinking budget of the full cap
+        full_cap = policies['full'].max_output_tokens
+        policies = {name: GenerationPolicy(name, full_cap) for name in policies}
+    for name, cap in caps.items():
+        if name in policies:
+            policies[name] = GenerationPolicy(name, cap, policies[name].tier)
+    return GenerationPolicySelector(
+        policies,
+        mode=os.getenv('GENERATION_POLICY', MODE_ADAPTIVE),
+        long_message_chars=int(os.getenv('GENERATION_LONG_MESSAGE_CHARS', '280')),
+        deep_history_turns=int(os.getenv('GENERATION_DEEP_HISTORY_TURNS', '6')),
+    )
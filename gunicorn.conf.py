@@ -0,0 +1,49 @@
+"""
+Gunicorn settings for ThapluBot.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi_app:app
+
+Chat requests spend almost all their time waiting on Gemini, so the
+default is a few processes with many threads each. Every knob can be
+overridden from the environment (see .env.example).
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+
+# Processes x threads; threads are cheap for I/O-bound generations
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count(), 4))))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Keep idle client connections open a little longer than a typical proxy
+# would, and long enough for mobile clients sending follow-up messages
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '15'))
+
+# Long generations and SSE streams are normal; a wedged worker is not
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# On SIGTERM stop accepting and let in-flight generations finish
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '90'))
+
+# Build the app once before forking; workers recreate per-process state
+# (gRPC clients, SQLite connections, writer threads) via os.register_at_fork
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'no')
+
+# Recycle workers occasionally to bound fragmentation (0 = never)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    import server as app_server
+    app_server.warm_worker()
+
+
+def worker_exit(server, worker):
+    import server as app_server
+    app_server.shutdown()
@@ -0,0 +1,64 @@
+"""
+Fast JSON encoding for API responses.
+
+Uses orjson when it is installed (several times faster than the stdlib on
+big history and listing payloads, and it writes bytes directly into the
+response) and falls back to Flask's stdlib provider otherwise. dumps() is
+shared with the SSE / NDJSON streams and the ASGI routes so every path
+uses the same encoder.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+_default = DefaultJSONProvider.default
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON text"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps_bytes(obj):
+    """Compact JSON as UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return dumps(obj).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for stdlib-only options (cls, indent=4, ...) get the stdlib
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option), mimetype=self.mimetype
+        )
+
+
+def install(app):
+    """Use the fast provider on a Flask app when orjson is available"""
+    if orjson is not None:
+        app.json = FastJSONProvider(app)
+    return type(app.json).__name__
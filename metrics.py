@@ -0,0 +1,293 @@
+"""
+Prometheus-style metrics with a cheap hot path.
+
+Every thread records into its own shard (a plain dict only that thread
+writes to), so counting and observing take no locks. Shards are summed
+when /api/metrics is scraped. Values that other components already
+track (cache hits, session counts, ...) are read through callbacks at
+scrape time instead of being duplicated.
+
+Bind labels once with .labels(...) and keep the child around; calling
+.inc() / .observe() on it is a couple of dict operations.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond CPU stages to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Shards:
+    """Per-thread dicts, each written by exactly one thread
+
+    A thread-per-request server (e.g. the app.run dev server) starts a
+    thread for every request, so the shards of threads that have exited
+    are folded into one base dict with `merge` (on scrape and every
+    FOLD_EVERY new shards) instead of being kept forever.
+    """
+
+    FOLD_EVERY = 256
+
+    def __init__(self, merge):
+        self._merge = merge
+        self._local = threading.local()
+        # [(owning thread, shard)]
+        self._all = []
+        self._base = {}
+        self._lock = threading.Lock()
+        self._new = 0
+
+    def mine(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:
+                self._all.append((threading.current_thread(), shard))
+                self._new += 1
+                if self._new >= self.FOLD_EVERY:
+                    self._fold()
+            self._local.shard = shard
+            return shard
+
+    def _fold(self):
+        """Merge shards of exited threads into the base (lock held); a dead thread writes no more"""
+        self._new = 0
+        live = []
+        for thread, shard in self._all:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for key, value in shard.items():
+                    self._merge(self._base, key, value)
+        self._all = live
+
+    def snapshots(self):
+        with self._lock:
+            self._fold()
+            # merge replaces base values instead of mutating them, so a shallow copy is stable
+            shards = [self._base.copy()]
+            live = [shard for _, shard in self._all]
+        # dict.copy / list() run without releasing the GIL, so each copy is consistent
+        return shards + [shard.copy() for shard in live]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(self._merge)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child bound to these label values (cached)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child(tuple(str(v) for v in values)))
+        return child
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _CounterChild:
+    __slots__ = ('_shards', '_key')
+
+    def __init__(self, metric, key):
+        self._shards = metric._shards
+        self._key = key
+
+    def inc(self, amount=1):
+        shard = self._shards.mine()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+
+    kind = 'counter'
+
+    def _child(self, key):
+        return _CounterChild(self, key)
+
+    @staticmethod
+    def _merge(base, key, value):
+        base[key] = base.get(key, 0) + value
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def values(self):
+        totals = {}
+        for shard in self._shards.snapshots():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ('_shards', '_key', '_bounds', '_size')
+
+    def __init__(self, metric, key):
+        self._shards = metric._shards
+        self._key = key
+        self._bounds = metric.buckets
+        # one cell per bucket, +Inf, then sum and count
+        self._size = len(metric.buckets) + 3
+
+    def observe(self, value):
+        shard = self._shards.mine()
+        cell = shard.get(self._key)
+        if cell is None:
+            cell = shard[self._key] = [0] * self._size
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager that observes its elapsed time"""
+
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self, key):
+        return _HistogramChild(self, key)
+
+    @staticmethod
+    def _merge(base, key, cell):
+        total = base.get(key)
+        base[key] = list(cell) if total is None else [a + b for a, b in zip(total, cell)]
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def values(self):
+        totals = {}
+        for shard in self._shards.snapshots():
+            for key, cell in shard.items():
+                cell = list(cell)
+                total = totals.get(key)
+                totals[key] = cell if total is None else [a + b for a, b in zip(total, cell)]
+        return totals
+
+    def render(self):
+        lines = self.header()
+        bounds = self.buckets + (float('inf'),)
+        for key, cell in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(cell[-2])}")
+            lines.append(f"{self.name}_count{labels} {cell[-1]}")
+        return lines
+
+
+class Callback:
+    """Metric whose value(s) are read from a function at scrape time.
+
+    The function returns a number, or a dict of {label values tuple: number}.
+    """
+
+    def __init__(self, name, documentation, func, labelnames=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        value = self.func()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for key, v in sorted(items):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders the text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, func, labelnames=(), kind='gauge'):
+        return self.register(Callback(name, documentation, func, labelnames, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,191 @@
+"""
+Prompt building for Gemini requests.
+
+The static system prompt and the fixed parts of the template are built
+once at import. Each history turn is rendered to its prompt segment once
+and cached on the Turn, so a request only joins cached strings. History
+is trimmed from the oldest turn to fit a token budget, using a local
+estimate of ~4 characters per token. Older turns of long sessions arrive
+as a rolling summary, which is placed ahead of the recent turns.
+"""
+import os
+
+# Enhanced Thaplu personality prompt with emotional intelligence
+SYSTEM_PROMPT = """You are Thaplu, a deeply caring, emotionally intelligent friend with a fun personality. You understand context and emotions, and respond accordingly.
+
+CORE PERSONALITY:
+- You're caring, empathetic, and emotionally aware
+- You balance being fun with being genuinely supportive
+- You understand when to be serious and when to be playful
+- You're logical, reasonable, and give thoughtful advice
+- You use emojis naturally but not excessively (2-4 per response)
+- You mix Hindi and English naturally (Hinglish style)
+
+EMOTIONAL INTELLIGENCE (MOST IMPORTANT):
+**When friend is struggling/negative/upset:**
+- Be deeply empathetic and supportive first
+- Listen and validate their feelings
+- Give logical, practical advice with compassion
+- Be motivational but realistic
+- Use comforting emojis: 💙 🤗 💪 ✨
+- DON'T make jokes or talk about food - focus on helping
+- Show you genuinely care and understand
+
+**When friend is happy/positive/celebrating:**
+- Share their joy enthusiastically!
+- Be celebratory and encouraging
+- Use happy emojis: 🎉 😁 🌟 ✨
+- You can be more playful here
+- Acknowledge their achievement sincerely
+
+**When friend is seeking help/advice:**
+- Be thoughtful and logical
+- Give detailed, practical solutions
+- Break down complex problems
+- Be encouraging but honest
+- Mix wisdom with your caring nature
+
+**For casual chat:**
+- Be fun and friendly
+- Keep it light and engaging
+- You can mention food occasionally (but not every time!)
+- Use your playful side naturally
+
+SPEAKING STYLE:
+- Use reactions: "Arre yaar", "Dekh", "Sunle", "Oho", "Acha"
+- Mix Hindi-English naturally, don't force it
+- Be conversational, like talking to a close friend
+- Casual slang: "Oye", "Chal", "Bhai", "Yaar"
+- When serious: be clear, logical, and compassionate
+
+FOOD & FUN REFERENCES (Use Sparingly!):
+- Only bring up food when context fits or mood is light
+- "Kitkat" or "sushi" mentions: MAX once per conversation or when truly relevant
+- These are your quirks, not your entire personality
+- Don't shoehorn food references into serious conversations
+
+MARKDOWN FORMATTING:
+**Use formatting based on need:**
+- Casual chat: Minimal formatting, natural flow
+- Serious advice/help: Use headings, lists, bold for clarity
+  - **Bold** for key points
+  - Lists for steps or options
+  - Headers for organization
+- Code: Use code blocks when relevant
+- Don't over-format casual responses
+
+HOW TO RESPOND BASED ON CONTEXT:
+
+1. **Friend is sad/struggling:**
+   "Arre yaar, I can see tu upset hai 💙 Dekh, it's okay to feel like this. [Validate their feeling]. [Practical advice]. Mai hoon na tera saath mein, we'll figure this out together 🤗 Tu strong hai, yaad rakh."
+
+2. **Friend is happy/celebrating:**
+   "Yesss! 🎉 Bahut badhiya yaar! I'm so proud of you! [Acknowledge achievement]. Aise hi chalta reh! ✨ Tu deserve karta hai yeh happiness 😁"
+
+3. **Friend needs advice:**
+   "Dekh, aise kar - [Step by step logical advice]. [Reasoning]. Trust me, yeh kaam karega. Aur agar koi problem aaye, batana, mai help karungi 💪"
+
+4. **Casual fun chat:**
+   "Oho🙂 kya baat hai! [Response]. [Natural conversation]. Chal movie dekhne chalte hai kabhi 😁"
+
+CRITICAL RULES:
+- READ THE EMOTIONAL CONTEXT - it's the most important thing
+- Serious problems need serious, thoughtful responses
+- Don't dilute empathy with excessive playfulness
+- Food references are occasional treats, not mandatory
+- Be the friend they need in that moment
+- Quality over quirkiness - be genuinely helpful
+- Use emojis to enhance, not replace, emotional depth
+- Give DETAILED responses when needed - explain properly
+
+Remember: You're Thaplu - caring, smart, fun, and emotionally aware. Your friend's wellbeing comes first. Be the supportive friend who knows when to be serious and when to be silly."""
+
+# Sentiment guidance appended to the user's message
+SENTIMENT_GUIDANCE = {
+    'negative': "\n[ALERT: User seems upset/struggling. Be empathetic, supportive, and helpful. Focus on comfort and practical advice.]",
+    'positive': "\n[CONTEXT: User seems happy/positive. Share their joy and be encouraging!]",
+    'seeking_help': "\n[CONTEXT: User is seeking help/advice. Be logical, detailed, and supportive.]",
+}
+
+HISTORY_PREFIX = SYSTEM_PROMPT + "\n\nPrevious conversation:\n"
+SUMMARY_PREFIX = SYSTEM_PROMPT + "\n\nSummary of the earlier conversation:\n"
+SUMMARY_HISTORY = "\n\nPrevious conversation:\n"
+CURRENT_MESSAGE = "\n\nCurrent message: "
+FIRST_MESSAGE_PREFIX = SYSTEM_PROMPT + "\n\nMessage: "
+RESPOND_SUFFIX = "\n\nRespond as Thaplu (context-aware, emotionally intelligent):"
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate (~4 characters per token)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptBuilder:
+    """Assembles prompts from precompiled parts and cached history segments"""
+
+    def __init__(self, max_turns=5, history_token_budget=2000):
+        self.max_turns = max_turns
+        self.history_token_budget = history_token_budget
+        self.system_tokens = estimate_tokens(SYSTEM_PROMPT)
+        self.prompts_built = 0
+        self.turns_trimmed = 0
+
+    @staticmethod
+    def segment(turn):
+        """Rendered prompt segment and token estimate for a turn (cached)"""
+        if turn.segment is None:
+            text = f"User: {turn.user}\nThaplu: {turn.bot}"
+            turn.segment = (text, estimate_tokens(text))
+        return turn.segment
+
+    def render_history(self, history):
+        """Newest turns that fit the turn and token budgets, oldest first"""
+        segments = []
+        budget = self.history_token_budget
+        recent = history[-self.max_turns:] if self.max_turns else []
+        for turn in reversed(recent):
+            text, tokens = self.segment(turn)
+            if tokens > budget:
+                if not segments and budget > 0:
+                    # The newest turn alone is over budget: keep its head
+                    segments.append(text[:budget * CHARS_PER_TOKEN] + " …")
+                break
+            segments.append(text)
+            budget -= tokens
+        self.turns_trimmed += len(recent) - len(segments)
+        segments.reverse()
+        return "\n".join(segments)
+
+    def build(self, user_message, history, sentiment, summary=None):
+        """Build the full prompt for a message (summary covers turns before `history`)"""
+        guidance = SENTIMENT_GUIDANCE.get(sentiment, "")
+        history_text = self.render_history(history) if history else ""
+        self.prompts_built += 1
+
+        if summary:
+            return "".join((SUMMARY_PREFIX, summary, SUMMARY_HISTORY, history_text, CURRENT_MESSAGE,
+                            user_message, guidance, RESPOND_SUFFIX))
+        if history_text:
+            return "".join((HISTORY_PREFIX, history_text, CURRENT_MESSAGE,
+                            user_message, guidance, RESPOND_SUFFIX))
+        return "".join((FIRST_MESSAGE_PREFIX, user_message, guidance, RESPOND_SUFFIX))
+
+    def stats(self):
+        """Builder counters"""
+        return {
+            'max_turns': self.max_turns,
+            'history_token_budget': self.history_token_budget,
+            'system_tokens': self.system_tokens,
+            'prompts_built': self.prompts_built,
+            'turns_trimmed': self.turns_trimmed
+        }
+
+
+def prompt_builder_from_env():
+    """Build the prompt builder from environment variables"""
+    return PromptBuilder(
+        max_turns=int(os.getenv('PROMPT_HISTORY_TURNS', '5')),
+        history_token_budget=int(os.getenv('PROMPT_HISTORY_TOKENS', '2000')),
+    )
@@ -0,0 +1,308 @@
+"""
+Admission scheduler for upstream Gemini calls.
+
+Every request takes one token from the bucket of the upstream API key it
+will use and one from the bucket of its chat session. Requests that have
+to wait join a bounded queue with a deadline; when the queue is full, or
+the wait would overshoot the deadline, they are rejected straight away
+with a Retry-After hint instead of holding a worker thread.
+
+Buckets live in process memory by default. Point RATE_LIMIT_DB at a
+SQLite file to share one budget between several gunicorn workers.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted in time"""
+
+    def __init__(self, retry_after, reason='rate_limited'):
+        super().__init__(f"Rate limit exceeded ({reason}), retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _refill(tokens, updated, now, rate, capacity):
+    """Return the token count of a bucket after refilling it up to now"""
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class LocalBucketBackend:
+    """In-process token buckets"""
+
+    PRUNE_EVERY = 1024
+    # take() never blocks on I/O
+    blocking = False
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def take(self, specs):
+        """Take one token from every bucket in specs, or none of them.
+
+        specs is a list of (name, rate, capacity). Returns 0 when the tokens
+        were taken, otherwise the seconds until all buckets have one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for name, rate, capacity in specs:
+                tokens, updated = self._buckets.get(name, (capacity, now))
+                tokens = _refill(tokens, updated, now, rate, capacity)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+
+            for (name, _, _), tokens in zip(specs, levels):
+                self._buckets[name] = (tokens - 1 if not wait else tokens, now)
+
+            self._ops += 1
+            if self._ops % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            return wait
+
+    def available(self, name, rate, capacity):
+        """Tokens currently available in a bucket"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(name, (capacity, now))
+            return _refill(tokens, updated, now, rate, capacity)
+
+    def _prune(self, now):
+        """Drop buckets that have been idle long enough to be full again"""
+        # Buckets idle this long have refilled, and a full bucket is the same as a missing one
+        idle = [name for name, (tokens, updated) in self._buckets.items()
+                if now - updated > 600]
+        for name in idle:
+            del self._buckets[name]
+
+
+class SQLiteBucketBackend:
+    """Token buckets shared between processes through a SQLite file"""
+
+    # take() may wait on the database lock, so async callers run it on a thread
+    blocking = True
+    # Idle buckets are full again, and a full bucket is the same as a missing one
+    IDLE_SECONDS = 600
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._pruned_at = time.time()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets '
+            '(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def after_fork(self):
+        # Connections are per process: a forked worker opens its own
+        self._local = threading.local()
+
+    def take(self, specs):
+        """Take one token from every bucket in specs, or none of them"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            wait = 0.0
+            for name, rate, capacity in specs:
+                row = conn.execute(
+                    'SELECT tokens, updated FROM buckets WHERE name = ?', (name,)
+                ).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = _refill(tokens, updated, now, rate, capacity)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+
+            if not wait:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                    [(name, tokens - 1, now) for (name, _, _), tokens in zip(specs, levels)]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if now - self._pruned_at >= self.PRUNE_INTERVAL:
+            self._prune(now)
+        return wait
+
+    def _prune(self, now):
+        """Delete buckets idle long enough to be full again (one row per session ever seen otherwise)"""
+        self._pruned_at = now
+        try:
+            self._conn().execute('DELETE FROM buckets WHERE updated < ?', (now - self.IDLE_SECONDS,))
+        except sqlite3.OperationalError:
+            # Busy: another process is writing; prune next time
+            pass
+
+    def available(self, name, rate, capacity):
+        """Tokens currently available in a bucket"""
+        row = self._conn().execute(
+            'SELECT tokens, updated FROM buckets WHERE name = ?', (name,)
+        ).fetchone()
+        if not row:
+            return capacity
+        return _refill(row[0], row[1], time.time(), rate, capacity)
+
+
+class AdmissionScheduler:
+    """Per-key and per-session token buckets with a bounded wait queue"""
+
+    def __init__(self, key_rate, key_burst, session_rate, session_burst,
+                 max_queue=64, max_wait=10.0, backend=None):
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.backend = backend or LocalBucketBackend()
+
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def after_fork(self):
+        """Reset per-process state in a forked worker"""
+        self._lock = threading.Lock()
+        self._waiting = 0
+        if hasattr(self.backend, 'after_fork'):
+            self.backend.after_fork()
+
+    @staticmethod
+    def key_id(api_key):
+        """Stable, non-secret bucket name for an API key"""
+        return 'key:' + hashlib.sha256((api_key or '').encode()).hexdigest()[:16]
+
+    def _specs(self, api_key, session_id):
+        specs = []
+        if api_key is not None:
+            specs.append((self.key_id(api_key), self.key_rate, self.key_burst))
+        if session_id is not None:
+            specs.append(('session:' + session_id, self.session_rate, self.session_burst))
+        return specs
+
+    def try_acquire(self, api_key=None, session_id=None):
+        """Take tokens without waiting; return 0 or the seconds to wait"""
+        wait = self.backend.take(self._specs(api_key, session_id))
+        if not wait:
+            self.admitted += 1
+        return wait
+
+    def available(self, api_key):
+        """Tokens left in an API key's bucket"""
+        return self.backend.available(self.key_id(api_key), self.key_rate, self.key_burst)
+
+    def _enter_queue(self, wait, deadline):
+        """Join the wait queue, or reject if it is full or the wait is too long"""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise RateLimitExceeded(wait, 'queue_full')
+            if time.monotonic() + wait > deadline:
+                self.rejected += 1
+                raise RateLimitExceeded(wait, 'deadline')
+            self._waiting += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, api_key=None, session_id=None, timeout=None):
+        """Block until admitted or raise RateLimitExceeded; return seconds waited"""
+        start = time.monotonic()
+        wait = self.try_acquire(api_key, session_id)
+        if not wait:
+            return 0.0
+
+        deadline = start + (self.max_wait if timeout is None else timeout)
+        self._enter_queue(wait, deadline)
+        try:
+            while wait:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    with self._lock:
+                        self.rejected += 1
+                    raise RateLimitExceeded(wait, 'deadline')
+                time.sleep(wait)
+                wait = self.try_acquire(api_key, session_id)
+        finally:
+            self._leave_queue()
+        return time.monotonic() - start
+
+    async def try_acquire_async(self, api_key=None, session_id=None):
+        """try_acquire without blocking the event loop on a shared backend"""
+        if not getattr(self.backend, 'blocking', True):
+            return self.try_acquire(api_key, session_id)
+        return await asyncio.get_running_loop().run_in_executor(None, self.try_acquire, api_key, session_id)
+
+    async def acquire_async(self, api_key=None, session_id=None, timeout=None):
+        """Like acquire, but waits on the event loop instead of a thread"""
+        start = time.monotonic()
+        wait = await self.try_acquire_async(api_key, session_id)
+        if not wait:
+            return 0.0
+
+        deadline = start + (self.max_wait if timeout is None else timeout)
+        self._enter_queue(wait, deadline)
+        try:
+            while wait:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    with self._lock:
+                        self.rejected += 1
+                    raise RateLimitExceeded(wait, 'deadline')
+                await asyncio.sleep(wait)
+                wait = await self.try_acquire_async(api_key, session_id)
+        finally:
+            self._leave_queue()
+        return time.monotonic() - start
+
+    def stats(self):
+        """Scheduler counters"""
+        return {
+            'waiting': self._waiting,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'backend': type(self.backend).__name__,
+        }
+
+
+def scheduler_from_env():
+    """Build the admission scheduler from environment variables"""
+    # Cluster nodes share their budgets through the cluster database by default
+    db_path = os.getenv('RATE_LIMIT_DB') or os.getenv('CLUSTER_DB')
+    backend = SQLiteBucketBackend(db_path) if db_path else LocalBucketBackend()
+    return AdmissionScheduler(
+        key_rate=float(os.getenv('GEMINI_RPM', '60')) / 60,
+        key_burst=float(os.getenv('GEMINI_BURST', '5')),
+        session_rate=float(os.getenv('SESSION_RPM', '20')) / 60,
+        session_burst=float(os.getenv('SESSION_BURST', '3')),
+        max_queue=int(os.getenv('RATE_LIMIT_MAX_QUEUE', '64')),
+        max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', '10')),
+        backend=backend,
+    )
@@ -0,0 +1,120 @@
+"""
+Response cache for repeated prompts.
+
+Keys combine the normalized user message, the sentiment bucket and a hash
+of the recent history window, so "Hi!" and "hi" on a fresh session share
+one upstream answer. Only raw model text is cached; Thaplu flavor is
+still applied per request. Entries expire by TTL and by LRU size.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Cache scopes: which requests may be served from / stored in the cache
+SCOPE_OFF = 'off'
+SCOPE_FIRST_TURN = 'first_turn'
+SCOPE_ALL = 'all'
+
+_NON_WORD = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_message(message):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _SPACES.sub(' ', _NON_WORD.sub(' ', message.lower())).strip()
+
+
+def history_digest(history, window):
+    """Short hash of the last `window` turns ('' for no history)"""
+    if not history:
+        return ''
+    digest = hashlib.blake2b(digest_size=12)
+    for turn in history[-window:]:
+        digest.update(turn.user.encode())
+        digest.update(b'\0')
+        digest.update(turn.bot.encode())
+        digest.update(b'\1')
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of raw model responses"""
+
+    def __init__(self, max_entries=2048, ttl=3600, scope=SCOPE_FIRST_TURN, history_window=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.scope = scope
+        self.history_window = history_window
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, message, sentiment, history):
+        """Cache key for a request, or None if it must not be cached"""
+        if self.scope == SCOPE_OFF or self.max_entries <= 0:
+            return None
+        if self.scope == SCOPE_FIRST_TURN and history:
+            return None
+        normalized = normalize_message(message)
+        if not normalized:
+            return None
+        return (normalized, sentiment, history_digest(history, self.history_window))
+
+    def get(self, key):
+        """Cached response text for a key, or None"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, text):
+        """Store response text for a key"""
+        if key is None or not text:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            'scope': self.scope,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions
+        }
+
+
+def response_cache_from_env():
+    """Build the response cache from environment variables"""
+    return ResponseCache(
+        max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '2048')),
+        ttl=float(os.getenv('RESPONSE_CACHE_TTL', '3600')),
+        scope=os.getenv('RESPONSE_CACHE_SCOPE', SCOPE_FIRST_TURN),
+    )
@@ -0,0 +1,206 @@
+"""
+Semantic response cache for paraphrased messages.
+
+The exact cache only matches messages that normalize to the same text, so
+"hi", "hiii" and "hii!!" each cost an upstream call. This cache embeds a
+message locally as a signed hashed bag of character trigrams and words
+(repeated letters squeezed, so "heyyy" reads as "hey"), no network
+needed, and keeps one NumPy matrix of unit vectors per sentiment. A
+lookup is one matrix-vector product; the best match is served if its
+cosine similarity reaches the threshold.
+
+Like the exact cache it only serves first-turn (or, if configured,
+low-history) messages and only stores raw model text. Entries carry a
+digest of the conversation history, and a lookup only considers entries
+with the same history, so a reply written for one conversation is never
+served to another whose last message merely looks similar. It needs
+numpy, an optional dependency; without it the cache stays disabled.
+"""
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+
+from response_cache import history_digest, normalize_message
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+_REPEATS = re.compile(r'(\w)\1+')
+
+
+def features(message):
+    """Character trigrams and words of a normalized, de-stretched message"""
+    text = _REPEATS.sub(r'\1', normalize_message(message))
+    padded = f" {text} "
+    grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+    grams.extend(text.split())
+    return grams
+
+
+def history_id(history):
+    """64-bit digest of a whole history (0 for a first turn)"""
+    if not history:
+        return 0
+    return int(history_digest(history, len(history))[:16], 16)
+
+
+def embed(message, dim):
+    """Unit-length hashed feature vector for a message, or None if it has no features"""
+    grams = features(message)
+    if not grams:
+        return None
+    hashes = np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint32, count=len(grams))
+    # The top bit picks the sign so colliding features tend to cancel out
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+    vector = np.zeros(dim, dtype=np.float32)
+    np.add.at(vector, hashes % dim, signs)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return None
+    return vector / norm
+
+
+class _Index:
+    """Fixed-capacity matrix of vectors with their cached texts"""
+
+    def __init__(self, capacity, dim):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.histories = np.zeros(capacity, dtype=np.uint64)
+        self.stored_at = np.zeros(capacity, dtype=np.float64)
+        self.used_at = np.zeros(capacity, dtype=np.float64)
+        self.texts = [None] * capacity
+        self.size = 0
+
+    def search(self, vector, history):
+        """(slot, similarity) of the nearest stored vector with the same history"""
+        scores = self.vectors[:self.size] @ vector
+        scores[self.histories[:self.size] != np.uint64(history)] = -1.0
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def free_slot(self):
+        """Next empty slot, or the least recently used one"""
+        if self.size < len(self.texts):
+            self.size += 1
+            return self.size - 1
+        return int(np.argmin(self.used_at))
+
+    def drop(self, slot):
+        self.vectors[slot] = 0.0
+        self.used_at[slot] = 0.0
+        self.texts[slot] = None
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of raw model responses, one index per sentiment"""
+
+    def __init__(self, threshold=0.9, max_entries=1024, ttl=3600, dim=512, max_history=0, enabled=True):
+        self.enabled = enabled and np is not None
+        self.threshold = threshold
+        # Per sentiment
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.dim = dim
+        self.max_history = max_history
+
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = deque(maxlen=1024)
+
+    def key(self, message, sentiment, history):
+        """(sentiment, history digest, vector) for a request, or None if it must not be cached"""
+        if not self.enabled or self.max_entries <= 0 or len(history) > self.max_history:
+            return None
+        vector = embed(message, self.dim)
+        return None if vector is None else (sentiment, history_id(history), vector)
+
+    def get(self, key):
+        """Cached response text for the closest stored message, or None"""
+        if key is None:
+            return None
+        start = time.perf_counter()
+        sentiment, history, vector = key
+        text = None
+        with self._lock:
+            index = self._indexes.get(sentiment)
+            if index is not None and index.size:
+                slot, similarity = index.search(vector, history)
+                now = time.time()
+                if similarity >= self.threshold and index.texts[slot] is not None:
+                    if now - index.stored_at[slot] > self.ttl:
+                        index.drop(slot)
+                    else:
+                        index.used_at[slot] = now
+                        text = index.texts[slot]
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.lookup_seconds.append(time.perf_counter() - start)
+        return text
+
+    def put(self, key, text):
+        """Store response text under a request's vector"""
+        if key is None or not text:
+            return
+        sentiment, history, vector = key
+        with self._lock:
+            index = self._indexes.get(sentiment)
+            if index is None:
+                index = self._indexes[sentiment] = _Index(self.max_entries, self.dim)
+            slot = index.free_slot()
+            if index.texts[slot] is not None:
+                self.evictions += 1
+            now = time.time()
+            index.vectors[slot] = vector
+            index.histories[slot] = history
+            index.stored_at[slot] = now
+            index.used_at[slot] = now
+            index.texts[slot] = text
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self):
+        """Cache counters and lookup latency"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            latencies = sorted(self.lookup_seconds)
+            return {
+                'enabled': self.enabled,
+                'numpy': np is not None,
+                'threshold': self.threshold,
+                'entries': {sentiment: sum(t is not None for t in index.texts)
+                            for sentiment, index in self._indexes.items()},
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'lookup_avg_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+                'lookup_p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3) if latencies else None
+            }
+
+
+def semantic_cache_from_env():
+    """Build the semantic cache from environment variables (off unless SEMANTIC_CACHE=1)"""
+    enabled = os.getenv('SEMANTIC_CACHE', '0') in ('1', 'true', 'yes')
+    if enabled and np is None:
+        print("⚠️ SEMANTIC_CACHE is set but numpy is not installed - semantic cache disabled")
+    return SemanticCache(
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.9')),
+        max_entries=int(os.getenv('SEMANTIC_CACHE_SIZE', '1024')),
+        ttl=float(os.getenv('SEMANTIC_CACHE_TTL', '3600')),
+        dim=int(os.getenv('SEMANTIC_CACHE_DIM', '512')),
+        max_history=int(os.getenv('SEMANTIC_CACHE_MAX_HISTORY', '0')),
+        enabled=enabled,
+    )
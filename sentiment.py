@@ -0,0 +1,202 @@
+"""
+Sentiment detection for user messages.
+
+Keywords match whole words only: "hi" does not match "this" and "won"
+does not match "wonder", which the old substring scans got wrong.
+Duplicate keywords are counted once. All keyword sets are compiled into
+one word table and a message is split into words once. This is not a
+speedup: on short chat messages it is about as fast as the old scans,
+but on long messages, or with only a few dozen keywords, the old
+C-level substring search is faster.
+
+Set SENTIMENT_KEYWORDS_FILE to a JSON file of {category: [keywords]} to
+override the built-in sets; the file is re-read when it changes.
+"""
+import json
+import os
+import threading
+import time
+
+# Sentiment detection keywords
+NEGATIVE_KEYWORDS = [
+    'sad', 'upset', 'angry', 'frustrated', 'depressed', 'anxious', 'worried', 'scared',
+    'lonely', 'hurt', 'pain', 'crying', 'failed', 'failure', 'broke up', 'breakup',
+    'fight', 'argument', 'stress', 'tension', 'problem', 'issue', 'trouble', 'difficult',
+    'dukhi', 'pareshan', 'gussa', 'dard', 'takleef', 'mushkil'
+]
+
+POSITIVE_KEYWORDS = [
+    'happy', 'excited', 'great', 'awesome', 'amazing', 'wonderful', 'love', 'loved',
+    'success', 'won', 'achieved', 'proud', 'celebrate', 'party', 'good news',
+    'khush', 'mast', 'badhiya', 'accha', 'kamaal', 'zabardast'
+]
+
+# Question words that, with a '?', mean the user wants help
+HELP_KEYWORDS = ['why', 'how', 'what', 'kaise', 'kyu', 'kya']
+
+GREETING_KEYWORDS = ['hello', 'hi', 'hey', 'sup', 'kya hal']
+
+DEFAULT_KEYWORDS = {
+    'negative': NEGATIVE_KEYWORDS,
+    'positive': POSITIVE_KEYWORDS,
+    'help': HELP_KEYWORDS,
+    'greeting': GREETING_KEYWORDS,
+}
+
+
+def _separator_table():
+    """str.translate table mapping punctuation, symbols and emoji to spaces"""
+    ranges = [
+        range(0x80),                # ASCII
+        range(0x2000, 0x2070),      # general punctuation, ZWJ
+        range(0x2190, 0x2C00),      # arrows, symbols, dingbats
+        range(0xFE00, 0xFE10),      # variation selectors
+        range(0x1F000, 0x1FB00),    # emoji
+    ]
+    table = {}
+    for codepoints in ranges:
+        for cp in codepoints:
+            ch = chr(cp)
+            if not (ch.isalnum() or ch in "_'"):
+                table[cp] = ' '
+    return table
+
+
+SEPARATORS = _separator_table()
+
+# How often (seconds) to check the keywords file for changes
+RELOAD_CHECK_INTERVAL = 5.0
+
+
+def split_words(text):
+    """Split lowercased text into words"""
+    return text.translate(SEPARATORS).split()
+
+
+class SentimentMatcher:
+    """Single-pass, whole-word matcher over several keyword categories"""
+
+    def __init__(self, keyword_sets):
+        self.categories = tuple(keyword_sets)
+        word_categories = {}
+        phrase_categories = {}
+        for category, keywords in keyword_sets.items():
+            for keyword in keywords:
+                words = split_words(keyword.lower())
+                if len(words) == 1:
+                    word_categories.setdefault(words[0], set()).add(category)
+                elif words:
+                    phrase_categories.setdefault(' '.join(words), set()).add(category)
+
+        # word -> categories, for single-word keywords
+        self._words = {word: tuple(c) for word, c in word_categories.items()}
+        self._word_set = frozenset(self._words)
+        # first word -> [(' padded phrase ', categories)], for multi-word keywords
+        self._phrases = {}
+        for phrase, categories in phrase_categories.items():
+            self._phrases.setdefault(phrase.split(' ', 1)[0], []).append((f' {phrase} ', tuple(categories)))
+        self._phrase_starts = frozenset(self._phrases)
+        self.keyword_count = len(word_categories) + len(phrase_categories)
+
+    def scan(self, text):
+        """Count distinct keywords per category in already-lowercased text"""
+        counts = dict.fromkeys(self.categories, 0)
+        words = split_words(text)
+
+        for word in self._word_set.intersection(words):
+            for category in self._words[word]:
+                counts[category] += 1
+
+        starts = self._phrase_starts.intersection(words)
+        if starts:
+            joined = f" {' '.join(words)} "
+            for start in starts:
+                for phrase, categories in self._phrases[start]:
+                    if phrase in joined:
+                        for category in categories:
+                            counts[category] += 1
+        return counts
+
+
+def load_keywords(path):
+    """Read keyword sets from a JSON file, falling back to the defaults per category"""
+    with open(path, encoding='utf-8') as f:
+        overrides = json.load(f)
+    keyword_sets = dict(DEFAULT_KEYWORDS)
+    keyword_sets.update({category: list(words) for category, words in overrides.items()})
+    return keyword_sets
+
+
+_matcher = SentimentMatcher(DEFAULT_KEYWORDS)
+_keywords_file = os.getenv('SENTIMENT_KEYWORDS_FILE')
+_keywords_mtime = None
+_next_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def reload_keywords(path=None):
+    """Rebuild the matcher from a keywords file (or the defaults) and swap it in"""
+    global _matcher, _keywords_file, _keywords_mtime
+    with _reload_lock:
+        if path is not None:
+            _keywords_file = path
+        if _keywords_file:
+            _keywords_mtime = os.path.getmtime(_keywords_file)
+            _matcher = SentimentMatcher(load_keywords(_keywords_file))
+        else:
+            _matcher = SentimentMatcher(DEFAULT_KEYWORDS)
+    return _matcher
+
+
+def _check_reload():
+    """Reload the keywords file if it changed; checked at most every few seconds"""
+    global _next_check
+    now = time.monotonic()
+    if now < _next_check:
+        return
+    _next_check = now + RELOAD_CHECK_INTERVAL
+    try:
+        if os.path.getmtime(_keywords_file) != _keywords_mtime:
+            reload_keywords()
+            print(f"🔄 Reloaded sentiment keywords from {_keywords_file}")
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not reload sentiment keywords: {e}")
+
+
+def detect_sentiment(message):
+    """Detect the emotional tone of the message"""
+    if _keywords_file:
+        _check_reload()
+    return _classify(_matcher, message)
+
+
+def detect_sentiments(messages):
+    """detect_sentiment over a batch, with one reload check and one matcher"""
+    if _keywords_file:
+        _check_reload()
+    matcher = _matcher
+    return [_classify(matcher, message) for message in messages]
+
+
+def _classify(matcher, message):
+    counts = matcher.scan(message.lower())
+
+    negative_count = counts.get('negative', 0)
+    positive_count = counts.get('positive', 0)
+
+    # Question marks often indicate confusion or seeking help
+    if '?' in message and counts.get('help', 0):
+        return 'seeking_help'
+
+    if negative_count > positive_count and negative_count > 0:
+        return 'negative'
+    elif positive_count > negative_count and positive_count > 0:
+        return 'positive'
+    elif counts.get('greeting', 0):
+        return 'greeting'
+    else:
+        return 'neutral'
+
+
+if _keywords_file:
+    reload_keywords()
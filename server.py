@@ -1,14 +1,35 @@
 import os
 import json
 import hashlib
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import google.generativeai as genai
 from datetime import datetime
 import secrets
+import atexit
 import time
+import math
 import random
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from rate_limiter import RateLimitExceeded, scheduler_from_env
+from session_store import iso, session_store_from_env
+from turn_log import TurnLogReader, turn_log_from_env
+from cluster import cluster_from_env
+from response_cache import response_cache_from_env
+from semantic_cache import semantic_cache_from_env
+from sentiment import detect_sentiment, detect_sentiments
+from prompt_builder import prompt_builder_from_env
+from generation_policy import generation_policy_from_env
+from summarizer import summarizer_from_env
+from upstream import is_quota_error, preload_libraries, upstream_pool_from_env
+from single_flight import single_flight_from_env
+from session_sequencer import SessionBusy, session_sequencer_from_env
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from json_provider import dumps as json_dumps, install as install_json_provider
+from compression import compressor_from_env
+from tracing import add_span, annotate, bind, span, tracer_from_env
 
 # Load environment variables
 load_dotenv()
@@ -16,28 +37,193 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
 CORS(app)
+JSON_PROVIDER = install_json_provider(app)
 
-# Configure Gemini API
+# Configure Gemini API (GEMINI_API_KEYS may list several keys). Clients are
+# created on first use, so importing the app needs no key and no network;
+# without a key, chat requests fail with a clear error instead.
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Initialize Gemini model
-model = genai.GenerativeModel(
-    'gemini-2.5-flash',
-    generation_config={
-        'temperature': 0.9,
-        'max_output_tokens': 4096,
-    }
+if not GEMINI_API_KEY and not os.getenv('GEMINI_API_KEYS'):
+    print("⚠️ GEMINI_API_KEY not found in environment variables - chat requests will fail")
+
+GENERATION_CONFIG = {
+    'temperature': 0.9,
+    'max_output_tokens': 4096,
+}
+
+# Cluster mode (CLUSTER_DB): sessions and rate limits shared with other nodes on this host
+cluster = cluster_from_env()
+
+# Chat contexts (bounded LRU + TTL session store, optionally persisted or shared)
+chat_contexts = session_store_from_env()
+atexit.register(chat_contexts.close)
+
+# Append-only turn log (TURN_LOG_DIR) for analytics and warm restarts
+turn_log = turn_log_from_env()
+if turn_log is not None:
+    atexit.register(turn_log.close)
+    if os.getenv('TURN_LOG_REPLAY', '1') not in ('0', 'false', 'no'):
+        replay_start = time.perf_counter()
+        restored, replayed = TurnLogReader(turn_log.directory).rebuild(chat_contexts)
+        print(f"📜 Restored {restored} sessions from {replayed} logged turns "
+              f"in {time.perf_counter() - replay_start:.2f}s")
+
+# Rate limiting (token buckets per API key and per session)
+scheduler = scheduler_from_env()
+
+# Gemini clients (API keys x models, with failover, backoff and hedging)
+upstream = upstream_pool_from_env(scheduler=scheduler, generation_config=GENERATION_CONFIG)
+
+# Prompt builder (precompiled system prompt, token-budgeted history)
+prompt_builder = prompt_builder_from_env()
+
+# Background rolling summaries of turns that left the prompt window; the
+# store holds such turns a little longer so none is dropped unsummarized
+summarizer = summarizer_from_env(
+    chat_contexts, lambda prompt, **kwargs: upstream.generate(prompt, **kwargs),
+    keep_recent=prompt_builder.max_turns
 )
+if summarizer.enabled:
+    chat_contexts.digest_backlog = 2 * summarizer.trigger_turns
+
+# Output cap / model tier per request (sentiment, message length, history depth)
+generation_policy = generation_policy_from_env()
+
+# Cache of raw model responses for repeated first-turn messages
+response_cache = response_cache_from_env()
+
+# Optional nearest-neighbour cache for paraphrases ("hi" / "hiii" / "heyy")
+semantic_cache = semantic_cache_from_env()
+
+# Turns of one session run one at a time, in arrival order
+session_sequencer = session_sequencer_from_env()
+
+# Identical concurrent prompts share one upstream call
+single_flight = single_flight_from_env()
+
+# Gzip / brotli for large complete responses
+compressor = compressor_from_env()
+
+# Opt-in span trees, slow-request log and sampled profiles (TRACE_REQUESTS)
+tracer = tracer_from_env()
+
+# Longest session ID accepted from clients (it is stored and logged with every turn)
+MAX_SESSION_ID_LENGTH = 256
+
+# Paged session listing
+SESSIONS_PAGE_SIZE = 100
+SESSIONS_MAX_PAGE_SIZE = 1000
+
+# Bulk / background generation (POST /api/chat/batch) runs on its own bounded pool
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+BATCH_RATE_LIMIT_RETRIES = 3
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_WORKERS', '4')),
+                                    thread_name_prefix='batch')
+
+# Metrics (exposed at /api/metrics)
+registry = Registry()
+REQUESTS = registry.counter(
+    'thaplu_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = registry.histogram(
+    'thaplu_http_request_duration_seconds', 'Time until the response is returned (headers, for streams)',
+    ('endpoint',))
+STAGE_SECONDS = registry.histogram(
+    'thaplu_stage_duration_seconds', 'Chat pipeline latency by stage', ('stage',))
+SENTIMENTS = registry.counter(
+    'thaplu_sentiment_total', 'Detected sentiment of chat messages', ('sentiment',))
+GENERATION_SECONDS = registry.histogram(
+    'thaplu_generation_duration_seconds', 'Upstream generation latency by generation policy', ('policy',))
+STAGE_RATE_LIMIT = STAGE_SECONDS.labels('rate_limit_wait')
+STAGE_PROMPT = STAGE_SECONDS.labels('prompt_build')
+STAGE_UPSTREAM = STAGE_SECONDS.labels('upstream_call')
+STAGE_FLAVOR = STAGE_SECONDS.labels('flavoring')
+STAGE_CONTEXT = STAGE_SECONDS.labels('context_update')
+
+registry.callback('thaplu_upstream_retries_total', 'Upstream calls retried after an error',
+                  lambda: upstream.retries, kind='counter')
+registry.callback('thaplu_upstream_quota_errors_total', 'Upstream 429 / quota errors by client',
+                  lambda: {(c.name,): c.quota_errors for c in upstream.clients}, ('client',), kind='counter')
+registry.callback('thaplu_upstream_hedges_total', 'Hedged duplicate upstream requests sent',
+                  lambda: upstream.hedges, kind='counter')
+registry.callback('thaplu_upstream_circuit_open', 'Whether a client circuit breaker is open',
+                  lambda: {(c.name,): int(c.state == 'open') for c in upstream.clients}, ('client',))
+registry.callback('thaplu_generation_output_tokens_total', 'Estimated output tokens by generation policy',
+                  lambda: {(name,): p['output_tokens'] for name, p in generation_policy.stats()['policies'].items()},
+                  ('policy',), kind='counter')
+registry.callback('thaplu_summaries_total', 'Background conversation summaries by result',
+                  lambda: {('completed',): summarizer.completed, ('failed',): summarizer.failed,
+                           ('stale',): summarizer.stale, ('deferred',): summarizer.deferred},
+                  ('result',), kind='counter')
+registry.callback('thaplu_summaries_pending', 'Sessions waiting for a background summary',
+                  lambda: summarizer.stats()['pending'])
+registry.callback('thaplu_turn_log_records_total', 'Records written to the turn log',
+                  lambda: turn_log.records if turn_log is not None else 0, kind='counter')
+registry.callback('thaplu_turn_log_pending', 'Turn log records waiting for the writer',
+                  lambda: turn_log.pending() if turn_log is not None else 0)
+registry.callback('thaplu_single_flight_coalesced_total', 'Requests served by another in-flight identical call',
+                  lambda: single_flight.coalesced, kind='counter')
+registry.callback('thaplu_single_flight_fallbacks_total', 'Coalesced requests that gave up waiting and called upstream',
+                  lambda: single_flight.fallbacks, kind='counter')
+registry.callback('thaplu_session_busy_total', 'Messages that found their session busy, by outcome',
+                  lambda: {('queued',): session_sequencer.queued, ('rejected',): session_sequencer.rejected,
+                           ('coalesced',): session_sequencer.coalesced, ('timeout',): session_sequencer.timeouts},
+                  ('outcome',), kind='counter')
+registry.callback('thaplu_rate_limit_rejected_total', 'Requests rejected by the admission scheduler',
+                  lambda: scheduler.rejected, kind='counter')
+registry.callback('thaplu_rate_limit_waiting', 'Requests waiting in the admission queue',
+                  lambda: scheduler.stats()['waiting'])
+registry.callback('thaplu_sessions_active', 'Sessions resident in the session store',
+                  lambda: len(chat_contexts))
+registry.callback('thaplu_session_store_bytes', 'Approximate memory held by the session store',
+                  lambda: chat_contexts.nbytes)
+registry.callback('thaplu_session_invalidations_total', 'Local sessions reloaded after another node wrote them',
+                  lambda: chat_contexts.invalidations, kind='counter')
+registry.callback('thaplu_session_evictions_total', 'Sessions evicted from the store',
+                  lambda: {(reason,): n for reason, n in chat_contexts.evictions.items()}, ('reason',),
+                  kind='counter')
+registry.callback('thaplu_response_cache_lookups_total', 'Response cache lookups by result',
+                  lambda: {('hit',): response_cache.hits, ('miss',): response_cache.misses}, ('result',),
+                  kind='counter')
+registry.callback('thaplu_semantic_cache_lookups_total', 'Semantic cache lookups by result',
+                  lambda: {('hit',): semantic_cache.hits, ('miss',): semantic_cache.misses}, ('result',),
+                  kind='counter')
+registry.callback('thaplu_slow_requests_total', 'Traced requests slower than TRACE_SLOW_MS',
+                  lambda: tracer.slow_total, kind='counter')
+
+# ==================== PROCESS LIFECYCLE ====================
+
+def preload():
+    """Pay one-off import costs in a preforking server's master process"""
+    preload_libraries()
+
+def reinit_after_fork():
+    """Give a forked worker its own threads, connections and gRPC clients"""
+    global batch_executor
+    chat_contexts.after_fork()
+    scheduler.after_fork()
+    upstream.after_fork()
+    summarizer.after_fork()
+    if turn_log is not None:
+        turn_log.after_fork()
+    batch_executor = ThreadPoolExecutor(max_workers=batch_executor._max_workers, thread_name_prefix='batch')
+
+def warm_worker():
+    """Create the Gemini clients before the first request reaches this worker"""
+    try:
+        upstream.connect()
+    except Exception as e:
+        print(f"⚠️ Could not create Gemini clients yet: {e}")
 
-# In-memory storage for chat contexts
-chat_contexts = {}
+def shutdown():
+    """Stop background work and flush sessions (worker exit / SIGTERM drain)"""
+    batch_executor.shutdown(wait=False, cancel_futures=True)
+    summarizer.close()
+    if turn_log is not None:
+        turn_log.close()
+    chat_contexts.close()
 
-# Rate limiting
-last_request_time = 0
-MIN_REQUEST_INTERVAL = 1
+os.register_at_fork(after_in_child=reinit_after_fork)
 
 # Enhanced Thaplu's personality traits with better context awareness
 THAPLU_RESPONSES = {
@@ -62,41 +248,6 @@ THAPLU_RESPONSES = {
     'gentle_sass': ['Smart toh mai hun 🙂‍↕️', 'Tu bhi samajhdar hai, use kar apna dimag 😌'],
 }
 
-# Sentiment detection keywords
-NEGATIVE_KEYWORDS = [
-    'sad', 'upset', 'angry', 'frustrated', 'depressed', 'anxious', 'worried', 'scared',
-    'lonely', 'hurt', 'pain', 'crying', 'failed', 'failure', 'broke up', 'breakup',
-    'fight', 'argument', 'stress', 'tension', 'problem', 'issue', 'trouble', 'difficult',
-    'dukhi', 'pareshan', 'gussa', 'dard', 'takleef', 'mushkil', 'problem', 'tension'
-]
-
-POSITIVE_KEYWORDS = [
-    'happy', 'excited', 'great', 'awesome', 'amazing', 'wonderful', 'love', 'loved',
-    'success', 'won', 'achieved', 'proud', 'celebrate', 'party', 'good news',
-    'khush', 'mast', 'badhiya', 'accha', 'kamaal', 'zabardast', 'awesome'
-]
-
-def detect_sentiment(message):
-    """Detect the emotional tone of the message"""
-    message_lower = message.lower()
-    
-    # Check for negative sentiment
-    negative_count = sum(1 for word in NEGATIVE_KEYWORDS if word in message_lower)
-    positive_count = sum(1 for word in POSITIVE_KEYWORDS if word in message_lower)
-    
-    # Question marks often indicate confusion or seeking help
-    if '?' in message and any(word in message_lower for word in ['why', 'how', 'what', 'kaise', 'kyu', 'kya']):
-        return 'seeking_help'
-    
-    if negative_count > positive_count and negative_count > 0:
-        return 'negative'
-    elif positive_count > negative_count and positive_count > 0:
-        return 'positive'
-    elif any(word in message_lower for word in ['hello', 'hi', 'hey', 'sup', 'kya hal']):
-        return 'greeting'
-    else:
-        return 'neutral'
-
 def add_thaplu_flavor(response, user_message, sentiment):
     """Add contextually appropriate Thaplu personality to responses"""
     user_lower = user_message.lower()
@@ -135,222 +286,439 @@ def add_thaplu_flavor(response, user_message, sentiment):
     
     return response
 
-def wait_for_rate_limit():
-    """Wait if necessary to respect rate limits"""
-    global last_request_time
-    current_time = time.time()
-    time_since_last = current_time - last_request_time
-    
-    if time_since_last < MIN_REQUEST_INTERVAL:
-        wait_time = MIN_REQUEST_INTERVAL - time_since_last
-        time.sleep(wait_time)
-    
-    last_request_time = time.time()
+def wait_for_rate_limit(session_id=None):
+    """Wait for a session admission slot; raises RateLimitExceeded if none comes in time"""
+    # Per-key buckets are taken by the upstream pool for whichever key it picks
+    with span('rate_limit_wait'):
+        waited = scheduler.acquire(None, session_id)
+    STAGE_RATE_LIMIT.observe(waited)
+    return waited
+
+def rate_limited_response(error):
+    """Build a 429 response with a Retry-After header"""
+    response = jsonify({
+        'success': False,
+        'error': 'Too many requests',
+        'reason': error.reason,
+        'response': "Arre yaar 😑 thoda saans le... Thodi der baad try kar 🙄",
+        'retry_after': round(error.retry_after, 2),
+        'timestamp': datetime.now().isoformat()
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+def session_busy_result(error):
+    """Result for a message whose session already has one in flight"""
+    return {
+        'success': False,
+        'error': 'Session busy',
+        'reason': error.reason,
+        'response': "Ek ek karke bhai 😅 pehle wala message toh khatam hone de!",
+        'context_length': 0,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def session_busy_response(error):
+    """Build a 409 response for a busy session"""
+    response = jsonify(session_busy_result(error))
+    response.status_code = 409
+    return response
+
+def parse_timestamp(value):
+    """Epoch seconds from a query value: epoch number or ISO-8601 (None if absent)"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def parse_limit(value, default, maximum):
+    """Positive page size from a query value, capped at maximum (if any)"""
+    if value is None or value == '':
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return limit if maximum is None else min(limit, maximum)
+
+def request_session_id(value):
+    """Session ID from a request body, or a new one; numeric IDs are used as strings
+
+    Raises ValueError for IDs that are too long or not valid Unicode text.
+    """
+    if not value:
+        return hashlib.md5(secrets.token_bytes(32)).hexdigest()
+    session_id = str(value)
+    if len(session_id) > MAX_SESSION_ID_LENGTH:
+        raise ValueError(f"session_id must be at most {MAX_SESSION_ID_LENGTH} characters")
+    try:
+        session_id.encode('utf-8')
+    except UnicodeEncodeError:
+        raise ValueError("session_id must be valid Unicode text") from None
+    return session_id
 
 def get_chat_context(session_id):
     """Get chat context for session"""
-    if session_id not in chat_contexts:
-        chat_contexts[session_id] = {
-            'history': [],
-            'created_at': datetime.now().isoformat()
-        }
-    return chat_contexts[session_id]
+    return chat_contexts.get_or_create(session_id)
 
 def update_context(session_id, user_msg, bot_response):
-    """Update chat context with conversation history"""
-    context = get_chat_context(session_id)
-    
-    context['history'].append({
-        'timestamp': datetime.now().isoformat(),
-        'user': user_msg,
-        'bot': bot_response
-    })
-    
-    # Keep last 10 exchanges
-    if len(context['history']) > 10:
-        context['history'] = context['history'][-10:]
+    """Update chat context with conversation history (keeps last 10 exchanges, older ones are summarized)"""
+    context = chat_contexts.append_turn(session_id, user_msg, bot_response)
+    if turn_log is not None:
+        turn_log.append(session_id, context.history[-1].timestamp, user_msg, bot_response)
+    summarizer.maybe_schedule(context)
+    return context
 
-def generate_response(user_message, session_id, retry_count=0):
-    """Generate AI response using Gemini with enhanced emotional Thaplu personality"""
-    MAX_RETRIES = 2
-    
-    try:
-        wait_for_rate_limit()
+def build_prompt(user_message, context, sentiment):
+    """Build the full Gemini prompt for a message (rolling summary + recent turns)"""
+    return prompt_builder.build(user_message, context.recent_history(), sentiment, context.digest)
+
+def prepare_generation(user_message, session_id, sentiment=None):
+    """Load the session context, detect sentiment (unless given), pick the generation policy and build the prompt"""
+    with STAGE_PROMPT.time(), span('prompt_build'):
         context = get_chat_context(session_id)
         
         # Detect sentiment
-        sentiment = detect_sentiment(user_message)
-        
-        # Build conversation history
-        context_text = ""
-        if context['history']:
-            recent_history = context['history'][-5:]
-            context_text = "\n".join([
-                f"User: {msg['user']}\nThaplu: {msg['bot']}"
-                for msg in recent_history
-            ])
-        
-        # Enhanced Thaplu personality prompt with emotional intelligence
-        system_prompt = """You are Thaplu, a deeply caring, emotionally intelligent friend with a fun personality. You understand context and emotions, and respond accordingly.
-
-CORE PERSONALITY:
-- You're caring, empathetic, and emotionally aware
-- You balance being fun with being genuinely supportive
-- You understand when to be serious and when to be playful
-- You're logical, reasonable, and give thoughtful advice
-- You use emojis naturally but not excessively (2-4 per response)
-- You mix Hindi and English naturally (Hinglish style)
-
-EMOTIONAL INTELLIGENCE (MOST IMPORTANT):
-**When friend is struggling/negative/upset:**
-- Be deeply empathetic and supportive first
-- Listen and validate their feelings
-- Give logical, practical advice with compassion
-- Be motivational but realistic
-- Use comforting emojis: 💙 🤗 💪 ✨
-- DON'T make jokes or talk about food - focus on helping
-- Show you genuinely care and understand
-
-**When friend is happy/positive/celebrating:**
-- Share their joy enthusiastically!
-- Be celebratory and encouraging
-- Use happy emojis: 🎉 😁 🌟 ✨
-- You can be more playful here
-- Acknowledge their achievement sincerely
-
-**When friend is seeking help/advice:**
-- Be thoughtful and logical
-- Give detailed, practical solutions
-- Break down complex problems
-- Be encouraging but honest
-- Mix wisdom with your caring nature
-
-**For casual chat:**
-- Be fun and friendly
-- Keep it light and engaging
-- You can mention food occasionally (but not every time!)
-- Use your playful side naturally
-
-SPEAKING STYLE:
-- Use reactions: "Arre yaar", "Dekh", "Sunle", "Oho", "Acha"
-- Mix Hindi-English naturally, don't force it
-- Be conversational, like talking to a close friend
-- Casual slang: "Oye", "Chal", "Bhai", "Yaar"
-- When serious: be clear, logical, and compassionate
-
-FOOD & FUN REFERENCES (Use Sparingly!):
-- Only bring up food when context fits or mood is light
-- "Kitkat" or "sushi" mentions: MAX once per conversation or when truly relevant
-- These are your quirks, not your entire personality
-- Don't shoehorn food references into serious conversations
-
-MARKDOWN FORMATTING:
-**Use formatting based on need:**
-- Casual chat: Minimal formatting, natural flow
-- Serious advice/help: Use headings, lists, bold for clarity
-  - **Bold** for key points
-  - Lists for steps or options
-  - Headers for organization
-- Code: Use code blocks when relevant
-- Don't over-format casual responses
-
-HOW TO RESPOND BASED ON CONTEXT:
-
-1. **Friend is sad/struggling:**
-   "Arre yaar, I can see tu upset hai 💙 Dekh, it's okay to feel like this. [Validate their feeling]. [Practical advice]. Mai hoon na tera saath mein, we'll figure this out together 🤗 Tu strong hai, yaad rakh."
-
-2. **Friend is happy/celebrating:**
-   "Yesss! 🎉 Bahut badhiya yaar! I'm so proud of you! [Acknowledge achievement]. Aise hi chalta reh! ✨ Tu deserve karta hai yeh happiness 😁"
-
-3. **Friend needs advice:**
-   "Dekh, aise kar - [Step by step logical advice]. [Reasoning]. Trust me, yeh kaam karega. Aur agar koi problem aaye, batana, mai help karungi 💪"
-
-4. **Casual fun chat:**
-   "Oho🙂 kya baat hai! [Response]. [Natural conversation]. Chal movie dekhne chalte hai kabhi 😁"
-
-CRITICAL RULES:
-- READ THE EMOTIONAL CONTEXT - it's the most important thing
-- Serious problems need serious, thoughtful responses
-- Don't dilute empathy with excessive playfulness
-- Food references are occasional treats, not mandatory
-- Be the friend they need in that moment
-- Quality over quirkiness - be genuinely helpful
-- Use emojis to enhance, not replace, emotional depth
-- Give DETAILED responses when needed - explain properly
-
-Remember: You're Thaplu - caring, smart, fun, and emotionally aware. Your friend's wellbeing comes first. Be the supportive friend who knows when to be serious and when to be silly."""
-
-        # Add sentiment guidance to prompt
-        sentiment_guidance = ""
-        if sentiment == 'negative':
-            sentiment_guidance = "\n[ALERT: User seems upset/struggling. Be empathetic, supportive, and helpful. Focus on comfort and practical advice.]"
-        elif sentiment == 'positive':
-            sentiment_guidance = "\n[CONTEXT: User seems happy/positive. Share their joy and be encouraging!]"
-        elif sentiment == 'seeking_help':
-            sentiment_guidance = "\n[CONTEXT: User is seeking help/advice. Be logical, detailed, and supportive.]"
-
-        # Build the full prompt
-        if context_text:
-            full_prompt = f"""{system_prompt}
-
-Previous conversation:
-{context_text}
-
-Current message: {user_message}{sentiment_guidance}
-
-Respond as Thaplu (context-aware, emotionally intelligent):"""
-        else:
-            full_prompt = f"""{system_prompt}
-
-Message: {user_message}{sentiment_guidance}
+        if sentiment is None:
+            sentiment = detect_sentiment(user_message)
+        SENTIMENTS.labels(sentiment).inc()
+        
+        # Short replies for small talk, the full budget for real questions
+        policy = generation_policy.select(sentiment, user_message, len(context.history))
+        
+        # Build prompt
+        full_prompt = build_prompt(user_message, context, sentiment)
+    
+    annotate(prompt_chars=len(full_prompt), history_turns=len(context.history),
+             sentiment=sentiment, policy=policy.name)
+    return context, sentiment, policy, full_prompt
 
-Respond as Thaplu (context-aware, emotionally intelligent):"""
+def record_generation(policy, upstream_start, text):
+    """Time a completed upstream generation under its policy"""
+    elapsed = time.perf_counter() - upstream_start
+    STAGE_UPSTREAM.observe(elapsed)
+    GENERATION_SECONDS.labels(policy.name).observe(elapsed)
+    generation_policy.record(policy, elapsed, text)
 
-        # Generate response
-        response = model.generate_content(full_prompt)
-        bot_response = response.text
-        
-        # Add contextually appropriate Thaplu flavor
+def finish_response(user_message, session_id, context, sentiment, bot_response):
+    """Flavor the model output, store the exchange and build the result"""
+    # Add contextually appropriate Thaplu flavor
+    with STAGE_FLAVOR.time(), span('flavoring'):
         bot_response = add_thaplu_flavor(bot_response, user_message, sentiment)
-        
-        # Update context
+    
+    # Update context
+    with STAGE_CONTEXT.time(), span('context_update'):
         update_context(session_id, user_message, bot_response)
-        
+    
+    return {
+        'success': True,
+        'response': bot_response,
+        'context_length': len(context.history),
+        'sentiment': sentiment,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def error_result(error):
+    """Build the failure result for an upstream error"""
+    if is_quota_error(str(error)):
         return {
-            'success': True,
-            'response': bot_response,
-            'context_length': len(context['history']),
-            'sentiment': sentiment,
+            'success': False,
+            'error': 'API quota exceeded',
+            'response': "Arre yaar 😑 API quota khatam ho gaya... Thodi der baad try kar 🙄",
+            'context_length': 0,
             'timestamp': datetime.now().isoformat()
         }
+    
+    return {
+        'success': False,
+        'error': str(error),
+        'response': f"Oho🙂 kuch gadbad ho gayi... Error: {str(error)} 😲",
+        'context_length': 0,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def cached_response(user_message, sentiment, history):
+    """(cached reply or None, cache keys): exact match first, then a close paraphrase"""
+    with span('cache_lookup'):
+        keys = (response_cache.key(user_message, sentiment, history),
+                semantic_cache.key(user_message, sentiment, history))
+        text = response_cache.get(keys[0])
+        if text is None:
+            text = semantic_cache.get(keys[1])
+    return text, keys
+
+def cache_response(keys, text):
+    """Store a fresh model reply under the keys from cached_response"""
+    response_cache.put(keys[0], text)
+    semantic_cache.put(keys[1], text)
+
+def generate_text(policy, full_prompt):
+    """Model reply under a policy; one cut off by a small cap before any text is retried with the full cap"""
+    text = single_flight.do((policy.name, full_prompt), lambda: upstream.generate(full_prompt, **policy.kwargs))
+    retry = None if text.strip() else generation_policy.escalate(policy)
+    if retry is None:
+        return text
+    return single_flight.do((retry.name, full_prompt), lambda: upstream.generate(full_prompt, **retry.kwargs))
+
+def stream_text(policy, full_prompt):
+    """Relay a streamed reply; if the cap cut it off before any text, stream again with the full cap"""
+    produced = False
+    for text in upstream.stream(full_prompt, **policy.kwargs):
+        produced = True
+        yield text
+    retry = None if produced else generation_policy.escalate(policy)
+    if retry is not None:
+        yield from upstream.stream(full_prompt, **retry.kwargs)
+
+def generate_turn(user_message, session_id, sentiment=None):
+    """Build the prompt, get the reply (cached or from upstream) and store the turn"""
+    context, sentiment, policy, full_prompt = prepare_generation(user_message, session_id, sentiment)
+    
+    # Serve repeated messages from the cache, otherwise generate
+    bot_response, cache_keys = cached_response(user_message, sentiment, context.history)
+    if bot_response is None:
+        upstream_start = time.perf_counter()
+        with span('upstream_call', policy=policy.name):
+            bot_response = generate_text(policy, full_prompt)
+        record_generation(policy, upstream_start, bot_response)
+        cache_response(cache_keys, bot_response)
+    
+    return finish_response(user_message, session_id, context, sentiment, bot_response)
+
+def generate_response(user_message, session_id, sentiment=None):
+    """Generate AI response using Gemini with enhanced emotional Thaplu personality"""
+    try:
+        wait_for_rate_limit(session_id)
+        
+        # One turn at a time per session, so every prompt sees the previous reply
+        with span('session_turn'):
+            result = session_sequencer.run(
+                session_id, user_message, lambda: generate_turn(user_message, session_id, sentiment)
+            )
+        return dict(result)
+        
+    except (RateLimitExceeded, SessionBusy):
+        raise
         
     except Exception as e:
-        error_msg = str(e)
+        return error_result(e)
+
+def generate_batch_item(user_message, session_id, sentiment):
+    """generate_response for a batch item, waiting out rate limits instead of failing"""
+    for attempt in range(BATCH_RATE_LIMIT_RETRIES + 1):
+        try:
+            return generate_response(user_message, session_id, sentiment)
+        except SessionBusy as e:
+            return session_busy_result(e)
+        except RateLimitExceeded as e:
+            if attempt == BATCH_RATE_LIMIT_RETRIES:
+                return {
+                    'success': False,
+                    'error': 'Rate limit exceeded',
+                    'retry_after': math.ceil(e.retry_after),
+                    'context_length': 0,
+                    'timestamp': datetime.now().isoformat()
+                }
+            time.sleep(e.retry_after)
+
+def run_batch(items):
+    """Generate responses for batch items, yielding (index, result) as each completes.
+
+    Sentiment is detected for the whole batch up front. Items of one session
+    run in order on one worker (each prompt needs the previous reply);
+    different sessions run in parallel on the batch executor.
+    """
+    sentiments = detect_sentiments([item['message'] for item in items])
+    sessions = {}
+    for index, item in enumerate(items):
+        sessions.setdefault(item['session_id'], []).append(index)
+    
+    results = queue.Queue()
+    cancelled = threading.Event()
+    
+    def run_session(indexes):
+        for index in indexes:
+            if cancelled.is_set():
+                return
+            item = items[index]
+            try:
+                result = generate_batch_item(item['message'], item['session_id'], sentiments[index])
+            except Exception as e:
+                result = error_result(e)
+            results.put((index, result))
+    
+    for indexes in sessions.values():
+        batch_executor.submit(bind(run_session), indexes)
+    
+    try:
+        for _ in range(len(items)):
+            yield results.get()
+    finally:
+        # Client went away: stop starting new items
+        cancelled.set()
+
+def ndjson_line(payload):
+    """Format one newline-delimited JSON record"""
+    return json_dumps(payload) + '\n'
+
+def stream_batch(items, rejected):
+    """Stream batch results as NDJSON, then a summary line"""
+    start_time = time.perf_counter()
+    succeeded = 0
+    
+    for index, result in rejected:
+        yield ndjson_line({'index': index, **result})
+    
+    for index, result in run_batch(items):
+        succeeded += bool(result.get('success'))
+        yield ndjson_line({'index': items[index]['index'], 'session_id': items[index]['session_id'], **result})
+    
+    yield ndjson_line({
+        'done': True,
+        'items': len(items) + len(rejected),
+        'succeeded': succeeded,
+        'failed': len(items) + len(rejected) - succeeded,
+        'total_ms': round((time.perf_counter() - start_time) * 1000, 1)
+    })
+
+def sse_event(event, payload):
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json_dumps(payload)}\n\n"
+
+def stream_response(user_message, session_id):
+    """Stream AI response from Gemini as Server-Sent Events (caller handles admission and session order)"""
+    start_time = time.perf_counter()
+    first_token_ms = None
+    chunks = []
+    
+    try:
+        context, sentiment, policy, full_prompt = prepare_generation(user_message, session_id)
         
-        if "429" in error_msg or "quota" in error_msg.lower() or "ResourceExhausted" in error_msg:
-            if retry_count < MAX_RETRIES:
-                print(f"⚠️ Rate limit hit! Retrying in 3 seconds...")
-                time.sleep(3)
-                return generate_response(user_message, session_id, retry_count + 1)
-            
-            return {
-                'success': False,
-                'error': 'API quota exceeded',
-                'response': "Arre yaar 😑 API quota khatam ho gaya... Thodi der baad try kar 🙄",
-                'context_length': 0,
-                'timestamp': datetime.now().isoformat()
-            }
+        yield sse_event('start', {'session_id': session_id, 'sentiment': sentiment})
         
-        return {
-            'success': False,
-            'error': str(e),
-            'response': f"Oho🙂 kuch gadbad ho gayi... Error: {str(e)} 😲",
-            'context_length': 0,
-            'timestamp': datetime.now().isoformat()
-        }
+        # Relay partial text as it arrives
+        cached, cache_keys = cached_response(user_message, sentiment, context.history)
+        if cached is None:
+            upstream_start = time.perf_counter()
+            for text in stream_text(policy, full_prompt):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start_time) * 1000, 1)
+                chunks.append(text)
+                yield sse_event('chunk', {'text': text})
+            add_span('upstream_stream', upstream_start, policy=policy.name)
+            record_generation(policy, upstream_start, ''.join(chunks))
+            cache_response(cache_keys, ''.join(chunks))
+        else:
+            first_token_ms = round((time.perf_counter() - start_time) * 1000, 1)
+            chunks.append(cached)
+            yield sse_event('chunk', {'text': cached})
+        
+        # Flavor and store the complete response exactly once
+        result = finish_response(user_message, session_id, context, sentiment, ''.join(chunks))
+        event = 'done'
+        
+    except Exception as e:
+        result = error_result(e)
+        event = 'error'
+    
+    result['session_id'] = session_id
+    result['ttfb_ms'] = first_token_ms
+    result['total_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+    yield sse_event(event, result)
 
 # ==================== API ENDPOINTS ====================
 
+@app.before_request
+def start_request_timer():
+    """Remember when the request started (and start its trace, if tracing is on)"""
+    g.request_start = time.perf_counter()
+    g.trace = tracer.begin(request.path, request.method, request.headers.get('X-Profile') == '1')
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its latency"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - g.request_start)
+    if g.trace is not None:
+        g.trace.root.attrs['status'] = response.status_code
+    return response
+
+@app.teardown_request
+def finish_trace(error=None):
+    """End the request's trace (for streams, once the body has been sent)"""
+    tracer.finish(g.pop('trace', None))
+
+@app.after_request
+def add_node_header(response):
+    """Tell clients and load balancers which cluster node answered"""
+    if cluster is not None:
+        response.headers['X-Served-By'] = cluster.node_id
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Gzip / brotli large JSON bodies for clients that accept it"""
+    return compressor.compress_response(response, request.headers.get('Accept-Encoding'))
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/debug/profile', methods=['GET'])
+def debug_profile():
+    """Summed cProfile of sampled requests (?sort=cumulative|tottime|calls&limit=40&reset=1)"""
+    if not tracer.enabled:
+        return jsonify({
+            'success': False,
+            'error': 'Tracing is off (set TRACE_REQUESTS=1)'
+        }), 404
+    
+    try:
+        limit = parse_limit(request.args.get('limit'), 40, None)
+        report = tracer.profile_report(request.args.get('sort', 'cumulative'), limit)
+    except (ValueError, KeyError) as e:
+        return jsonify({
+            'success': False,
+            'error': f"Invalid parameter: {e}"
+        }), 400
+    
+    if request.args.get('reset') == '1':
+        tracer.reset_profile()
+    return Response(report, content_type='text/plain; charset=utf-8')
+
+@app.route('/api/debug/slow', methods=['GET'])
+def debug_slow():
+    """Recent requests slower than TRACE_SLOW_MS with their span trees, newest first"""
+    if not tracer.enabled:
+        return jsonify({
+            'success': False,
+            'error': 'Tracing is off (set TRACE_REQUESTS=1)'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'slow_ms': tracer.slow_ms,
+        'requests': list(reversed(tracer.slow))
+    })
+
+@app.route('/api/cluster', methods=['GET'])
+def cluster_info():
+    """Cluster membership, or the node owning ?session_id=<id>"""
+    if cluster is None:
+        return jsonify({
+            'success': False,
+            'error': 'Cluster mode is off (set CLUSTER_DB)'
+        }), 404
+    
+    session_id = request.args.get('session_id')
+    if session_id:
+        return jsonify({'success': True, **cluster.route(session_id)})
+    return jsonify({'success': True, **cluster.stats()})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -360,6 +728,19 @@ def health_check():
         'version': '3.0.0',
         'model': 'gemini-2.5-flash',
         'personality': 'Thaplu Mode: Caring + Fun + Smart! 💙',
+        'upstream': upstream.stats(),
+        'prompt': prompt_builder.stats(),
+        'response_cache': response_cache.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'generation_policy': generation_policy.stats(),
+        'summarizer': summarizer.stats(),
+        'turn_log': turn_log.stats() if turn_log is not None else None,
+        'cluster': cluster.stats() if cluster is not None else None,
+        'tracing': tracer.stats(),
+        'single_flight': single_flight.stats(),
+        'session_sequencer': session_sequencer.stats(),
+        'json_provider': JSON_PROVIDER,
+        'compression': compressor.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -384,9 +765,13 @@ def chat():
             }), 400
         
         # Get or create session ID
-        session_id = data.get('session_id')
-        if not session_id:
-            session_id = hashlib.md5(secrets.token_bytes(32)).hexdigest()
+        try:
+            session_id = request_session_id(data.get('session_id'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         # Generate response
         result = generate_response(user_message, session_id)
@@ -394,6 +779,122 @@ def chat():
         
         return jsonify(result)
         
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+        
+    except SessionBusy as e:
+        return session_busy_response(e)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming chat endpoint (Server-Sent Events)"""
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': 'No JSON data provided'
+            }), 400
+        
+        user_message = data.get('message', '').strip()
+        
+        if not user_message:
+            return jsonify({
+                'success': False,
+                'error': 'Message is required'
+            }), 400
+        
+        # Get or create session ID
+        try:
+            session_id = request_session_id(data.get('session_id'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Admit before the stream starts so rejections can still be a 429 / 409
+        wait_for_rate_limit(session_id)
+        session_sequencer.acquire(session_id)
+        
+        response = Response(
+            stream_with_context(stream_response(user_message, session_id)),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+                'X-Session-Id': session_id
+            }
+        )
+        # Hand the session on once the stream is done (or the client went away)
+        response.call_on_close(lambda: session_sequencer.release(session_id))
+        return response
+        
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+        
+    except SessionBusy as e:
+        return session_busy_response(e)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Bulk chat endpoint: streams one NDJSON result per item as it completes"""
+    try:
+        data = request.json
+        
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'error': 'items must be a non-empty list of {session_id, message}'
+            }), 400
+        
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {BATCH_MAX_ITEMS} items per batch'
+            }), 400
+        
+        accepted, rejected = [], []
+        for index, item in enumerate(items):
+            user_message = item.get('message') if isinstance(item, dict) else None
+            if not isinstance(user_message, str) or not user_message.strip():
+                rejected.append((index, {'success': False, 'error': 'Message is required'}))
+                continue
+            user_message = user_message.strip()
+            
+            # Items without a session ID each get a new session
+            try:
+                session_id = request_session_id(item.get('session_id'))
+            except ValueError as e:
+                rejected.append((index, {'success': False, 'error': str(e)}))
+                continue
+            accepted.append({'index': index, 'session_id': session_id, 'message': user_message})
+        
+        return Response(
+            stream_with_context(stream_batch(accepted, rejected)),
+            mimetype='application/x-ndjson',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -403,22 +904,38 @@ def chat():
 
 @app.route('/api/context/<session_id>', methods=['GET'])
 def get_context(session_id):
-    """Get conversation context for a session"""
+    """Get conversation context for a session (?since=<time>&limit=<n> for recent turns)"""
     try:
-        if session_id not in chat_contexts:
+        try:
+            since = parse_timestamp(request.args.get('since'))
+            limit = parse_limit(request.args.get('limit'), None, None)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        context = chat_contexts.get(session_id)
+        if context is None:
             return jsonify({
                 'success': False,
                 'error': 'Session not found'
             }), 404
         
-        context = chat_contexts[session_id]
+        # Newest turns after `since`, at most `limit` of them
+        history = context.history
+        if since is not None:
+            history = [turn for turn in history if turn.timestamp > since]
+        if limit is not None:
+            history = history[-limit:]
         
         return jsonify({
             'success': True,
             'session_id': session_id,
-            'history': context['history'],
-            'message_count': len(context['history']),
-            'created_at': context.get('created_at'),
+            'history': [turn.to_dict() for turn in history],
+            'summary': context.digest,
+            'message_count': len(context.history),
+            'created_at': iso(context.created_at),
             'timestamp': datetime.now().isoformat()
         })
         
@@ -432,8 +949,9 @@ def get_context(session_id):
 def clear_context(session_id):
     """Clear conversation context for a session"""
     try:
-        if session_id in chat_contexts:
-            del chat_contexts[session_id]
+        if chat_contexts.delete(session_id):
+            if turn_log is not None:
+                turn_log.delete(session_id)
             return jsonify({
                 'success': True,
                 'message': 'Context cleared successfully',
@@ -454,21 +972,28 @@ def clear_context(session_id):
 
 @app.route('/api/sessions', methods=['GET'])
 def list_sessions():
-    """List all active sessions"""
+    """List active sessions, most recent first (?limit, cursor, active_since, min_messages)"""
     try:
-        sessions = []
-        for session_id, context in chat_contexts.items():
-            sessions.append({
-                'session_id': session_id,
-                'message_count': len(context['history']),
-                'created_at': context.get('created_at'),
-                'last_activity': context['history'][-1]['timestamp'] if context['history'] else context.get('created_at')
-            })
+        try:
+            limit = parse_limit(request.args.get('limit'), SESSIONS_PAGE_SIZE, SESSIONS_MAX_PAGE_SIZE)
+            contexts, next_cursor = chat_contexts.page(
+                limit,
+                cursor=request.args.get('cursor') or None,
+                active_since=parse_timestamp(request.args.get('active_since')),
+                min_messages=int(request.args.get('min_messages', 0))
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         return jsonify({
             'success': True,
-            'sessions': sessions,
-            'total_sessions': len(sessions),
+            'sessions': [context.summary() for context in contexts],
+            'next_cursor': next_cursor,
+            'total_sessions': len(chat_contexts),
+            'store': chat_contexts.stats(),
             'timestamp': datetime.now().isoformat()
         })
         
@@ -504,9 +1029,15 @@ def api_docs():
         'endpoints': {
             'GET /api/health': 'Health check',
             'POST /api/chat': 'Chat with Thaplu',
-            'GET /api/context/<session_id>': 'Get conversation context',
+            'POST /api/chat/stream': 'Chat with Thaplu, streamed as Server-Sent Events (start/chunk/done/error)',
+            'POST /api/chat/batch': 'Bulk chat: {items: [{session_id, message}]}, results streamed as NDJSON',
+            'GET /api/context/<session_id>': 'Get conversation context and rolling summary (?since=<time>&limit=<n>)',
             'DELETE /api/context/<session_id>': 'Clear conversation context',
-            'GET /api/sessions': 'List all active sessions'
+            'GET /api/sessions': 'List active sessions, newest first (?limit, cursor, active_since, min_messages)',
+            'GET /api/metrics': 'Prometheus metrics',
+            'GET /api/cluster': 'Cluster nodes, or the node owning a session (?session_id=<id>)',
+            'GET /api/debug/slow': 'Slow requests with their stage breakdown (TRACE_REQUESTS=1)',
+            'GET /api/debug/profile': 'Hot paths of profiled requests (X-Profile: 1 or TRACE_PROFILE_RATE)'
         },
         'improvements': [
             'Sentiment detection for contextual responses',
@@ -548,5 +1079,9 @@ if __name__ == '__main__':
     print("   ✓ Context-aware flavoring")
     print("   ✓ Sentiment-based responses")
     print("   ✓ Context memory (10 exchanges)")
+    print("   ✓ Streaming responses (SSE)")
+    print("   ✓ Token-bucket rate limiting (per key + per session)")
+    print("   ✓ Async serving mode: uvicorn asgi_app:app")
+    print("   ✓ Production: gunicorn -c gunicorn.conf.py wsgi:app")
     print("=" * 60)
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Per-session ordering of chat turns.
+
+Two requests for the same session must not both read the history, both
+call the model and then race to append: the second one would answer
+without seeing the first exchange. The sequencer lets one request per
+session run at a time and hands the session to waiters in arrival
+order, while different sessions never wait on each other. State exists
+only for sessions with a request in flight.
+
+Policies for a message that arrives while another is in flight:
+  queue     wait (FIFO, bounded) for the earlier ones to finish
+  reject    fail straight away with SessionBusy
+  coalesce  an identical message shares the in-flight result instead of
+            adding a duplicate turn; different messages queue
+"""
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeout
+
+POLICY_QUEUE = 'queue'
+POLICY_REJECT = 'reject'
+POLICY_COALESCE = 'coalesce'
+
+
+class SessionBusy(Exception):
+    """Raised when a session cannot take another message right now"""
+
+    def __init__(self, session_id, reason='in_flight'):
+        super().__init__(f"Session {session_id} is busy ({reason})")
+        self.session_id = session_id
+        self.reason = reason
+
+
+class _Session:
+    """In-flight state of one session"""
+
+    __slots__ = ('message', 'result', 'waiters')
+
+    def __init__(self, message):
+        self.message = message
+        # Result of the in-flight message, for coalesced duplicates
+        self.result = Future() if message is not None else None
+        self.waiters = deque()
+
+
+class SessionSequencer:
+    """One request at a time per session, in arrival order"""
+
+    def __init__(self, policy=POLICY_QUEUE, max_wait=30.0, max_queue=8):
+        if policy not in (POLICY_QUEUE, POLICY_REJECT, POLICY_COALESCE):
+            raise ValueError(f"Unknown session policy: {policy}")
+        self.policy = policy
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def _enter(self, session_id, message):
+        """Claim the session; return (ticket to wait on or None, shared result or None)"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                self._sessions[session_id] = _Session(message)
+                return None, None
+
+            if (self.policy == POLICY_COALESCE and message is not None
+                    and state.message == message and state.result is not None):
+                self.coalesced += 1
+                return None, state.result
+
+            if self.policy == POLICY_REJECT:
+                self.rejected += 1
+                raise SessionBusy(session_id)
+            if len(state.waiters) >= self.max_queue:
+                self.rejected += 1
+                raise SessionBusy(session_id, 'queue_full')
+
+            ticket = Future()
+            state.waiters.append((ticket, message))
+            self.queued += 1
+            return ticket, None
+
+    def _abandon(self, session_id, ticket):
+        """Give up waiting; return False if the session was handed over meanwhile"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            for entry in state.waiters if state else ():
+                if entry[0] is ticket:
+                    state.waiters.remove(entry)
+                    self.timeouts += 1
+                    return True
+            return False
+
+    def release(self, session_id, result=None, error=None):
+        """Publish the finished request's result and hand the session to the next waiter"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return
+            finished = state.result
+            if state.waiters:
+                ticket, message = state.waiters.popleft()
+                state.message = message
+                state.result = Future() if message is not None else None
+                ticket.set_result(None)
+            else:
+                del self._sessions[session_id]
+
+        if finished is not None:
+            if error is None:
+                finished.set_result(result)
+            elif isinstance(error, Exception):
+                finished.set_exception(error)
+            else:
+                finished.cancel()
+
+    def _wait(self, session_id, ticket):
+        try:
+            ticket.result(timeout=self.max_wait)
+        except FutureTimeout:
+            if self._abandon(session_id, ticket):
+                raise SessionBusy(session_id, 'timeout')
+
+    async def _wait_async(self, session_id, ticket):
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(ticket)), self.max_wait)
+        except asyncio.TimeoutError:
+            if self._abandon(session_id, ticket):
+                raise SessionBusy(session_id, 'timeout')
+        except asyncio.CancelledError:
+            # Cancelled while waiting: leave the queue, or pass the session on if it was ours
+            if not self._abandon(session_id, ticket):
+                self.release(session_id)
+            raise
+
+    def acquire(self, session_id):
+        """Wait for the session (blocking); the caller must release() it"""
+        ticket, _ = self._enter(session_id, None)
+        if ticket is not None:
+            self._wait(session_id, ticket)
+
+    async def acquire_async(self, session_id):
+        """Async twin of acquire()"""
+        ticket, _ = self._enter(session_id, None)
+        if ticket is not None:
+            await self._wait_async(session_id, ticket)
+
+    def run(self, session_id, message, func):
+        """Run func() as the session's next turn; coalesced duplicates get the shared result"""
+        ticket, shared = self._enter(session_id, message)
+        if shared is not None:
+            try:
+                return shared.result(timeout=self.max_wait)
+            except (FutureTimeout, CancelledError):
+                raise SessionBusy(session_id, 'timeout')
+        if ticket is not None:
+            self._wait(session_id, ticket)
+
+        try:
+            result = func()
+        except BaseException as e:
+            self.release(session_id, error=e)
+            raise
+        self.release(session_id, result)
+        return result
+
+    async def run_async(self, session_id, message, func):
+        """Async twin of run(); func is an async callable"""
+        ticket, shared = self._enter(session_id, message)
+        if shared is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(shared)), self.max_wait)
+            except asyncio.TimeoutError:
+                raise SessionBusy(session_id, 'timeout')
+            except asyncio.CancelledError:
+                if shared.cancelled():
+                    raise SessionBusy(session_id, 'timeout')
+                raise
+        if ticket is not None:
+            await self._wait_async(session_id, ticket)
+
+        try:
+            result = await func()
+        except BaseException as e:
+            self.release(session_id, error=e)
+            raise
+        self.release(session_id, result)
+        return result
+
+    def stats(self):
+        """Sequencing counters"""
+        return {
+            'policy': self.policy,
+            'in_flight': len(self._sessions),
+            'max_wait': self.max_wait,
+            'max_queue': self.max_queue,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts
+        }
+
+
+def session_sequencer_from_env():
+    """Build the sequencer from environment variables"""
+    return SessionSequencer(
+        policy=os.getenv('SESSION_POLICY', POLICY_QUEUE),
+        max_wait=float(os.getenv('SESSION_MAX_WAIT', '30')),
+        max_queue=int(os.getenv('SESSION_MAX_QUEUE', '8')),
+    )
@@ -0,0 +1,788 @@
+"""
+Session store for chat contexts.
+
+Sessions live in an LRU-ordered dict capped by count and approximate size,
+and expire after a TTL of inactivity. Eviction counters are kept for the
+API. A sorted index by last activity makes paged listing cost proportional
+to the page, not to the number of sessions. An optional SQLite persistence layer writes sessions behind the
+request path in batches, so evicted sessions can be reloaded and nothing
+is lost on restart.
+
+In cluster mode (CLUSTER_DB) the persistence is a shared, versioned
+SQLite table instead: writes go through immediately with a version check.
+Every get still reads the session's version from SQLite (one primary-key
+lookup); the local copy only saves loading and decoding the full record,
+which happens again when another node has written a newer version.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import datetime
+
+# Rough per-object overhead used for the max-bytes cap
+TURN_OVERHEAD = 120
+CONTEXT_OVERHEAD = 240
+
+
+def iso(timestamp):
+    """Format an epoch timestamp the way the API always has"""
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+def encode_cursor(last_activity, session_id):
+    """Opaque listing cursor for a position in the activity index"""
+    return base64.urlsafe_b64encode(f"{last_activity!r}:{session_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        last_activity, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':', 1)
+        return float(last_activity), session_id
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class Turn:
+    """One user/bot exchange"""
+
+    __slots__ = ('timestamp', 'user', 'bot', 'segment')
+
+    def __init__(self, timestamp, user, bot):
+        self.timestamp = timestamp
+        self.user = user
+        self.bot = bot
+        # Rendered prompt segment, filled in lazily by the prompt builder
+        self.segment = None
+
+    @property
+    def nbytes(self):
+        # Counted twice to cover the cached prompt segment
+        return 2 * (len(self.user) + len(self.bot)) + TURN_OVERHEAD
+
+    def to_dict(self):
+        return {'timestamp': iso(self.timestamp), 'user': self.user, 'bot': self.bot}
+
+
+class ChatContext:
+    """Conversation state for one session
+
+    turns_total counts every exchange ever stored; history holds the newest
+    of them. digest is a rolling summary of the first `digested` exchanges
+    (see summarizer.py).
+    """
+
+    __slots__ = ('session_id', 'created_at', 'last_activity', 'history', 'nbytes',
+                 'turns_total', 'digest', 'digested', 'version')
+
+    def __init__(self, session_id, created_at=None, history=None, turns_total=None,
+                 digest=None, digested=0):
+        self.session_id = session_id
+        self.created_at = created_at or time.time()
+        self.history = history or []
+        self.last_activity = self.history[-1].timestamp if self.history else self.created_at
+        self.turns_total = len(self.history) if turns_total is None else turns_total
+        self.digest = digest
+        self.digested = digested
+        # Version in a shared backend (0 = never stored there)
+        self.version = 0
+        self.nbytes = CONTEXT_OVERHEAD + sum(turn.nbytes for turn in self.history) + len(digest or '')
+
+    @property
+    def first_turn(self):
+        """Position of history[0] among all exchanges of the session"""
+        return self.turns_total - len(self.history)
+
+    def recent_history(self):
+        """History turns not yet folded into the digest"""
+        return self.history[max(0, self.digested - self.first_turn):]
+
+    def summary(self):
+        """Listing entry for /api/sessions"""
+        return {
+            'session_id': self.session_id,
+            'message_count': len(self.history),
+            'created_at': iso(self.created_at),
+            'last_activity': iso(self.last_activity)
+        }
+
+    def to_record(self):
+        """Compact JSON row for persistence"""
+        return json.dumps(
+            [self.created_at, [[t.timestamp, t.user, t.bot] for t in self.history],
+             self.turns_total, self.digest, self.digested],
+            ensure_ascii=False, separators=(',', ':')
+        )
+
+    @classmethod
+    def from_record(cls, session_id, record):
+        # Records written before digests existed only have the first two fields
+        created_at, turns, *digest = json.loads(record)
+        return cls(session_id, created_at, [Turn(*turn) for turn in turns], *digest)
+
+
+class StaleSession(Exception):
+    """Raised when a shared backend holds a newer version of the session"""
+
+    def __init__(self, session_id):
+        super().__init__(f"Session {session_id} was changed by another node")
+        self.session_id = session_id
+
+
+UPSERT_SESSION = 'INSERT OR REPLACE INTO sessions (session_id, updated, record) VALUES (?, ?, ?)'
+
+
+class SQLitePersistence:
+    """Write-behind SQLite persistence for sessions"""
+
+    # Only this process writes the sessions it holds
+    shared = False
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.writes = 0
+        self.flushes = 0
+        self.dropped = 0
+
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS sessions '
+            '(session_id TEXT PRIMARY KEY, updated REAL NOT NULL, record TEXT NOT NULL)'
+        )
+        self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+        self._thread.start()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, context):
+        """Queue a session for writing (latest version wins)"""
+        with self._lock:
+            self._pending[context.session_id] = (context.last_activity, context.to_record())
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def delete(self, session_id):
+        """Queue a session for deletion"""
+        with self._lock:
+            self._pending[session_id] = None
+        self._wakeup.set()
+
+    def load(self, session_id):
+        """Load a session, or None; pending writes are seen first"""
+        with self._lock:
+            if session_id in self._pending:
+                pending = self._pending[session_id]
+                return None if pending is None else ChatContext.from_record(session_id, pending[1])
+        row = self._conn().execute(
+            'SELECT record FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return ChatContext.from_record(session_id, row[0]) if row else None
+
+    def flush(self):
+        """Write all pending changes in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        upserts = [(sid, row[0], row[1]) for sid, row in pending.items() if row is not None]
+        deletes = [(sid,) for sid, row in pending.items() if row is None]
+        conn = self._conn()
+        try:
+            with conn:
+                if upserts:
+                    conn.executemany(UPSERT_SESSION, upserts)
+                if deletes:
+                    conn.executemany('DELETE FROM sessions WHERE session_id = ?', deletes)
+        except (ValueError, sqlite3.InterfaceError):
+            # A row SQLite cannot store (e.g. text with a lone surrogate) failed the batch
+            upserts = self._write_rows(conn, upserts, deletes)
+        self.writes += len(upserts) + len(deletes)
+        self.flushes += 1
+
+    def _write_rows(self, conn, upserts, deletes):
+        """Write a batch row by row, dropping rows that cannot be stored; return the upserts written"""
+        written = []
+        with conn:
+            for row in upserts:
+                try:
+                    conn.execute(UPSERT_SESSION, row)
+                except (ValueError, sqlite3.InterfaceError) as e:
+                    self.dropped += 1
+                    print(f"⚠️ Session persistence dropped session {row[0][:64]!r}: {e}")
+                else:
+                    written.append(row)
+            if deletes:
+                conn.executemany('DELETE FROM sessions WHERE session_id = ?', deletes)
+        return written
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Session persistence flush failed: {e}")
+
+    def after_fork(self):
+        """Give a forked worker its own connection and writer thread"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the writer and flush what is left"""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+
+class SharedSQLiteSessions:
+    """Sessions shared by several nodes on one host through one SQLite file
+
+    Writes go through immediately and only succeed against the version the
+    writer read (optimistic concurrency); readers compare versions to tell
+    whether their local copy is still current. Rows expire by their own
+    `updated` time: no node's local view of a session decides that for
+    the others.
+    """
+
+    shared = True
+
+    def __init__(self, path, ttl=0, expire_interval=60.0):
+        self.path = path
+        # 0 = rows never expire
+        self.ttl = ttl
+        self.expire_interval = expire_interval
+        self._local = threading.local()
+        self._expired_at = time.time()
+        self.reads = 0
+        self.writes = 0
+        self.conflicts = 0
+        self.expired = 0
+
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS cluster_sessions '
+            '(session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, updated REAL NOT NULL, record TEXT NOT NULL)'
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def version(self, session_id):
+        """Stored version of a session, or None if it is not stored"""
+        row = self._conn().execute(
+            'SELECT version FROM cluster_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, session_id):
+        """Load a session, or None"""
+        row = self._conn().execute(
+            'SELECT version, record FROM cluster_sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.reads += 1
+        context = ChatContext.from_record(session_id, row[1])
+        context.version = row[0]
+        return context
+
+    def save(self, context):
+        """Store a session if nobody wrote it since it was read; raises StaleSession otherwise"""
+        context.version = self.save_record(context.session_id, context.version, context.last_activity,
+                                           context.to_record())
+
+    def save_record(self, session_id, version, updated, record):
+        """Store a serialized session read at `version`; return its new version or raise StaleSession"""
+        conn = self._conn()
+        if version == 0:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO cluster_sessions (session_id, version, updated, record) VALUES (?, 1, ?, ?)',
+                (session_id, updated, record)
+            )
+        else:
+            cursor = conn.execute(
+                'UPDATE cluster_sessions SET version = version + 1, updated = ?, record = ? '
+                'WHERE session_id = ? AND version = ?',
+                (updated, record, session_id, version)
+            )
+        if cursor.rowcount != 1:
+            self.conflicts += 1
+            raise StaleSession(session_id)
+        self.writes += 1
+        self.expire()
+        return version + 1
+
+    def expire(self, force=False):
+        """Delete rows idle longer than the TTL (at most once per expire_interval)"""
+        now = time.time()
+        if not self.ttl or (not force and now - self._expired_at < self.expire_interval):
+            return
+        self._expired_at = now
+        cursor = self._conn().execute('DELETE FROM cluster_sessions WHERE updated < ?', (now - self.ttl,))
+        self.expired += cursor.rowcount
+
+    def expire_session(self, session_id):
+        """Delete one session's row if it is idle past the TTL (by its own stored time)"""
+        if not self.ttl:
+            return
+        cursor = self._conn().execute(
+            'DELETE FROM cluster_sessions WHERE session_id = ? AND updated < ?',
+            (session_id, time.time() - self.ttl)
+        )
+        self.expired += cursor.rowcount
+
+    def delete(self, session_id):
+        self._conn().execute('DELETE FROM cluster_sessions WHERE session_id = ?', (session_id,))
+
+    def after_fork(self):
+        """Give a forked worker its own connection"""
+        self._local = threading.local()
+
+    def close(self):
+        pass
+
+
+class SessionStore:
+    """Bounded LRU + TTL store of ChatContext objects
+
+    With a shared backend, its reads and writes run outside the store-wide
+    lock so sessions never wait on each other's SQLite I/O. A per-session
+    stripe lock keeps one session's read-modify-write in order, and a
+    version conflict with another node is retried by append_turn.
+    """
+
+    WRITE_STRIPES = 64
+
+    def __init__(self, max_sessions=10000, max_bytes=64 * 1024 * 1024, ttl=86400,
+                 history_limit=10, persistence=None, digest_backlog=0):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.history_limit = history_limit
+        self.persistence = persistence
+        # Extra turns kept past history_limit while they wait to be summarized
+        self.digest_backlog = digest_backlog
+
+        self._sessions = OrderedDict()
+        # (last_activity, session_id), ascending
+        self._by_activity = []
+        self._lock = threading.RLock()
+        self._shared = persistence is not None and persistence.shared
+        self._stripes = [threading.Lock() for _ in range(self.WRITE_STRIPES)]
+        self.nbytes = 0
+        self.evictions = {'lru': 0, 'ttl': 0}
+        self.created = 0
+        self.loaded = 0
+        # Bumped by delete(); a load racing a delete must not bring the session back
+        self._deletes = 0
+        # Local copies dropped because another node wrote the session
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def _expired(self, context, now):
+        return self.ttl and now - context.last_activity > self.ttl
+
+    def _insert(self, context):
+        self._sessions[context.session_id] = context
+        insort(self._by_activity, (context.last_activity, context.session_id))
+        self.nbytes += context.nbytes
+        self._evict()
+
+    def _unindex(self, context):
+        entry = (context.last_activity, context.session_id)
+        i = bisect_left(self._by_activity, entry)
+        if i < len(self._by_activity) and self._by_activity[i] == entry:
+            del self._by_activity[i]
+
+    def _evict(self):
+        """Drop expired sessions, then least recently used ones over the caps"""
+        now = time.time()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if self._expired(oldest, now):
+                self._remove(oldest.session_id)
+                self.evictions['ttl'] += 1
+                # A shared row may have been kept alive by another node; it expires on its own
+                if self.persistence and not self.persistence.shared:
+                    self.persistence.delete(oldest.session_id)
+            elif len(self._sessions) > self.max_sessions or self.nbytes > self.max_bytes:
+                self._remove(oldest.session_id)
+                self.evictions['lru'] += 1
+            else:
+                break
+
+    def _remove(self, session_id):
+        context = self._sessions.pop(session_id)
+        self._unindex(context)
+        self.nbytes -= context.nbytes
+        return context
+
+    def _stripe(self, session_id):
+        """Lock ordering one session's writes to the shared backend"""
+        return self._stripes[hash(session_id) % len(self._stripes)]
+
+    def _get_shared(self, session_id):
+        """get() for a shared backend: checks the stored version, reloads the record only when it changed"""
+        version = self.persistence.version(session_id)
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is not None and (context.version or None) != version:
+                self._remove(session_id)
+                self.invalidations += 1
+                context = None
+        if context is None and version is not None:
+            loaded = self.persistence.load(session_id)
+            with self._lock:
+                context = self._sessions.get(session_id)
+                # A racing load may have put in the same or a newer version
+                if loaded is not None and (context is None or context.version < loaded.version):
+                    if context is not None:
+                        self._remove(session_id)
+                    self.loaded += 1
+                    self._insert(loaded)
+                    context = loaded
+        if context is None:
+            return None
+
+        with self._lock:
+            expired = self._expired(context, time.time())
+            resident = self._sessions.get(session_id) is context
+            if expired and resident:
+                self._remove(session_id)
+                self.evictions['ttl'] += 1
+            elif resident:
+                self._sessions.move_to_end(session_id)
+        if expired:
+            # Clear the way for a fresh session unless another node revived it
+            self.persistence.expire_session(session_id)
+            return None
+        return context
+
+    def _load(self, session_id):
+        """Load a session from persistence into the store; return it or None
+
+        The load runs outside the store lock, so other sessions never wait
+        on SQLite.
+        """
+        while True:
+            with self._lock:
+                context = self._sessions.get(session_id)
+                deletes = self._deletes
+            if context is not None:
+                return context
+            loaded = self.persistence.load(session_id)
+            with self._lock:
+                context = self._sessions.get(session_id)
+                if context is not None or loaded is None:
+                    return context
+                # A delete while we were loading may have removed this session: load again
+                if deletes == self._deletes:
+                    self.loaded += 1
+                    self._insert(loaded)
+                    return loaded
+
+    def get(self, session_id):
+        """Return the context for a session, or None"""
+        if self._shared:
+            return self._get_shared(session_id)
+        with self._lock:
+            context = self._sessions.get(session_id)
+        if context is None and self.persistence:
+            context = self._load(session_id)
+        if context is None:
+            return None
+
+        with self._lock:
+            resident = self._sessions.get(session_id) is context
+            if resident and self._expired(context, time.time()):
+                self._remove(session_id)
+                self.evictions['ttl'] += 1
+                if self.persistence:
+                    self.persistence.delete(session_id)
+                return None
+            if resident:
+                self._sessions.move_to_end(session_id)
+                return context
+        # Evicted or deleted in between: look it up again
+        return self.get(session_id)
+
+    def get_or_create(self, session_id):
+        """Return the context for a session, creating it if needed"""
+        context = self.get(session_id)
+        if context is not None:
+            return context
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None:
+                context = ChatContext(session_id)
+                self.created += 1
+                self._insert(context)
+            return context
+
+    def restore(self, context):
+        """Insert a context rebuilt elsewhere (e.g. from the turn log), replacing a resident one"""
+        with self._lock:
+            if context.session_id in self._sessions:
+                self._remove(context.session_id)
+            self._insert(context)
+
+    def append_turn(self, session_id, user_msg, bot_response, attempts=3):
+        """Record an exchange, keeping the last history_limit turns"""
+        for attempt in range(attempts):
+            try:
+                return self._append_turn(session_id, user_msg, bot_response)
+            except StaleSession:
+                # Another node wrote the session meanwhile: reload it and append again
+                with self._lock:
+                    if session_id in self._sessions:
+                        self._remove(session_id)
+                    self.invalidations += 1
+                if attempt == attempts - 1:
+                    raise
+
+    def _save_shared(self, context, snapshot):
+        """Write a (version, updated, record) snapshot taken under the store lock"""
+        version, updated, record = snapshot
+        stored = self.persistence.save_record(context.session_id, version, updated, record)
+        with self._lock:
+            if context.version == version:
+                context.version = stored
+
+    def _append_turn(self, session_id, user_msg, bot_response):
+        if not self._shared:
+            context = self.get_or_create(session_id)
+            with self._lock:
+                if self._sessions.get(session_id) is not context:
+                    context = self.get_or_create(session_id)
+                return self._add_turn(context, user_msg, bot_response)
+
+        with self._stripe(session_id):
+            context = self.get_or_create(session_id)
+            with self._lock:
+                if self._sessions.get(session_id) is not context:
+                    # Evicted in between (rare): look it up again
+                    context = self.get_or_create(session_id)
+                self._add_turn(context, user_msg, bot_response)
+                snapshot = (context.version, context.last_activity, context.to_record())
+            self._save_shared(context, snapshot)
+            return context
+
+    def _add_turn(self, context, user_msg, bot_response):
+        """Append an exchange to a resident context"""
+        session_id = context.session_id
+        with self._lock:
+            turn = Turn(time.time(), user_msg, bot_response)
+            context.history.append(turn)
+            context.turns_total += 1
+            self._unindex(context)
+            context.last_activity = turn.timestamp
+            insort(self._by_activity, (context.last_activity, session_id))
+            added = turn.nbytes
+
+            keep = self.history_limit
+            if self.digest_backlog:
+                undigested = context.turns_total - context.digested
+                keep = max(keep, min(undigested, keep + self.digest_backlog))
+            if len(context.history) > keep:
+                dropped = context.history[:-keep]
+                del context.history[:-keep]
+                added -= sum(t.nbytes for t in dropped)
+
+            context.nbytes += added
+            self.nbytes += added
+            if self.persistence and not self._shared:
+                self.persistence.save(context)
+            self._evict()
+            return context
+
+    def digest_work(self, session_id, keep_recent, min_turns=1):
+        """(digest, digested, turns, through) to fold for a session, or None if nothing is due.
+
+        turns are the stored exchanges after the digest, except the newest
+        keep_recent, which the prompt still shows verbatim; the new digest
+        covers the first `through` exchanges.
+        """
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None:
+                return None
+            start = max(context.digested, context.first_turn)
+            end = context.turns_total - keep_recent
+            if end - start < max(min_turns, 1):
+                return None
+            first = context.first_turn
+            return context.digest, context.digested, context.history[start - first:end - first], end
+
+    def set_digest(self, session_id, digest, digested_before, digested):
+        """Store a new digest unless the session changed underneath; return whether it was stored"""
+        if not self._shared:
+            with self._lock:
+                context = self._set_digest(session_id, digest, digested_before, digested)
+                if context is not None and self.persistence:
+                    self.persistence.save(context)
+                return context is not None
+        with self._stripe(session_id):
+            with self._lock:
+                context = self._set_digest(session_id, digest, digested_before, digested)
+                if context is None:
+                    return False
+                snapshot = (context.version, context.last_activity, context.to_record())
+            try:
+                self._save_shared(context, snapshot)
+            except StaleSession:
+                with self._lock:
+                    if self._sessions.get(session_id) is context:
+                        self._remove(session_id)
+                    self.invalidations += 1
+                return False
+            return True
+
+    def _set_digest(self, session_id, digest, digested_before, digested):
+        """Apply a digest to the resident context; return it, or None if the session changed"""
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None or context.digested != digested_before:
+                return None
+            added = len(digest) - len(context.digest or '')
+            context.digest = digest
+            context.digested = digested
+            context.nbytes += added
+            self.nbytes += added
+
+            # Turns held back for the summarizer can go now
+            excess = len(context.history) - max(self.history_limit, context.turns_total - digested)
+            if excess > 0:
+                freed = sum(t.nbytes for t in context.history[:excess])
+                del context.history[:excess]
+                context.nbytes -= freed
+                self.nbytes -= freed
+            return context
+
+    def delete(self, session_id):
+        """Delete a session; return whether it existed"""
+        if self._shared:
+            with self._stripe(session_id):
+                existed = self.get(session_id) is not None
+                with self._lock:
+                    if session_id in self._sessions:
+                        self._remove(session_id)
+                if existed:
+                    self.persistence.delete(session_id)
+                return existed
+        existed = self.get(session_id) is not None
+        with self._lock:
+            self._deletes += 1
+            if session_id in self._sessions:
+                self._remove(session_id)
+            if existed and self.persistence:
+                self.persistence.delete(session_id)
+        return existed
+
+    def sessions(self):
+        """Snapshot of resident sessions, least recently used first"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def page(self, limit=50, cursor=None, active_since=None, min_messages=0):
+        """Most recently active sessions first, resuming after `cursor`.
+
+        Returns (contexts, next_cursor); next_cursor is None on the last page.
+        Scanning stops at the first session older than `active_since`.
+        """
+        with self._lock:
+            entries = self._by_activity
+            i = (len(entries) if cursor is None else bisect_left(entries, decode_cursor(cursor))) - 1
+            now = time.time()
+            contexts = []
+            while i >= 0 and len(contexts) < limit:
+                last_activity, session_id = entries[i]
+                if active_since is not None and last_activity < active_since:
+                    return contexts, None
+                context = self._sessions[session_id]
+                if len(context.history) >= min_messages and not self._expired(context, now):
+                    contexts.append(context)
+                i -= 1
+
+            if i < 0 or (active_since is not None and entries[i][0] < active_since):
+                return contexts, None
+            return contexts, encode_cursor(*entries[i + 1])
+
+    def stats(self):
+        """Store counters"""
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'created': self.created,
+            'loaded': self.loaded,
+            'invalidations': self.invalidations,
+            'evictions': dict(self.evictions),
+            'persistence': type(self.persistence).__name__ if self.persistence else None
+        }
+
+    def after_fork(self):
+        """Reset per-process state in a forked worker"""
+        self._lock = threading.RLock()
+        self._stripes = [threading.Lock() for _ in range(self.WRITE_STRIPES)]
+        if self.persistence:
+            self.persistence.after_fork()
+
+    def close(self):
+        """Flush persistence"""
+        if self.persistence:
+            self.persistence.close()
+
+
+def session_store_from_env():
+    """Build the session store from environment variables"""
+    db_path = os.getenv('SESSION_DB')
+    cluster_db = os.getenv('CLUSTER_DB')
+    ttl = float(os.getenv('SESSION_TTL', '86400'))
+    if cluster_db:
+        persistence = SharedSQLiteSessions(cluster_db, ttl=ttl)
+    else:
+        persistence = SQLitePersistence(db_path) if db_path else None
+    return SessionStore(
+        max_sessions=int(os.getenv('SESSION_MAX', '10000')),
+        max_bytes=int(os.getenv('SESSION_MAX_BYTES', str(64 * 1024 * 1024))),
+        ttl=ttl,
+        persistence=persistence,
+    )
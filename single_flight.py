@@ -0,0 +1,115 @@
+"""
+Single-flight coalescing of identical in-flight upstream calls.
+
+When several requests build exactly the same prompt at the same time
+(frontend retries, everyone saying "hi" at once), only the first one
+calls the model; the others wait for its result. Each requester still
+flavors and stores the response for its own session. A follower that
+waits longer than max_wait, or whose leader was cancelled, makes its
+own call instead.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeout
+
+
+class SingleFlight:
+    """Share one call between concurrent callers with the same key"""
+
+    def __init__(self, max_wait=30.0):
+        self.max_wait = max_wait
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self):
+        return self.max_wait > 0
+
+    def _join(self, key):
+        """Return (future, is_leader) for a key"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+                return future, True
+            self.coalesced += 1
+            return future, False
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # Leader cancelled or interrupted: followers fall back to their own call
+            future.cancel()
+
+    def do(self, key, func):
+        """Run func() once for all concurrent callers with this key"""
+        if key is None or not self.enabled:
+            return func()
+
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.max_wait)
+            except (FutureTimeout, CancelledError):
+                self.fallbacks += 1
+                return func()
+
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key, func):
+        """Async twin of do(); func is an async callable"""
+        if key is None or not self.enabled:
+            return await func()
+
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Only fall back if the leader was cancelled, not this task
+                if not future.cancelled():
+                    raise
+            self.fallbacks += 1
+            return await func()
+
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self):
+        """Coalescing counters"""
+        return {
+            'enabled': self.enabled,
+            'in_flight': len(self._calls),
+            'max_wait': self.max_wait,
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'fallbacks': self.fallbacks
+        }
+
+
+def single_flight_from_env():
+    """Build the coalescing layer from environment variables (SINGLE_FLIGHT_MAX_WAIT=0 disables)"""
+    return SingleFlight(max_wait=float(os.getenv('SINGLE_FLIGHT_MAX_WAIT', '30')))
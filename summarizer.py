@@ -0,0 +1,168 @@
+"""
+Rolling conversation summaries.
+
+The prompt shows only the newest few turns. Without summaries, older
+turns just fall out of the window (and out of the store after
+history_limit). Once enough turns have left the prompt window, a
+background worker folds them and the previous summary into a new compact
+summary, using the same upstream pool. The prompt then carries that
+summary in place of the old raw turns, so prompt size stays flat while
+long sessions keep their context.
+
+All of this runs on the summarizer's own pool. A chat request only checks
+a counter and maybe submits a job, so it never waits on a summary.
+Summary calls are background calls: they never wait for a rate-limit
+token and only run while the API key has tokens to spare, so they do
+not take chats' budget. A summary that is deferred for lack of tokens,
+or that fails, is retried on the session's next turn.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_policy import fast_tier_configured
+from rate_limiter import RateLimitExceeded
+
+SUMMARY_PROMPT = """You keep a short running summary of a chat between a user and Thaplu, their caring Hinglish-speaking friend.
+Update the summary with the new exchanges below. Keep what matters for later replies: who the user is, facts they shared, how they are feeling, problems discussed, advice given and anything promised. Drop small talk.
+Write plain text, at most {words} words, no preamble.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}
+
+Updated summary:"""
+
+
+class ConversationSummarizer:
+    """Folds turns that left the prompt window into each session's digest"""
+
+    def __init__(self, store, generate, keep_recent=5, trigger_turns=4, max_words=150,
+                 max_output_tokens=400, workers=2, enabled=True):
+        self.enabled = enabled
+        self.store = store
+        # generate(prompt, **kwargs) -> text; the server passes its upstream pool
+        self.generate = generate
+        # Turns the prompt still shows verbatim are never summarized
+        self.keep_recent = keep_recent
+        # Summarize once this many turns have left the prompt window
+        self.trigger_turns = trigger_turns
+        self.max_words = max_words
+        self.generation_kwargs = {'generation_config': {'max_output_tokens': max_output_tokens},
+                                  'tier': 'fast', 'background': True}
+        self.workers = workers
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summarizer')
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.stale = 0
+        self.deferred = 0
+        self.turns_folded = 0
+        self.seconds = 0.0
+
+    def maybe_schedule(self, context):
+        """Queue a summary for the session if enough turns left the prompt window"""
+        if not self.enabled or context.turns_total - self.keep_recent - context.digested < self.trigger_turns:
+            return False
+        with self._lock:
+            if context.session_id in self._pending:
+                return False
+            self._pending.add(context.session_id)
+            self.scheduled += 1
+        self._executor.submit(self._run, context.session_id)
+        return True
+
+    def render(self, digest, turns):
+        """Summarization prompt for the previous digest plus new turns"""
+        lines = "\n".join(f"User: {turn.user}\nThaplu: {turn.bot}" for turn in turns)
+        return SUMMARY_PROMPT.format(words=self.max_words, summary=digest or "(none yet)", turns=lines)
+
+    def summarize(self, session_id, min_turns=1):
+        """Fold due turns into the session's digest now; return whether it changed"""
+        work = self.store.digest_work(session_id, self.keep_recent, min_turns)
+        if work is None:
+            return False
+        digest, digested, turns, through = work
+        start = time.perf_counter()
+        summary = self.generate(self.render(digest, turns), **self.generation_kwargs).strip()
+        elapsed = time.perf_counter() - start
+        if not summary:
+            # Cut off by the output cap: keep the old digest, try again on the next turn
+            with self._lock:
+                self.failed += 1
+            return False
+        stored = self.store.set_digest(session_id, summary, digested, through)
+        with self._lock:
+            self.seconds += elapsed
+            if stored:
+                self.completed += 1
+                self.turns_folded += len(turns)
+            else:
+                self.stale += 1
+        return stored
+
+    def _run(self, session_id):
+        try:
+            # Turns that arrived while a summary was being written are folded next
+            while self.summarize(session_id, self.trigger_turns):
+                pass
+        except RateLimitExceeded:
+            # No token to spare from chat traffic; try again on the next turn
+            with self._lock:
+                self.deferred += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"⚠️ Summary for session {session_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def stats(self):
+        """Summarizer counters"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'keep_recent': self.keep_recent,
+                'trigger_turns': self.trigger_turns,
+                'pending': len(self._pending),
+                'scheduled': self.scheduled,
+                'completed': self.completed,
+                'failed': self.failed,
+                'stale': self.stale,
+                'deferred': self.deferred,
+                'turns_folded': self.turns_folded,
+                'avg_ms': round(self.seconds / (self.completed + self.stale) * 1000, 1)
+                if self.completed + self.stale else None
+            }
+
+    def after_fork(self):
+        """Give a forked worker its own pool"""
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='summarizer')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Drop queued summaries; they are redone on the session's next turn"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def summarizer_from_env(store, generate, keep_recent=5):
+    """Build the summarizer from environment variables (SUMMARY_ENABLED=0 disables)"""
+    return ConversationSummarizer(
+        store,
+        generate,
+        keep_recent=keep_recent,
+        trigger_turns=int(os.getenv('SUMMARY_TRIGGER_TURNS', '4')),
+        max_words=int(os.getenv('SUMMARY_MAX_WORDS', '150')),
+        # A thinking model needs room beyond the summary itself
+        max_output_tokens=int(os.getenv('SUMMARY_MAX_TOKENS', '400' if fast_tier_configured() else '2048')),
+        workers=int(os.getenv('SUMMARY_WORKERS', '2')),
+        enabled=os.getenv('SUMMARY_ENABLED', '1') not in ('0', 'false', 'no'),
+    )
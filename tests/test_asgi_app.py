@@ -0,0 +1,33 @@
+import asyncio
+import json
+import threading
+
+import asgi_app
+import server
+from session_store import SQLitePersistence
+
+
+def test_parse_chat_request():
+    assert asgi_app.parse_chat_request(b'') == (None, None, 'No JSON data provided')
+    assert asgi_app.parse_chat_request(b'{"message": "  "}')[2] == 'Message is required'
+    assert asgi_app.parse_chat_request(b'{"message": " hi ", "session_id": 7}') == ('hi', '7', None)
+    body = json.dumps({'message': 'hi', 'session_id': 'x' * 1000}).encode()
+    assert 'session_id' in asgi_app.parse_chat_request(body)[2]
+
+
+def test_off_loop_moves_session_io_to_a_thread(tmp_path, monkeypatch):
+    def current_thread():
+        return threading.current_thread()
+
+    async def run():
+        return await asgi_app.off_loop(current_thread)
+
+    monkeypatch.setattr(server.chat_contexts, 'persistence', None)
+    assert asyncio.run(run()) is threading.main_thread()
+
+    persistence = SQLitePersistence(str(tmp_path / 'sessions.db'))
+    monkeypatch.setattr(server.chat_contexts, 'persistence', persistence)
+    try:
+        assert asyncio.run(run()) is not threading.main_thread()
+    finally:
+        persistence.close()
@@ -0,0 +1,201 @@
+import json
+import time
+import uuid
+
+import pytest
+
+import server
+import session_store
+from generation_policy import GenerationPolicySelector
+from upstream import UpstreamClient
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class Model:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        text = f'reply number {self.calls}'
+        if stream:
+            return iter([Reply(word + ' ') for word in text.split()])
+        return Reply(text)
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = Model()
+    monkeypatch.setattr(server.upstream, 'clients', [UpstreamClient('fake', model)])
+    monkeypatch.setattr(server.scheduler, 'session_burst', 100)
+    return model
+
+
+def new_session():
+    return f'test-{uuid.uuid4().hex}'
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_overlong_session_id_is_rejected(client):
+    response = client.post('/api/chat', json={'message': 'hi', 'session_id': 'x' * 70000})
+    assert response.status_code == 400
+    assert 'session_id' in response.get_json()['error']
+
+
+def test_request_session_id():
+    assert server.request_session_id(42) == '42'
+    assert len(server.request_session_id(None)) == 32
+    with pytest.raises(ValueError):
+        server.request_session_id('a\ud800')
+    with pytest.raises(ValueError):
+        server.request_session_id('x' * (server.MAX_SESSION_ID_LENGTH + 1))
+
+
+def test_batch_streams_one_result_per_item(client, model):
+    session = new_session()
+    items = [
+        {'session_id': session, 'message': f'first {session}'},
+        {'session_id': session, 'message': f'second {session}'},
+        {'message': f'alone {session}'},
+        {'session_id': session, 'message': 42},
+        {'session_id': 'x' * 1000, 'message': 'hi'},
+    ]
+    response = client.post('/api/chat/batch', json={'items': items})
+    assert response.status_code == 200
+    lines = ndjson(response)
+    results = {line['index']: line for line in lines if 'index' in line}
+    summary = lines[-1]
+
+    assert summary['done'] and summary['items'] == 5
+    assert (summary['succeeded'], summary['failed']) == (3, 2)
+    assert results[3]['error'] == 'Message is required'
+    assert 'session_id' in results[4]['error']
+    assert all(results[i]['success'] for i in (0, 1, 2))
+    # Items of one session run in order, each seeing the previous turn
+    history = server.chat_contexts.get(session).history
+    assert [turn.user for turn in history] == [f'first {session}', f'second {session}']
+
+
+def test_batch_rejects_bad_bodies(client):
+    assert client.post('/api/chat/batch', json={'items': []}).status_code == 400
+    too_many = [{'message': 'hi'}] * (server.BATCH_MAX_ITEMS + 1)
+    assert client.post('/api/chat/batch', json=too_many).status_code == 400
+
+
+def sse_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        event, data = block.split('\n', 1)
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+def test_stream_relays_chunks_then_stores_the_turn(client, model):
+    session = new_session()
+    response = client.post('/api/chat/stream', json={'session_id': session, 'message': f'hello {session}'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['X-Session-Id'] == session
+
+    events = sse_events(response)
+    names = [name for name, _ in events]
+    assert names[0] == 'start' and names[-1] == 'done'
+    assert set(names[1:-1]) == {'chunk'}
+    assert ''.join(payload['text'] for name, payload in events if name == 'chunk') == 'reply number 1 '
+    done = events[-1][1]
+    assert done['success'] and done['session_id'] == session
+    assert done['ttfb_ms'] is not None and done['ttfb_ms'] <= done['total_ms']
+    assert len(server.chat_contexts.get(session).history) == 1
+
+    # Closing the response hands the session on, so the next stream is admitted
+    response.close()
+    response = client.post('/api/chat/stream', json={'session_id': session, 'message': f'again {session}'})
+    assert sse_events(response)[-1][0] == 'done'
+    assert len(server.chat_contexts.get(session).history) == 2
+    response.close()
+
+
+def test_stream_reports_upstream_failure_as_error_event(client, monkeypatch):
+    class Broken:
+        def generate_content(self, prompt, **kwargs):
+            raise RuntimeError('upstream down')
+
+    monkeypatch.setattr(server.upstream, 'clients', [UpstreamClient('broken', Broken())])
+    session = new_session()
+    response = client.post('/api/chat/stream', json={'session_id': session, 'message': f'hello {session}'})
+    name, payload = sse_events(response)[-1]
+    response.close()
+    assert name == 'error'
+    assert not payload['success'] and payload['session_id'] == session
+    assert server.chat_contexts.get(session) is None or not server.chat_contexts.get(session).history
+
+
+def test_context_since_and_limit(client, monkeypatch):
+    session = new_session()
+    start = time.time()
+    for i in range(4):
+        monkeypatch.setattr(session_store.time, 'time', lambda i=i: start + i)
+        server.chat_contexts.append_turn(session, f'message {i}', 'reply')
+
+    def users(**params):
+        response = client.get(f'/api/context/{session}', query_string=params)
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['message_count'] == 4
+        return [turn['user'] for turn in body['history']]
+
+    assert users() == [f'message {i}' for i in range(4)]
+    assert users(limit=2) == ['message 2', 'message 3']
+    assert users(since=start + 1) == ['message 2', 'message 3']
+    assert users(since=start, limit=1) == ['message 3']
+    assert client.get(f'/api/context/{session}?limit=0').status_code == 400
+    assert client.get(f'/api/context/{session}?since=yesterday').status_code == 400
+    assert client.get(f'/api/context/{new_session()}').status_code == 404
+
+
+def test_sessions_pages_follow_the_cursor(client, monkeypatch):
+    # Newer than anything else in the shared store, so they make up the first page
+    start = time.time() + 3600
+    sessions = [new_session() for _ in range(3)]
+    for i, session in enumerate(sessions):
+        monkeypatch.setattr(session_store.time, 'time', lambda i=i: start + i)
+        server.chat_contexts.append_turn(session, 'hi', 'hello')
+
+    first = client.get('/api/sessions', query_string={'limit': 2}).get_json()
+    assert [summary['session_id'] for summary in first['sessions']] == sessions[:0:-1]
+    assert first['next_cursor']
+    second = client.get('/api/sessions', query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+    assert second['sessions'][0]['session_id'] == sessions[0]
+
+    recent = client.get('/api/sessions', query_string={'active_since': start + 1}).get_json()
+    assert [summary['session_id'] for summary in recent['sessions']] == sessions[:0:-1]
+    assert recent['next_cursor'] is None
+    assert client.get('/api/sessions?limit=-1').status_code == 400
+    assert client.get('/api/sessions?cursor=garbage').status_code == 400
+
+
+def test_empty_reply_is_retried_with_the_full_cap(monkeypatch):
+    caps = []
+
+    def generate(prompt, generation_config, tier):
+        caps.append(generation_config['max_output_tokens'])
+        return '' if len(caps) == 1 else 'hello'
+
+    selector = GenerationPolicySelector()
+    monkeypatch.setattr(server.upstream, 'generate', generate)
+    monkeypatch.setattr(server, 'generation_policy', selector)
+    assert server.generate_text(selector.policies['short'], f'prompt {new_session()}') == 'hello'
+    assert caps == [256, 4096]
+    assert selector.stats()['policies']['short']['truncated'] == 1
@@ -0,0 +1,53 @@
+import time
+
+import session_store
+from session_store import SessionStore, SharedSQLiteSessions
+
+
+def make_nodes(tmp_path, ttl):
+    path = str(tmp_path / 'cluster.db')
+    return [SessionStore(ttl=ttl, persistence=SharedSQLiteSessions(path, ttl=ttl)) for _ in range(2)]
+
+
+def test_local_expiry_keeps_a_row_another_node_refreshed(tmp_path, monkeypatch):
+    node_a, node_b = make_nodes(tmp_path, ttl=60)
+    start = time.time()
+    node_a.append_turn('s', 'hi', 'hello')
+    assert node_b.get('s') is not None
+
+    # Node A keeps the session active; node B's copy goes idle past the TTL
+    monkeypatch.setattr(session_store.time, 'time', lambda: start + 40)
+    node_a.append_turn('s', 'still there?', 'yes')
+    monkeypatch.setattr(session_store.time, 'time', lambda: start + 80)
+    node_b.get_or_create('other')
+
+    assert node_b.evictions['ttl'] == 1
+    context = node_b.get('s')
+    assert context is not None
+    assert [turn.user for turn in context.history] == ['hi', 'still there?']
+
+
+def test_idle_session_expires_for_every_node(tmp_path, monkeypatch):
+    node_a, node_b = make_nodes(tmp_path, ttl=60)
+    start = time.time()
+    node_a.append_turn('s', 'hi', 'hello')
+
+    monkeypatch.setattr(session_store.time, 'time', lambda: start + 120)
+    assert node_b.get('s') is None
+    assert node_a.persistence.version('s') is None
+    assert node_a.get('s') is None
+    assert node_b.get_or_create('s').history == []
+
+
+def test_expire_sweeps_idle_rows(tmp_path):
+    node_a, _ = make_nodes(tmp_path, ttl=60)
+    node_a.append_turn('old', 'hi', 'hello')
+    node_a.append_turn('new', 'hi', 'hello')
+    persistence = node_a.persistence
+    persistence._conn().execute(
+        'UPDATE cluster_sessions SET updated = ? WHERE session_id = ?', (time.time() - 120, 'old'))
+
+    persistence.expire(force=True)
+    assert persistence.version('old') is None
+    assert persistence.version('new') is not None
+    assert persistence.expired == 1
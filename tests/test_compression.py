@@ -0,0 +1,50 @@
+import gzip
+
+from flask import Flask, Response, jsonify
+
+import compression
+from compression import Compressor, parse_accept_encoding
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0.5, identity;q=0') == {'gzip': 1.0, 'br': 0.5, 'identity': 0.0}
+    assert parse_accept_encoding('GZIP;q=bogus') == {'gzip': 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+def test_negotiate_respects_q_values():
+    compressor = Compressor()
+    assert compressor.negotiate('gzip') == 'gzip'
+    assert compressor.negotiate('gzip;q=0') is None
+    assert compressor.negotiate('*') == compressor.encodings[0]
+    assert compressor.negotiate('*, gzip;q=0') == ('br' if 'br' in compressor.encodings else None)
+    assert compressor.negotiate('') is None
+    assert Compressor(min_size=-1).negotiate('gzip') is None
+
+
+def test_compress_response_only_large_complete_json():
+    compressor = Compressor(min_size=100)
+    app = Flask(__name__)
+
+    with app.app_context():
+        small = compressor.compress_response(jsonify(ok=True), 'gzip')
+        assert 'Content-Encoding' not in small.headers
+
+        big = compressor.compress_response(jsonify(text='x' * 1000), 'gzip')
+        assert big.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in big.vary
+        assert gzip.decompress(big.get_data()).startswith(b'{')
+
+        image = compressor.compress_response(Response(b'x' * 1000, mimetype='image/png'), 'gzip')
+        assert 'Content-Encoding' not in image.headers
+
+        stream = compressor.compress_response(Response(iter([b'x' * 1000]), mimetype='text/event-stream'), 'gzip')
+        assert stream.is_streamed and 'Content-Encoding' not in stream.headers
+
+    assert compressor.stats()['compressed'] == 1
+    assert compressor.stats()['ratio'] < 1
+
+
+def test_compressor_from_env(monkeypatch):
+    monkeypatch.setenv('COMPRESS_MIN_SIZE', '-1')
+    assert compression.compressor_from_env().negotiate('gzip') is None
@@ -0,0 +1,60 @@
+import pytest
+
+import generation_policy
+from generation_policy import GenerationPolicySelector, MODE_FIXED, parse_caps
+
+
+@pytest.fixture
+def selector():
+    return GenerationPolicySelector()
+
+
+def test_select_by_sentiment_length_and_depth(selector):
+    assert selector.select('greeting', 'hi', 0).name == 'short'
+    assert selector.select('greeting', 'hi ' * 20, 0).name == 'casual'
+    assert selector.select('neutral', 'ok cool', 0).name == 'casual'
+    assert selector.select('negative', 'bad day', 0).name == 'extended'
+    assert selector.select('neutral', 'ok cool', 6).name == 'extended'
+    assert selector.select('seeking_help', 'how?', 0).name == 'full'
+    assert selector.select('greeting', 'x' * 280, 0).name == 'full'
+    assert GenerationPolicySelector(mode=MODE_FIXED).select('greeting', 'hi', 0).name == 'full'
+
+
+def test_escalate_only_below_the_full_cap(selector):
+    assert selector.escalate(selector.policies['short']) is selector.policies['full']
+    assert selector.escalate(selector.policies['full']) is None
+    stats = selector.stats()['policies']
+    assert stats['short']['truncated'] == 1 and stats['full']['truncated'] == 1
+
+
+def test_record_tracks_latency_and_near_cap(selector):
+    short = selector.policies['short']
+    selector.record(short, 0.2, 'word ' * 2000)
+    selector.record(short, 0.4, 'hi')
+    stats = selector.stats()['policies']['short']
+    assert stats['requests'] == 2 and stats['near_cap'] == 1
+    assert stats['avg_ms'] == 300.0
+
+
+def test_parse_caps():
+    assert parse_caps('short=128, full = 8192,bogus') == {'short': 128, 'full': 8192}
+    assert parse_caps(None) == {}
+
+
+def test_without_fast_tier_every_policy_keeps_the_full_cap(monkeypatch):
+    monkeypatch.delenv('GEMINI_FAST_MODELS', raising=False)
+    monkeypatch.setenv('GENERATION_MAX_TOKENS', 'full=8192,short=512')
+    policies = generation_policy.generation_policy_from_env().policies
+    assert policies['short'].max_output_tokens == 512
+    assert {policies[name].max_output_tokens for name in ('casual', 'extended', 'full')} == {8192}
+    assert {policy.tier for policy in policies.values()} == {generation_policy.DEFAULT_TIER}
+
+
+def test_fast_tier_gets_small_caps(monkeypatch):
+    monkeypatch.setenv('GEMINI_FAST_MODELS', 'gemini-2.5-flash-lite')
+    monkeypatch.delenv('GENERATION_MAX_TOKENS', raising=False)
+    monkeypatch.delenv('GENERATION_FAST_TIER', raising=False)
+    policies = generation_policy.generation_policy_from_env().policies
+    assert (policies['short'].max_output_tokens, policies['short'].tier) == (256, generation_policy.FAST_TIER)
+    assert policies['short'].kwargs == {'generation_config': {'max_output_tokens': 256}, 'tier': 'fast'}
+    assert policies['full'].tier == generation_policy.DEFAULT_TIER
@@ -0,0 +1,73 @@
+import os
+import runpy
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from session_store import SessionStore, SQLitePersistence
+
+CONF = str(Path(__file__).resolve().parent.parent / 'gunicorn.conf.py')
+
+
+def load_conf(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path(CONF)
+
+
+def test_conf_defaults(monkeypatch):
+    for name in ('PORT', 'WEB_CONCURRENCY', 'GUNICORN_THREADS', 'GUNICORN_PRELOAD', 'GUNICORN_MAX_REQUESTS'):
+        monkeypatch.delenv(name, raising=False)
+    conf = load_conf(monkeypatch)
+    assert conf['bind'] == '0.0.0.0:5001'
+    assert conf['worker_class'] == 'gthread' and conf['threads'] == 16
+    assert 1 <= conf['workers'] <= 4
+    assert conf['preload_app'] is True
+    assert conf['max_requests'] == 0 and conf['max_requests_jitter'] == 0
+
+
+def test_conf_reads_environment(monkeypatch):
+    conf = load_conf(monkeypatch, PORT='8080', WEB_CONCURRENCY='2', GUNICORN_THREADS='4',
+                     GUNICORN_PRELOAD='no', GUNICORN_MAX_REQUESTS='1000')
+    assert conf['bind'] == '0.0.0.0:8080'
+    assert (conf['workers'], conf['threads']) == (2, 4)
+    assert conf['preload_app'] is False
+    assert conf['max_requests_jitter'] == 100
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or sys.platform == 'darwin', reason='needs fork')
+def test_forked_worker_gets_its_own_session_writer(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SessionStore(persistence=SQLitePersistence(path, flush_interval=0.05))
+    store.append_turn('parent', 'hi', 'hello')
+    store.persistence.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            store.after_fork()
+            store.append_turn('child', 'hi', 'hello')
+            # Exit without close(): only the child's own writer thread can save the turn
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                with sqlite3.connect(path) as conn:
+                    if conn.execute("SELECT 1 FROM sessions WHERE session_id = 'child'").fetchone():
+                        status = 0
+                        break
+                time.sleep(0.05)
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    store.close()
+
+    restarted = SessionStore(persistence=SQLitePersistence(path))
+    try:
+        assert restarted.get('parent') is not None
+        assert restarted.get('child') is not None
+    finally:
+        restarted.close()
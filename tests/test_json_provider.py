@@ -0,0 +1,30 @@
+import json
+from decimal import Decimal
+
+import pytest
+from flask import Flask, jsonify
+
+import json_provider
+
+
+def test_dumps_is_compact_and_keeps_unicode():
+    payload = {'text': 'ஹலோ 💙', 1: [1.5, None]}
+    assert json_provider.dumps(payload) == '{"text":"ஹலோ 💙","1":[1.5,null]}'
+    assert json_provider.dumps_bytes(payload) == json_provider.dumps(payload).encode()
+
+
+def test_dumps_uses_flask_defaults_for_other_types():
+    assert json.loads(json_provider.dumps({'price': Decimal('1.10')})) == {'price': '1.10'}
+
+
+@pytest.mark.skipif(json_provider.orjson is None, reason='orjson is not installed')
+def test_installed_provider_serves_responses():
+    app = Flask(__name__)
+    assert json_provider.install(app) == 'FastJSONProvider'
+    with app.app_context():
+        response = jsonify(success=True, items=[1, 2])
+        assert response.mimetype == 'application/json'
+        assert response.get_json() == {'success': True, 'items': [1, 2]}
+        # Stdlib options still work
+        assert app.json.dumps({'a': 1}, indent=4) == '{\n    "a": 1\n}'
+        assert app.json.loads('{"a": 1}') == {'a': 1}
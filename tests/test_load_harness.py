@@ -0,0 +1,48 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.fake_gemini import QUOTA_ERROR, FakeGemini
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_fake_gemini_quota_and_output_cap():
+    model = FakeGemini(latency_ms=0, sigma=0, rpm=2, reply_tokens=40, seed=1)
+    reply = model.generate_content('prompt', generation_config={'max_output_tokens': 5})
+    assert len(reply.text.split()) == 5 + 3  # five words plus "(N chars seen)"
+    model.generate_content('prompt')
+    with pytest.raises(Exception, match='429'):
+        model.generate_content('prompt')
+    assert model.stats() == {'calls': 3, 'quota_errors': 1, 'errors': 0}
+    assert '429' in QUOTA_ERROR
+
+
+def test_fake_gemini_streams_the_whole_reply():
+    model = FakeGemini(latency_ms=0, sigma=0, reply_tokens=20, seed=1)
+    chunks = [chunk.text for chunk in model.generate_content('prompt', stream=True)]
+    assert len(chunks) > 1
+    assert len(''.join(chunks).split()) == 20 + 3
+
+    async def stream():
+        return [chunk.text async for chunk in await model.generate_content_async('prompt', stream=True)]
+
+    assert len(''.join(asyncio.run(stream())).split()) == 20 + 3
+
+
+def test_load_test_runs_offline(tmp_path):
+    results = tmp_path / 'results.json'
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'load_test.py'), '--sessions', '4', '--turns', '2',
+         '--concurrency', '2', '--latency-ms', '1', '--json', str(results)],
+        check=True, capture_output=True, cwd=str(tmp_path), timeout=60,
+    )
+    data = json.loads(results.read_text())
+    assert data['requests'] == 8
+    assert data['failures'] == 0
+    assert data['statuses'] == {'200': 8}
+    assert data['sessions'] == 4
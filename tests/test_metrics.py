@@ -0,0 +1,66 @@
+import threading
+
+from metrics import Registry
+
+
+def run_threads(target, count=8):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_counter_sums_across_threads_and_folds_exited_shards():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests', ('route',))
+    chat = requests.labels('/api/chat')
+
+    def work():
+        for _ in range(100):
+            chat.inc()
+
+    run_threads(work)
+    assert requests.values() == {('/api/chat',): 800}
+    # Exited threads' shards were folded into the base on scrape
+    assert requests._shards._all == []
+    run_threads(work)
+    assert requests.values() == {('/api/chat',): 1600}
+
+
+def test_histogram_buckets_sum_and_count():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    text = registry.render()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_sum 5.55' in text
+    assert 'latency_seconds_count 3' in text
+
+
+def test_callbacks_render_and_failures_do_not_break_the_scrape():
+    registry = Registry()
+    registry.callback('pending', 'Pending records', lambda: 3)
+    registry.callback('hits_total', 'Hits', lambda: {('exact',): 2}, ('cache',), kind='counter')
+    registry.callback('broken', 'Broken', lambda: 1 / 0)
+    text = registry.render()
+    assert 'pending 3' in text
+    assert '# TYPE hits_total counter' in text
+    assert 'hits_total{cache="exact"} 2' in text
+    assert '# broken unavailable' in text
+
+
+def test_turn_log_pending_callback(tmp_path):
+    from turn_log import TurnLog
+
+    log = TurnLog(str(tmp_path), flush_interval=60)
+    try:
+        log.append('s', 1.0, 'hi', 'hello')
+        assert log.pending() == 1 == log.stats()['pending']
+        log.flush()
+        assert log.pending() == 0
+    finally:
+        log.close()
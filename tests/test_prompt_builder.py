@@ -0,0 +1,47 @@
+import time
+
+from prompt_builder import (FIRST_MESSAGE_PREFIX, HISTORY_PREFIX, SENTIMENT_GUIDANCE, SUMMARY_PREFIX,
+                            PromptBuilder, estimate_tokens)
+from session_store import Turn
+
+
+def turns(count, size=10):
+    return [Turn(time.time(), f'user {i} ' + 'x' * size, f'bot {i}') for i in range(count)]
+
+
+def test_first_message_prompt():
+    prompt = PromptBuilder().build('hi', [], 'negative')
+    assert prompt.startswith(FIRST_MESSAGE_PREFIX + 'hi')
+    assert SENTIMENT_GUIDANCE['negative'] in prompt
+
+
+def test_history_keeps_the_newest_turns_in_order():
+    builder = PromptBuilder(max_turns=2)
+    prompt = builder.build('now', turns(4), 'neutral')
+    assert prompt.startswith(HISTORY_PREFIX)
+    assert 'user 0' not in prompt and 'user 1' not in prompt
+    assert prompt.index('user 2') < prompt.index('user 3') < prompt.index('Current message: now')
+    assert builder.turns_trimmed == 0
+
+
+def test_token_budget_drops_the_oldest_turns():
+    history = turns(5, size=100)
+    per_turn = estimate_tokens(PromptBuilder.segment(history[0])[0])
+    builder = PromptBuilder(max_turns=5, history_token_budget=2 * per_turn + 1)
+    prompt = builder.build('now', history, 'neutral')
+    assert 'user 2' not in prompt
+    assert 'user 3' in prompt and 'user 4' in prompt
+    assert builder.turns_trimmed == 3
+
+
+def test_oversized_newest_turn_is_truncated():
+    builder = PromptBuilder(history_token_budget=10)
+    prompt = builder.build('now', turns(1, size=500), 'neutral')
+    assert ' …' in prompt
+    assert 'x' * 100 not in prompt
+
+
+def test_summary_replaces_older_turns():
+    prompt = PromptBuilder().build('now', turns(1), 'neutral', summary='they love chai')
+    assert prompt.startswith(SUMMARY_PREFIX + 'they love chai')
+    assert 'user 0' in prompt
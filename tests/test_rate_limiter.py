@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import (AdmissionScheduler, LocalBucketBackend, RateLimitExceeded,
+                          SQLiteBucketBackend)
+
+
+@pytest.fixture(params=['local', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'local':
+        return LocalBucketBackend()
+    return SQLiteBucketBackend(str(tmp_path / 'buckets.db'))
+
+
+def make_scheduler(backend, **kwargs):
+    options = dict(key_rate=0.001, key_burst=2, session_rate=0.001, session_burst=1,
+                   max_queue=4, max_wait=0.05)
+    options.update(kwargs)
+    return AdmissionScheduler(backend=backend, **options)
+
+
+def test_burst_is_admitted_then_rejected(backend):
+    scheduler = make_scheduler(backend)
+    assert scheduler.try_acquire('key') == 0
+    assert scheduler.try_acquire('key') == 0
+    wait = scheduler.try_acquire('key')
+    assert wait > 0
+    assert scheduler.admitted == 2
+
+
+def test_all_or_nothing_across_buckets(backend):
+    scheduler = make_scheduler(backend)
+    assert scheduler.try_acquire('key', 's') == 0
+    # The session bucket is empty, so the key keeps its token
+    assert scheduler.try_acquire('key', 's') > 0
+    assert 0.99 < scheduler.available('key') < 1.01
+
+
+def test_tokens_refill_over_time(backend):
+    scheduler = make_scheduler(backend, key_rate=50.0, key_burst=1)
+    assert scheduler.try_acquire('key') == 0
+    assert scheduler.try_acquire('key') > 0
+    time.sleep(0.05)
+    assert scheduler.try_acquire('key') == 0
+
+
+def test_acquire_waits_within_the_deadline(backend):
+    scheduler = make_scheduler(backend, key_rate=50.0, key_burst=1, max_wait=1.0)
+    scheduler.acquire('key')
+    waited = scheduler.acquire('key')
+    assert 0 < waited < 1.0
+
+
+def test_acquire_rejects_a_wait_past_the_deadline(backend):
+    scheduler = make_scheduler(backend)
+    scheduler.acquire(None, 's')
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        scheduler.acquire(None, 's')
+    assert exceeded.value.reason == 'deadline'
+    assert exceeded.value.retry_after > 0
+    assert scheduler.rejected == 1
+
+
+def test_full_queue_rejects_straight_away():
+    scheduler = make_scheduler(LocalBucketBackend(), max_queue=0, max_wait=10.0)
+    scheduler.acquire(None, 's')
+    with pytest.raises(RateLimitExceeded) as exceeded:
+        scheduler.acquire(None, 's')
+    assert exceeded.value.reason == 'queue_full'
+
+
+def test_acquire_async(backend):
+    scheduler = make_scheduler(backend, key_rate=50.0, key_burst=1, max_wait=1.0)
+
+    async def run():
+        await scheduler.acquire_async('key')
+        return await scheduler.acquire_async('key')
+
+    assert 0 < asyncio.run(run()) < 1.0
+
+
+def test_sqlite_buckets_are_shared_and_pruned(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    first = make_scheduler(SQLiteBucketBackend(path))
+    second = make_scheduler(SQLiteBucketBackend(path))
+    assert first.try_acquire(None, 's') == 0
+    assert second.try_acquire(None, 's') > 0
+
+    backend = second.backend
+    backend._prune(time.time() + backend.IDLE_SECONDS + 1)
+    assert second.try_acquire(None, 's') == 0
@@ -0,0 +1,52 @@
+import time
+
+import response_cache
+from response_cache import SCOPE_ALL, SCOPE_OFF, ResponseCache, normalize_message
+from session_store import Turn
+
+
+def turn(user):
+    return Turn(time.time(), user, 'ok')
+
+
+def test_normalized_messages_share_a_key():
+    cache = ResponseCache()
+    assert normalize_message('  Hi!!  THERE ') == 'hi there'
+    assert cache.key('Hi!', 'greeting', []) == cache.key('hi', 'greeting', [])
+    assert cache.key('hi', 'greeting', []) != cache.key('hi', 'positive', [])
+
+
+def test_scope_decides_what_is_cached():
+    history = [turn('earlier')]
+    assert ResponseCache().key('hi', 'greeting', history) is None
+    assert ResponseCache(scope=SCOPE_OFF).key('hi', 'greeting', []) is None
+    assert ResponseCache().key('?!', 'neutral', []) is None
+
+    cache = ResponseCache(scope=SCOPE_ALL)
+    assert cache.key('hi', 'greeting', history) != cache.key('hi', 'greeting', [turn('other')])
+
+
+def test_hit_miss_and_ttl(monkeypatch):
+    cache = ResponseCache(ttl=60)
+    key = cache.key('hello', 'greeting', [])
+    assert cache.get(key) is None
+    cache.put(key, 'hey!')
+    assert cache.get(key) == 'hey!'
+
+    later = time.monotonic() + 61
+    monkeypatch.setattr(response_cache.time, 'monotonic', lambda: later)
+    assert cache.get(key) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    keys = [cache.key(message, 'neutral', []) for message in ('one', 'two', 'three')]
+    cache.put(keys[0], 'a')
+    cache.put(keys[1], 'b')
+    cache.get(keys[0])
+    cache.put(keys[2], 'c')
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == 'a'
+    assert cache.evictions == 1
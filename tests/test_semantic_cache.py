@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+from session_store import Turn
+
+pytestmark = pytest.mark.skipif(semantic_cache.np is None, reason='needs numpy')
+
+
+def turn(user, bot='ok'):
+    return Turn(time.time(), user, bot)
+
+
+def test_paraphrase_hits_and_unrelated_message_misses():
+    cache = SemanticCache(threshold=0.8)
+    cache.put(cache.key('heyyy how are you', 'greeting', []), 'hello!')
+
+    assert cache.get(cache.key('hey how are you??', 'greeting', [])) == 'hello!'
+    assert cache.get(cache.key('my exam went badly', 'greeting', [])) is None
+    assert cache.get(cache.key('heyyy how are you', 'negative', [])) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_history_is_part_of_the_key():
+    cache = SemanticCache(threshold=0.8, max_history=2)
+    history = [turn('I failed my exam')]
+    cache.put(cache.key('what should I do now', 'neutral', history), 'study plan')
+
+    assert cache.get(cache.key('what should I do now', 'neutral', history)) == 'study plan'
+    assert cache.get(cache.key('what should I do now', 'neutral', [turn('my dog is sick')])) is None
+    assert cache.get(cache.key('what should I do now', 'neutral', [])) is None
+
+
+def test_messages_with_too_much_history_are_not_cached():
+    cache = SemanticCache(max_history=1)
+    assert cache.key('hi', 'greeting', [turn('a'), turn('b')]) is None
+
+
+def test_expired_entries_are_not_served(monkeypatch):
+    cache = SemanticCache(threshold=0.8, ttl=60)
+    key = cache.key('hello there', 'greeting', [])
+    cache.put(key, 'hi!')
+    later = time.time() + 61
+    monkeypatch.setattr(semantic_cache.time, 'time', lambda: later)
+    assert cache.get(key) is None
+
+
+def test_least_recently_used_entry_is_replaced():
+    cache = SemanticCache(threshold=0.95, max_entries=2)
+    for message in ('good morning friend', 'tell me a joke', 'what is the weather'):
+        cache.put(cache.key(message, 'neutral', []), message.upper())
+    assert cache.evictions == 1
+    assert cache.get(cache.key('good morning friend', 'neutral', [])) is None
+    assert cache.get(cache.key('what is the weather', 'neutral', [])) == 'WHAT IS THE WEATHER'
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import sentiment
+from sentiment import SentimentMatcher, detect_sentiment, detect_sentiments
+
+
+@pytest.mark.parametrize('message, expected', [
+    ('I am so sad and upset today', 'negative'),
+    ('yaar I got the job, so happy!!', 'positive'),
+    ('how do I fix this?', 'seeking_help'),
+    ('hello 👋', 'greeting'),
+    ('kya hal hai bhai', 'greeting'),
+    ('we broke up last night', 'negative'),
+    ('just had lunch', 'neutral'),
+])
+def test_detect_sentiment(message, expected):
+    assert detect_sentiment(message) == expected
+
+
+@pytest.mark.parametrize('message', ['this is it', 'I wonder about it', 'sushi khana hai'])
+def test_keywords_match_whole_words_only(message):
+    assert detect_sentiment(message) == 'neutral'
+
+
+def test_duplicate_keywords_count_once():
+    matcher = SentimentMatcher({'negative': ['problem', 'problem', 'tension'], 'positive': ['great']})
+    assert matcher.scan('problem problem, great') == {'negative': 1, 'positive': 1}
+    assert matcher.keyword_count == 3
+
+
+def test_phrases_need_every_word():
+    matcher = SentimentMatcher({'positive': ['good news']})
+    assert matcher.scan('some good news!') == {'positive': 1}
+    assert matcher.scan('good, but no news') == {'positive': 0}
+
+
+def test_detect_sentiments_matches_detect_sentiment():
+    messages = ['hi', 'so sad', 'what?', 'ok']
+    assert detect_sentiments(messages) == [detect_sentiment(m) for m in messages]
+
+
+def test_keywords_file_overrides_a_category(tmp_path):
+    path = tmp_path / 'keywords.json'
+    path.write_text(json.dumps({'positive': ['chai']}))
+    try:
+        sentiment.reload_keywords(str(path))
+        assert detect_sentiment('chai time') == 'positive'
+        assert detect_sentiment('so happy') == 'neutral'
+        assert detect_sentiment('so sad') == 'negative'
+    finally:
+        sentiment._keywords_file = None
+        sentiment.reload_keywords()
+    assert detect_sentiment('so happy') == 'positive'
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from session_sequencer import POLICY_REJECT, SessionBusy, SessionSequencer
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_queue_hands_session_over_in_arrival_order():
+    sequencer = SessionSequencer(max_wait=5.0)
+    order = []
+
+    def turn(name):
+        sequencer.acquire('s')
+        order.append(name)
+        sequencer.release('s')
+
+    sequencer.acquire('s')
+    threads = []
+    for i, name in enumerate('abcd'):
+        thread = threading.Thread(target=turn, args=(name,))
+        thread.start()
+        threads.append(thread)
+        # Start the next waiter only once this one is queued
+        wait_for(lambda: sequencer.queued == i + 1)
+    sequencer.release('s')
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == list('abcd')
+    assert sequencer.stats()['in_flight'] == 0
+
+
+def test_other_sessions_do_not_wait():
+    sequencer = SessionSequencer(max_wait=0.1)
+    sequencer.acquire('a')
+    sequencer.acquire('b')
+    sequencer.release('b')
+    sequencer.release('a')
+    assert sequencer.queued == 0
+
+
+def test_reject_fails_while_in_flight():
+    sequencer = SessionSequencer(policy=POLICY_REJECT)
+    sequencer.acquire('s')
+    with pytest.raises(SessionBusy) as busy:
+        sequencer.acquire('s')
+    assert busy.value.reason == 'in_flight'
+    assert sequencer.rejected == 1
+
+    sequencer.release('s')
+    sequencer.acquire('s')
+    sequencer.release('s')
+    assert sequencer.stats()['in_flight'] == 0
+
+
+def test_queue_full_is_rejected():
+    sequencer = SessionSequencer(max_queue=0)
+    sequencer.acquire('s')
+    with pytest.raises(SessionBusy) as busy:
+        sequencer.acquire('s')
+    assert busy.value.reason == 'queue_full'
+    sequencer.release('s')
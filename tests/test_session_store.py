@@ -0,0 +1,135 @@
+import threading
+import time
+
+import session_store
+from session_store import SessionStore, SQLitePersistence
+
+
+def test_lru_eviction_by_count():
+    store = SessionStore(max_sessions=2)
+    for session_id in ('a', 'b'):
+        store.append_turn(session_id, 'hi', 'hello')
+    store.get('a')
+    store.append_turn('c', 'hi', 'hello')
+
+    assert 'b' not in store
+    assert 'a' in store and 'c' in store
+    assert store.evictions == {'lru': 1, 'ttl': 0}
+
+
+def test_lru_eviction_by_bytes():
+    store = SessionStore(max_bytes=3000)
+    for session_id in ('a', 'b', 'c'):
+        store.append_turn(session_id, 'x' * 1000, 'y')
+    assert store.nbytes <= 3000
+    assert store.evictions['lru'] >= 1
+    assert 'c' in store
+
+
+def test_ttl_eviction(monkeypatch):
+    store = SessionStore(ttl=60)
+    start = time.time()
+    store.append_turn('old', 'hi', 'hello')
+    monkeypatch.setattr(session_store.time, 'time', lambda: start + 61)
+    store.append_turn('new', 'hi', 'hello')
+
+    assert store.get('old') is None
+    assert store.get('new') is not None
+    assert store.evictions['ttl'] == 1
+
+
+def test_history_limit():
+    store = SessionStore(history_limit=3)
+    for i in range(5):
+        store.append_turn('s', f'message {i}', 'reply')
+    context = store.get('s')
+    assert [turn.user for turn in context.history] == ['message 2', 'message 3', 'message 4']
+    assert context.turns_total == 5
+
+
+def test_sqlite_persistence_survives_restart(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SessionStore(persistence=SQLitePersistence(path))
+    store.append_turn('s', 'hi', 'hello')
+    store.close()
+
+    restarted = SessionStore(persistence=SQLitePersistence(path))
+    try:
+        assert [turn.user for turn in restarted.get('s').history] == ['hi']
+        assert restarted.loaded == 1
+    finally:
+        restarted.close()
+
+
+def test_unstorable_row_is_dropped_and_writer_keeps_running(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    persistence = SQLitePersistence(path, flush_interval=0.01)
+    store = SessionStore(persistence=persistence)
+    store.append_turn('bad', 'broken \ud83d emoji', 'ok')
+    store.append_turn('good', 'hi', 'hello')
+    persistence.flush()
+    assert persistence.dropped == 1
+
+    store.append_turn('later', 'hi', 'hello')
+    deadline = time.time() + 5
+    while persistence.writes < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert persistence._thread.is_alive()
+    store.close()
+
+    restarted = SessionStore(persistence=SQLitePersistence(path))
+    try:
+        assert restarted.get('good') is not None
+        assert restarted.get('later') is not None
+        assert restarted.get('bad') is None
+    finally:
+        restarted.close()
+
+
+def test_cold_load_does_not_block_other_sessions(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    seed = SessionStore(persistence=SQLitePersistence(path))
+    seed.append_turn('cold', 'hi', 'hello')
+    seed.close()
+
+    persistence = SQLitePersistence(path)
+    store = SessionStore(persistence=persistence)
+    store.append_turn('warm', 'hi', 'hello')
+    load = persistence.load
+    other = []
+
+    def slow_load(session_id):
+        if session_id == 'cold':
+            reader = threading.Thread(target=lambda: other.append(store.get('warm')))
+            reader.start()
+            reader.join(timeout=2)
+        return load(session_id)
+
+    persistence.load = slow_load
+    try:
+        assert store.get('cold') is not None
+        assert other and other[0] is not None
+    finally:
+        store.close()
+
+
+def test_page_walks_sessions_newest_first(monkeypatch):
+    store = SessionStore()
+    start = time.time()
+    for i in range(5):
+        monkeypatch.setattr(session_store.time, 'time', lambda i=i: start + i)
+        for _ in range(i % 2 + 1):
+            store.append_turn(f's{i}', 'hi', 'hello')
+
+    pages, cursor = [], None
+    while True:
+        contexts, cursor = store.page(2, cursor=cursor)
+        pages.append([context.session_id for context in contexts])
+        if cursor is None:
+            break
+    assert pages == [['s4', 's3'], ['s2', 's1'], ['s0']]
+
+    contexts, cursor = store.page(10, active_since=start + 2)
+    assert [context.session_id for context in contexts] == ['s4', 's3', 's2'] and cursor is None
+    contexts, _ = store.page(10, min_messages=2)
+    assert [context.session_id for context in contexts] == ['s3', 's1']
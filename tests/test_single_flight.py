@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def run_concurrently(flight, key, func, count=5):
+    results = [None] * count
+
+    def call(i):
+        results[i] = flight.do(key, func)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_concurrent_identical_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'reply'
+
+    assert run_concurrently(flight, 'prompt', slow) == ['reply'] * 5
+    assert len(calls) == 1
+    assert (flight.leaders, flight.coalesced) == (1, 4)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.coalesced == 0
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.05)
+        raise ValueError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('prompt', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(errors) == 3
+    assert flight.leaders + flight.coalesced == 3
+
+
+def test_follower_falls_back_after_max_wait():
+    flight = SingleFlight(max_wait=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=('prompt', lambda: release.wait(2) and 'late'))
+    leader.start()
+    time.sleep(0.02)
+    try:
+        assert flight.do('prompt', lambda: 'own call') == 'own call'
+        assert flight.fallbacks == 1
+    finally:
+        release.set()
+        leader.join(timeout=5)
+
+
+def test_disabled_calls_through():
+    flight = SingleFlight(max_wait=0)
+    assert not flight.enabled
+    assert flight.do('prompt', lambda: 'x') == 'x'
+    assert flight.leaders == 0
+
+
+def test_do_async_coalesces():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'reply'
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async('prompt', slow) for _ in range(4)))
+
+    assert asyncio.run(run()) == ['reply'] * 4
+    assert len(calls) == 1
+
+
+def test_leader_cancellation_lets_followers_call_themselves():
+    flight = SingleFlight()
+
+    async def never():
+        await asyncio.sleep(10)
+
+    async def own():
+        return 'own'
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do_async('prompt', never))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do_async('prompt', own))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == 'own'
+    assert flight.fallbacks == 1
@@ -0,0 +1,80 @@
+from rate_limiter import AdmissionScheduler
+from session_store import SessionStore
+from summarizer import ConversationSummarizer
+from upstream import UpstreamClient, UpstreamPool
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class Model:
+    def __init__(self, text='they like chai'):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return Reply(self.text)
+
+
+def make_session(turns=6):
+    store = SessionStore(history_limit=10)
+    for i in range(turns):
+        store.append_turn('s', f'message {i}', 'reply')
+    return store
+
+
+def make_pool(model, key_burst=4):
+    scheduler = AdmissionScheduler(key_rate=0.001, key_burst=key_burst, session_rate=1, session_burst=1)
+    pool = UpstreamPool([UpstreamClient('key', model, api_key='secret')], scheduler=scheduler)
+    return pool, scheduler
+
+
+def test_summary_folds_turns_that_left_the_window():
+    store = make_session()
+    summarizer = ConversationSummarizer(store, lambda prompt, **kwargs: 'they like chai',
+                                        keep_recent=2, trigger_turns=2)
+    assert summarizer.summarize('s')
+    context = store.get('s')
+    assert context.digest == 'they like chai'
+    assert context.digested == 4
+    assert summarizer.stats()['completed'] == 1
+
+
+def test_empty_summary_keeps_the_old_digest():
+    store = make_session()
+    summarizer = ConversationSummarizer(store, lambda prompt, **kwargs: '  ', keep_recent=2, trigger_turns=2)
+    assert not summarizer.summarize('s')
+    assert store.get('s').digest is None
+    assert summarizer.failed == 1
+
+
+def test_summary_runs_only_with_spare_key_tokens():
+    store = make_session()
+    model = Model()
+    pool, scheduler = make_pool(model)
+    summarizer = ConversationSummarizer(store, pool.generate, keep_recent=2, trigger_turns=2)
+    key = 'secret'
+
+    # Chats used most of the burst: the summary is deferred and takes nothing
+    for _ in range(3):
+        assert not scheduler.try_acquire(key)
+    summarizer._run('s')
+    assert summarizer.deferred == 1
+    assert model.calls == 0
+    assert scheduler.available(key) < 1.01
+    assert store.get('s').digest is None
+
+
+def test_summary_takes_one_token_when_the_key_is_idle():
+    store = make_session()
+    model = Model()
+    pool, scheduler = make_pool(model)
+    summarizer = ConversationSummarizer(store, pool.generate, keep_recent=2, trigger_turns=2)
+
+    summarizer._run('s')
+    assert model.calls == 1
+    assert summarizer.completed == 1
+    assert 2.99 < scheduler.available('secret') < 3.01
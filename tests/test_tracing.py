@@ -0,0 +1,111 @@
+import threading
+import time
+
+import tracing
+from tracing import Tracer, add_span, annotate, bind, span
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_span_is_a_no_op_outside_a_trace():
+    assert Tracer().begin('/api/chat') is None
+    with span('prompt_build') as scope:
+        assert scope is None
+    add_span('upstream_stream', time.perf_counter())
+    assert bind(busy) is busy
+
+
+def test_nested_spans_report_self_time():
+    tracer = Tracer(enabled=True, slow_ms=0)
+    trace = tracer.begin('/api/chat', 'POST')
+    with span('upstream_call', policy='casual'):
+        with span('attempt'):
+            busy(0.02)
+        busy(0.01)
+    annotate(prompt_chars=123)
+    tracer.finish(trace, status=200)
+
+    entry = tracer.slow[-1]
+    assert (entry['name'], entry['method'], entry['status'], entry['prompt_chars']) == ('/api/chat', 'POST', 200, 123)
+    [call] = entry['children']
+    assert call['policy'] == 'casual'
+    assert [child['name'] for child in call['children']] == ['attempt']
+    assert call['children'][0]['ms'] >= 20
+    assert 5 <= call['self_ms'] < call['ms']
+    assert tracer.stats()['traced'] == 1 and tracer.stats()['slow'] == 1
+    # The trace is closed: later spans are no-ops again
+    assert span('late') is tracing._NOOP
+
+
+def test_add_span_adopts_spans_opened_during_it():
+    tracer = Tracer(enabled=True, slow_ms=0)
+    trace = tracer.begin('/api/chat/stream')
+    with span('prompt_build'):
+        pass
+    start = time.perf_counter()
+    with span('attempt'):
+        busy(0.005)
+    add_span('upstream_stream', start)
+    tracer.finish(trace)
+
+    children = tracer.slow[-1]['children']
+    assert [child['name'] for child in children] == ['prompt_build', 'upstream_stream']
+    assert [child['name'] for child in children[1]['children']] == ['attempt']
+
+
+def test_bind_carries_the_trace_to_another_thread():
+    tracer = Tracer(enabled=True, slow_ms=0)
+    trace = tracer.begin('/api/chat/batch')
+    worker = threading.Thread(target=bind(lambda: span('summarize').__enter__()))
+    worker.start()
+    worker.join()
+    tracer.finish(trace)
+    assert [child['name'] for child in tracer.slow[-1]['children']] == ['summarize']
+
+
+def test_error_is_recorded_on_the_span():
+    tracer = Tracer(enabled=True, slow_ms=0)
+    trace = tracer.begin('/api/chat')
+    try:
+        with span('upstream_call'):
+            raise TimeoutError
+    except TimeoutError:
+        pass
+    tracer.finish(trace)
+    assert tracer.slow[-1]['children'][0]['error'] == 'TimeoutError'
+
+
+def test_fast_requests_are_not_kept():
+    tracer = Tracer(enabled=True, slow_ms=10_000)
+    tracer.finish(tracer.begin('/api/health'))
+    assert not tracer.slow and tracer.stats()['traced'] == 1
+
+
+def test_profiles_are_summed_until_reset():
+    tracer = Tracer(enabled=True, slow_ms=10_000)
+    assert 'No profiled requests' in tracer.profile_report()
+    for _ in range(2):
+        trace = tracer.begin('/api/chat', profile=True)
+        busy(0.002)
+        tracer.finish(trace)
+    report = tracer.profile_report('tottime', 5)
+    assert report.startswith('2 profiled requests') and 'busy' in report
+
+    # Without the header and with no sample rate nothing is profiled
+    tracer.finish(tracer.begin('/api/chat'))
+    assert tracer.profiled == 2
+    tracer.reset_profile()
+    assert tracer.profiled == 0
+
+
+def test_tracer_from_env(monkeypatch):
+    monkeypatch.setenv('TRACE_REQUESTS', '1')
+    monkeypatch.setenv('TRACE_SLOW_MS', '250')
+    tracer = tracing.tracer_from_env()
+    assert tracer.enabled and tracer.slow_ms == 250
+    monkeypatch.setenv('TRACE_REQUESTS', '0')
+    assert not tracing.tracer_from_env().enabled
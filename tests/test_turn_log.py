@@ -0,0 +1,76 @@
+import os
+import time
+
+from session_store import SessionStore
+from turn_log import SEGMENT_SUFFIX, TurnLog, TurnLogReader, segment_paths
+
+
+def touch_segment(directory, ms, pid, seq):
+    path = os.path.join(directory, f"{ms:013d}-{pid}-{seq:04d}{SEGMENT_SUFFIX}")
+    open(path, 'wb').close()
+    return path
+
+
+def test_prune_keeps_other_workers_open_segments(tmp_path):
+    directory = str(tmp_path)
+    closed = touch_segment(directory, 1, 999999, 0)
+    open_elsewhere = touch_segment(directory, 2, 999999, 1)
+
+    log = TurnLog(directory, max_segments=1, flush_interval=60)
+    try:
+        log.append('s', 1.0, 'hi', 'hello')
+        log.flush()
+        assert not os.path.exists(closed)
+        assert os.path.exists(open_elsewhere)
+        assert log.pruned == 1
+        assert len(segment_paths(directory)) == 2
+    finally:
+        log.close()
+
+
+def test_prune_drops_own_closed_segments_oldest_first(tmp_path):
+    directory = str(tmp_path)
+    log = TurnLog(directory, segment_bytes=1, max_segments=2, flush_interval=60)
+    try:
+        for i in range(4):
+            log.append('s', float(i), f'message {i}', 'reply')
+            log.flush()
+        paths = segment_paths(directory)
+        assert len(paths) == 2
+        assert paths[-1] == log._path
+        assert log.pruned == 2
+    finally:
+        log.close()
+
+
+def test_unencodable_record_is_dropped_and_writer_keeps_running(tmp_path):
+    log = TurnLog(str(tmp_path), flush_interval=0.01)
+    try:
+        log.append('x' * 70000, 1.0, 'hi', 'hello')
+        log.append('s', 2.0, 'still logging?', 'yes')
+        log.flush()
+        assert log.dropped == 1
+        assert log.records == 1
+
+        log.append('s', 3.0, 'and later?', 'yes')
+        deadline = time.time() + 5
+        while log.records < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert log._thread.is_alive()
+        assert log.records == 2
+    finally:
+        log.close()
+
+
+def test_lone_surrogates_round_trip(tmp_path):
+    directory = str(tmp_path)
+    log = TurnLog(directory, flush_interval=60)
+    log.append('s', time.time(), 'broken \ud83d emoji', 'ok')
+    log.close()
+
+    turns = list(TurnLogReader(directory).session_turns('s'))
+    assert [turn.user for turn in turns] == ['broken \ud83d emoji']
+
+    store = SessionStore()
+    assert TurnLogReader(directory).rebuild(store) == (1, 1)
+    assert store.get('s').history[0].user == 'broken \ud83d emoji'
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from upstream import (CLOSED, HALF_OPEN, OPEN, UpstreamClient, UpstreamPool, UpstreamUnavailable,
+                      is_retryable_error)
+
+SERVER_ERROR = '503 The service is currently unavailable.'
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class Model:
+    """Fails with the queued errors, then answers"""
+
+    def __init__(self, errors=(), text='hello', delay=0.0):
+        self.errors = list(errors)
+        self.text = text
+        self.delay = delay
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.errors:
+            raise Exception(self.errors.pop(0))
+        if stream:
+            return iter([Reply(word + ' ') for word in self.text.split()])
+        return Reply(self.text)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        return self.generate_content(prompt, stream, **kwargs)
+
+
+def make_pool(*models, **kwargs):
+    clients = [UpstreamClient(f'c{i}', model, failure_threshold=2, reset_timeout=0.05)
+               for i, model in enumerate(models)]
+    kwargs.setdefault('backoff_base', 0.0)
+    return UpstreamPool(clients, **kwargs), clients
+
+
+def test_breaker_opens_then_half_opens_then_closes():
+    client = UpstreamClient('c', Model(), failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        client.started()
+        client.failed(Exception(SERVER_ERROR))
+    assert client.state == OPEN
+    assert not client.available()
+
+    time.sleep(0.06)
+    assert client.available()
+    assert client.state == HALF_OPEN
+    client.started()
+    client.failed(Exception(SERVER_ERROR))
+    assert client.state == OPEN
+
+    time.sleep(0.06)
+    assert client.available()
+    client.started()
+    client.succeeded(0.1)
+    assert client.state == CLOSED
+    assert client.in_flight == 0
+
+
+def test_prompt_errors_do_not_open_the_breaker():
+    client = UpstreamClient('c', Model(), failure_threshold=2)
+    for _ in range(5):
+        client.started()
+        client.failed(Exception('400 Invalid argument'))
+    assert client.state == CLOSED
+    assert client.prompt_errors == 5
+    assert client.in_flight == 0
+
+
+def test_retryable_errors():
+    assert is_retryable_error('429 Resource has been exhausted')
+    assert is_retryable_error(SERVER_ERROR)
+    assert not is_retryable_error('400 Invalid argument')
+
+
+def test_fails_over_to_another_client():
+    # Whichever client goes first fails, and so does the other; the third attempt succeeds
+    pool, clients = make_pool(Model(errors=[SERVER_ERROR]), Model(errors=[SERVER_ERROR]))
+    assert pool.generate('hi') == 'hello'
+    assert pool.retries == 2
+    assert sum(client.failures for client in clients) == 2
+    assert all(client.in_flight == 0 for client in clients)
+
+
+def test_prompt_error_is_not_retried():
+    model = Model(errors=['400 Invalid argument'])
+    pool, _ = make_pool(model)
+    with pytest.raises(Exception, match='400'):
+        pool.generate('hi')
+    assert model.calls == 1
+
+
+def test_all_circuits_open():
+    pool, clients = make_pool(Model())
+    clients[0].state = OPEN
+    clients[0].opened_at = time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        pool.generate('hi')
+
+
+def test_hedge_wins_over_a_slow_primary():
+    slow, fast = Model(text='slow', delay=0.5), Model(text='fast')
+    pool, clients = make_pool(slow, fast, hedge=0.02)
+    clients[1].in_flight = 1  # make the slow client the first pick
+    try:
+        assert pool.generate('hi') == 'fast'
+        assert (pool.hedges, pool.hedge_wins) == (1, 1)
+    finally:
+        clients[1].in_flight = 0
+
+
+def test_stream_and_abandoned_stream_release_the_slot():
+    pool, clients = make_pool(Model(text='one two three'))
+    assert ''.join(pool.stream('hi')) == 'one two three '
+    assert clients[0].in_flight == 0
+
+    stream = pool.stream('hi')
+    next(stream)
+    stream.close()
+    assert clients[0].in_flight == 0
+
+
+def test_generate_async_fails_over():
+    pool, clients = make_pool(Model(errors=[SERVER_ERROR]), Model(errors=[SERVER_ERROR]))
+    assert asyncio.run(pool.generate_async('hi')) == 'hello'
+    assert pool.retries == 2
+    assert all(client.in_flight == 0 for client in clients)
@@ -0,0 +1,262 @@
+"""
+Opt-in request tracing and sampled profiling for the chat pipeline.
+
+With TRACE_REQUESTS=1 every request gets a span tree: the stages of
+generate_response (rate-limit wait, session turn, prompt build, cache
+lookup, upstream attempts and retry backoff, flavoring, context update)
+open child spans of whatever span is current. Each span reports its own
+time (not covered by a child) as self_ms, so time spent in our code
+stands out from time spent waiting. Requests slower than TRACE_SLOW_MS
+are printed and kept with their span breakdown and prompt size for
+GET /api/debug/slow.
+
+A request is also run under cProfile when it sends "X-Profile: 1" or is
+picked by TRACE_PROFILE_RATE. The profiles are summed, and
+GET /api/debug/profile prints the hot paths. cProfile only sees the
+thread it runs on, and under asyncio it sees the whole loop, so at most
+one request per thread is profiled at a time.
+
+The current span lives in a ContextVar, so it follows the request
+through generator-based streams and asyncio tasks. Work submitted to a
+thread pool only joins the trace if it is wrapped with bind(). With
+tracing off, span() is one ContextVar lookup that returns a shared
+no-op context manager.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar, copy_context
+from datetime import datetime
+from functools import partial
+
+_current = ContextVar('trace_span', default=None)
+_root = ContextVar('trace_root', default=None)
+_NOOP = nullcontext()
+
+
+class Span:
+    """One timed stage; children are stages started while it was current"""
+
+    __slots__ = ('name', 'start', 'end', 'attrs', 'children')
+
+    def __init__(self, name, start, attrs=None):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.attrs = attrs or {}
+        self.children = []
+
+    @property
+    def seconds(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin=None):
+        """Span tree with millisecond offsets from the root"""
+        origin = self.start if origin is None else origin
+        seconds = self.seconds
+        children = [child.to_dict(origin) for child in sorted(self.children, key=lambda c: c.start)]
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'ms': round(seconds * 1000, 2),
+            'self_ms': round(max(0.0, seconds - sum(child.seconds for child in self.children)) * 1000, 2),
+            **self.attrs,
+            'children': children
+        }
+
+
+class _SpanScope:
+    """Context manager that times a child of the current span"""
+
+    __slots__ = ('_parent', '_span', '_token')
+
+    def __init__(self, parent, name, attrs):
+        self._parent = parent
+        self._span = Span(name, 0.0, attrs)
+
+    def __enter__(self):
+        self._span.start = time.perf_counter()
+        self._parent.children.append(self._span)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        self._span.end = time.perf_counter()
+        if exc_type is not None:
+            self._span.attrs['error'] = exc_type.__name__
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Exited in another context (a generator resumed elsewhere)
+            _current.set(self._parent)
+
+
+def span(name, **attrs):
+    """Time a stage as a child of the current span (a no-op outside a trace)"""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(parent, name, attrs)
+
+
+def add_span(name, start, **attrs):
+    """Record a stage that started at `start` (a perf_counter value) and just finished
+
+    Spans opened during it (e.g. upstream attempts inside a stream) move
+    under it.
+    """
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span(name, start, attrs)
+    child.end = time.perf_counter()
+    child.children = [c for c in parent.children if c.start >= child.start]
+    if child.children:
+        parent.children[:] = [c for c in parent.children if c.start < child.start]
+    parent.children.append(child)
+
+
+def annotate(**attrs):
+    """Attach attributes (e.g. prompt size) to the request's root span"""
+    root = _root.get()
+    if root is not None:
+        root.attrs.update(attrs)
+
+
+def bind(func):
+    """Carry the current trace into work run on another thread"""
+    if _current.get() is None:
+        return func
+    return partial(copy_context().run, func)
+
+
+class Trace:
+    """A request being traced: its root span and, if sampled, its profiler"""
+
+    __slots__ = ('root', 'method', 'profiler')
+
+    def __init__(self, root, method, profiler):
+        self.root = root
+        self.method = method
+        self.profiler = profiler
+
+
+class Tracer:
+    """Starts and finishes request traces, keeps slow ones and sums profiles"""
+
+    def __init__(self, enabled=False, slow_ms=1000.0, slow_keep=50, profile_rate=0.0, profile_header=True):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.profile_rate = profile_rate
+        self.profile_header = profile_header
+
+        self.slow = deque(maxlen=slow_keep)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profile = None
+        self.traced = 0
+        self.slow_total = 0
+        self.profiled = 0
+        self.profile_skipped = 0
+
+    def begin(self, path, method='GET', profile=False):
+        """Start tracing the current request; None when tracing is off"""
+        if not self.enabled:
+            return None
+        root = Span(path, time.perf_counter())
+        _current.set(root)
+        _root.set(root)
+        profiler = None
+        if (profile and self.profile_header) or (self.profile_rate and random.random() < self.profile_rate):
+            profiler = self._start_profiler()
+        return Trace(root, method, profiler)
+
+    def _start_profiler(self):
+        if getattr(self._local, 'profiling', False):
+            self.profile_skipped += 1
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (Python 3.12+ allows one per process)
+            self.profile_skipped += 1
+            return None
+        self._local.profiling = True
+        return profiler
+
+    def finish(self, trace, status=None):
+        """End a request's trace: fold in its profile and log it if slow"""
+        if trace is None:
+            return
+        root = trace.root
+        root.end = time.perf_counter()
+        _current.set(None)
+        _root.set(None)
+        if status is not None:
+            root.attrs['status'] = status
+
+        if trace.profiler is not None:
+            trace.profiler.disable()
+            self._local.profiling = False
+            with self._lock:
+                if self._profile is None:
+                    self._profile = pstats.Stats(trace.profiler)
+                else:
+                    self._profile.add(trace.profiler)
+                self.profiled += 1
+
+        self.traced += 1
+        ms = root.seconds * 1000
+        if ms < self.slow_ms:
+            return
+        self.slow_total += 1
+        entry = {'method': trace.method, 'timestamp': datetime.now().isoformat(), **root.to_dict()}
+        self.slow.append(entry)
+        breakdown = ', '.join(f"{child['name']} {child['ms']:.0f}" for child in entry['children'])
+        print(f"🐢 Slow request {trace.method} {root.name} {ms:.0f} ms "
+              f"(prompt {root.attrs.get('prompt_chars', '-')} chars): {breakdown or 'no stages'}")
+
+    def profile_report(self, sort='cumulative', limit=40):
+        """Text report of the summed profiles, hottest first"""
+        with self._lock:
+            if self._profile is None:
+                return "No profiled requests yet (send X-Profile: 1 or set TRACE_PROFILE_RATE)\n"
+            out = io.StringIO()
+            self._profile.stream = out
+            self._profile.sort_stats(sort).print_stats(limit)
+            return f"{self.profiled} profiled requests\n" + out.getvalue()
+
+    def reset_profile(self):
+        with self._lock:
+            self._profile = None
+            self.profiled = 0
+
+    def stats(self):
+        """Tracing counters"""
+        return {
+            'enabled': self.enabled,
+            'slow_ms': self.slow_ms,
+            'profile_rate': self.profile_rate,
+            'traced': self.traced,
+            'slow': self.slow_total,
+            'profiled': self.profiled,
+            'profile_skipped': self.profile_skipped
+        }
+
+
+def tracer_from_env():
+    """Build the tracer from environment variables (off unless TRACE_REQUESTS=1)"""
+    return Tracer(
+        enabled=os.getenv('TRACE_REQUESTS', '0') in ('1', 'true', 'yes'),
+        slow_ms=float(os.getenv('TRACE_SLOW_MS', '1000')),
+        slow_keep=int(os.getenv('TRACE_SLOW_KEEP', '50')),
+        profile_rate=float(os.getenv('TRACE_PROFILE_RATE', '0')),
+        profile_header=os.getenv('TRACE_PROFILE_HEADER', '1') in ('1', 'true', 'yes'),
+    )
@@ -0,0 +1,340 @@
+"""
+Append-only binary log of conversation turns.
+
+Every stored turn (and every cleared session) is appended to a log for
+analytics and warm restarts. The request path only appends a tuple to a
+list; a writer thread encodes pending records and writes each batch with
+one write() call. Segments rotate by size and, optionally, by age, and
+old segments can be pruned.
+
+Record layout (little endian):
+
+    u32 payload length | u32 crc32(payload) | payload
+    payload = u8 kind | f64 timestamp | u16 session id length
+              | u32 user length | u32 bot length | session id | user | bot
+
+Each process writes its own segments (the file name carries the creation
+time and pid), so gunicorn workers never share a file. The reader maps
+segments read-only with mmap and walks the records in place. It can
+rebuild the session store, keeping only each session's newest turns, or
+stream one session's turns without loading whole files. A torn record at
+the end of a segment (crash mid-write) ends that segment.
+"""
+import gc
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from bisect import insort
+from contextlib import ExitStack
+
+from session_store import ChatContext, Turn
+
+KIND_TURN = 1
+KIND_DELETE = 2
+
+HEADER = struct.Struct('<II')
+FIELDS = struct.Struct('<BdHII')
+SEGMENT_SUFFIX = '.turns'
+# Lone surrogates (valid in JSON, not in UTF-8) are kept rather than failing the record
+TEXT_ERRORS = 'surrogatepass'
+
+
+def encode_record(kind, session_id, timestamp, user, bot):
+    sid, user, bot = (text.encode('utf-8', TEXT_ERRORS) for text in (session_id, user, bot))
+    payload = b''.join((FIELDS.pack(kind, timestamp, len(sid), len(user), len(bot)), sid, user, bot))
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class TurnLog:
+    """Batched, rotating writer for the turn log"""
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, segment_seconds=0, max_segments=0,
+                 flush_interval=0.5, batch_size=1000, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        # 0 = no age limit / keep every segment
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._size = 0
+        self.records = 0
+        self.bytes = 0
+        self.batches = 0
+        self.segments = 0
+        self.pruned = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='turn-log-writer', daemon=True)
+        self._thread.start()
+
+    def append(self, session_id, timestamp, user, bot):
+        """Queue a turn for writing"""
+        with self._lock:
+            self._pending.append((KIND_TURN, session_id, timestamp, user, bot))
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def delete(self, session_id):
+        """Queue a marker that the session was cleared"""
+        with self._lock:
+            self._pending.append((KIND_DELETE, session_id, time.time(), '', ''))
+
+    def pending(self):
+        """Records queued but not written yet"""
+        return len(self._pending)
+
+    def _segment(self):
+        """File for the next batch, rotating by size / age"""
+        if self._file is not None and (
+                self._size >= self.segment_bytes
+                or (self.segment_seconds and time.time() - self._opened_at >= self.segment_seconds)):
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self._opened_at = time.time()
+            name = f"{int(self._opened_at * 1000):013d}-{os.getpid()}-{self.segments:04d}{SEGMENT_SUFFIX}"
+            self._path = os.path.join(self.directory, name)
+            # Unbuffered: each batch is a single write() and nothing is left to flush after a fork
+            self._file = open(self._path, 'ab', buffering=0)
+            self._size = 0
+            self.segments += 1
+            self._prune()
+        return self._file
+
+    def _prune(self):
+        """Delete the oldest segments beyond max_segments
+
+        Other workers write to the same directory, and each may still be
+        appending to its newest segment, so the newest segment of every
+        pid is kept. Older ones are closed and safe to delete.
+        """
+        if not self.max_segments:
+            return
+        paths = segment_paths(self.directory)
+        newest = {}
+        for path in paths:
+            newest[segment_pid(path)] = path
+        closed = [path for path in paths if newest[segment_pid(path)] != path and path != self._path]
+        for path in closed[:max(0, len(paths) - self.max_segments)]:
+            try:
+                os.remove(path)
+                self.pruned += 1
+            except OSError:
+                pass
+
+    def flush(self):
+        """Write all pending records as one batch"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            records = list(self._encode(pending))
+            if not records:
+                return
+            data = b''.join(records)
+            segment = self._segment()
+            segment.write(data)
+            if self.fsync:
+                os.fsync(segment.fileno())
+            self._size += len(data)
+            self.records += len(records)
+            self.bytes += len(data)
+            self.batches += 1
+
+    def _encode(self, pending):
+        """Encoded records; one that cannot be encoded is logged and dropped"""
+        for record in pending:
+            try:
+                yield encode_record(*record)
+            except Exception as e:
+                self.dropped += 1
+                print(f"⚠️ Turn log dropped a record for session {record[1][:64]!r}: {e}")
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Turn log write failed: {e}")
+
+    def stats(self):
+        """Writer counters"""
+        return {
+            'directory': self.directory,
+            'pending': self.pending(),
+            'records': self.records,
+            'bytes': self.bytes,
+            'batches': self.batches,
+            'segments': self.segments,
+            'pruned': self.pruned,
+            'dropped': self.dropped,
+            'segment': os.path.basename(self._path) if self._path else None
+        }
+
+    def after_fork(self):
+        """Start a forked worker on its own segment and writer thread"""
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._path = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='turn-log-writer', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the writer and write what is left"""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def segment_pid(path):
+    """Pid of the process that wrote a segment ('{ms}-{pid}-{seq}.turns')"""
+    return os.path.basename(path).split('-')[1]
+
+
+def segment_paths(directory):
+    """Segment files, oldest first"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names) if name.endswith(SEGMENT_SUFFIX)]
+
+
+class TurnLogReader:
+    """Memory-mapped reader for turn log segments"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.corrupt_segments = 0
+
+    def _scan(self, buffer):
+        """(kind, session id bytes, timestamp, text offset, user length, bot length) per record"""
+        offset, end = 0, len(buffer)
+        while offset + HEADER.size <= end:
+            length, crc = HEADER.unpack_from(buffer, offset)
+            start = offset + HEADER.size
+            if start + length > end or zlib.crc32(buffer[start:start + length]) != crc:
+                self.corrupt_segments += 1
+                return
+            kind, timestamp, sid_len, user_len, bot_len = FIELDS.unpack_from(buffer, start)
+            sid_start = start + FIELDS.size
+            text_start = sid_start + sid_len
+            yield kind, buffer[sid_start:text_start], timestamp, text_start, user_len, bot_len
+            offset = start + length
+
+    def _segments(self):
+        """Read-only maps of the segments, oldest first (empty files skipped)"""
+        for path in segment_paths(self.directory):
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    yield buffer
+
+    def session_turns(self, session_id):
+        """Yield Turn objects of one session in log order"""
+        wanted = session_id.encode('utf-8', TEXT_ERRORS)
+        for buffer in self._segments():
+            for kind, sid, timestamp, text_start, user_len, bot_len in self._scan(buffer):
+                if sid != wanted or kind == KIND_DELETE:
+                    continue
+                user_end = text_start + user_len
+                yield Turn(timestamp, buffer[text_start:user_end].decode('utf-8', TEXT_ERRORS),
+                           buffer[user_end:user_end + bot_len].decode('utf-8', TEXT_ERRORS))
+
+    def rebuild(self, store):
+        """Load every session's newest turns into a SessionStore; return (sessions, records)
+
+        Only offsets are kept while scanning; text is decoded once, for the
+        turns that end up in the store. The collector is paused meanwhile:
+        the scan allocates millions of short-lived objects and nothing in
+        it forms cycles.
+        """
+        limit = store.history_limit
+        # session id -> [created_at, turns_total, [(timestamp, buffer, text offset, user len, bot len), ...]]
+        sessions = {}
+        records = 0
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with ExitStack() as stack:
+                for path in segment_paths(self.directory):
+                    f = stack.enter_context(open(path, 'rb'))
+                    if os.fstat(f.fileno()).st_size == 0:
+                        continue
+                    buffer = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                    for kind, sid, timestamp, text_start, user_len, bot_len in self._scan(buffer):
+                        records += 1
+                        if kind == KIND_DELETE:
+                            sessions.pop(sid, None)
+                            continue
+                        turn = (timestamp, buffer, text_start, user_len, bot_len)
+                        state = sessions.get(sid)
+                        if state is None:
+                            sessions[sid] = [timestamp, 1, [turn]]
+                            continue
+                        state[1] += 1
+                        turns = state[2]
+                        # Segments of different workers overlap in time
+                        if timestamp >= turns[-1][0]:
+                            turns.append(turn)
+                        else:
+                            insort(turns, turn, key=lambda t: t[0])
+                        if len(turns) > 2 * limit:
+                            del turns[:-limit]
+
+                # Oldest activity first, so the store's LRU order matches the log
+                for sid, (created_at, turns_total, turns) in sorted(sessions.items(),
+                                                                    key=lambda s: s[1][2][-1][0]):
+                    history = [
+                        Turn(timestamp, buffer[start:start + user_len].decode('utf-8', TEXT_ERRORS),
+                             buffer[start + user_len:start + user_len + bot_len].decode('utf-8', TEXT_ERRORS))
+                        for timestamp, buffer, start, user_len, bot_len in turns[-limit:]
+                    ]
+                    store.restore(ChatContext(sid.decode('utf-8', TEXT_ERRORS), created_at, history, turns_total))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return len(sessions), records
+
+
+def turn_log_from_env():
+    """Build the turn log writer from environment variables, or None if TURN_LOG_DIR is unset"""
+    directory = os.getenv('TURN_LOG_DIR')
+    if not directory:
+        return None
+    return TurnLog(
+        directory,
+        segment_bytes=int(os.getenv('TURN_LOG_SEGMENT_BYTES', str(64 * 1024 * 1024))),
+        segment_seconds=float(os.getenv('TURN_LOG_SEGMENT_SECONDS', '0')),
+        max_segments=int(os.getenv('TURN_LOG_MAX_SEGMENTS', '0')),
+        flush_interval=float(os.getenv('TURN_LOG_FLUSH_INTERVAL', '0.5')),
+        fsync=os.getenv('TURN_LOG_FSYNC', '0') in ('1', 'true', 'yes'),
+    )
@@ -0,0 +1,592 @@
+"""
+Upstream pool for Gemini calls.
+
+The pool holds one client per (API key, model) pair and sends each call
+to the available client with the most quota left in its rate-limit
+bucket. Each client has a circuit breaker that opens after repeated
+failures. Quota and transient errors are retried on another client with
+jittered exponential backoff. A hedged duplicate can be sent to a second
+client when the first is slower than a fixed delay or the observed p95.
+
+Clients wrap anything with a generate_content(prompt, **kwargs) method,
+so the pool runs unchanged against a local fake upstream
+(see benchmarks/fake_gemini.py).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from rate_limiter import RateLimitExceeded
+from tracing import span
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def is_quota_error(error_msg):
+    """Check whether an upstream error message means we hit the API quota"""
+    return "429" in error_msg or "quota" in error_msg.lower() or "ResourceExhausted" in error_msg
+
+
+def is_retryable_error(error_msg):
+    """Quota and transient server-side errors are worth retrying elsewhere"""
+    if is_quota_error(error_msg):
+        return True
+    return any(marker in error_msg for marker in (
+        '500', '502', '503', '504', 'Unavailable', 'DeadlineExceeded', 'InternalServerError'
+    ))
+
+
+def response_text(response):
+    """Text of a response or stream chunk
+
+    When the output cap runs out first (thinking tokens count toward it)
+    the candidate may have no text part and .text raises. That is a
+    truncated answer, not a failed call, so whatever text there is comes
+    back ('' if none). Other reasons (e.g. a safety block) still raise.
+    """
+    try:
+        return response.text
+    except ValueError:
+        candidates = getattr(response, 'candidates', None) or []
+        reason = getattr(candidates[0], 'finish_reason', None) if candidates else None
+        if getattr(reason, 'name', reason) not in ('MAX_TOKENS', 2):
+            raise
+        parts = getattr(getattr(candidates[0], 'content', None), 'parts', None) or []
+        return ''.join(getattr(part, 'text', '') for part in parts)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when every upstream client has an open circuit"""
+
+
+class UpstreamClient:
+    """One (API key, model) pair with its own circuit breaker"""
+
+    def __init__(self, name, model, api_key=None, failure_threshold=5, reset_timeout=30.0,
+                 tier='default'):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.tier = tier
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=256)
+        self.calls = 0
+        self.failures = 0
+        self.quota_errors = 0
+        self.prompt_errors = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether the circuit lets a call through (moves open -> half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            return self.state != OPEN
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+
+    def succeeded(self, latency):
+        with self._lock:
+            self.in_flight -= 1
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.state = CLOSED
+
+    def failed(self, error):
+        """Release the call slot; only key / service errors count toward the breaker
+
+        Errors about the prompt itself (a safety-blocked reply, a 400
+        invalid argument) say nothing about the client's health, so they
+        must not open the circuit for every other user.
+        """
+        message = str(error)
+        with self._lock:
+            self.in_flight -= 1
+            if not is_retryable_error(message):
+                self.prompt_errors += 1
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            if is_quota_error(message):
+                self.quota_errors += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def abandoned(self):
+        """Release the call slot of a call nobody waits for any more (client gone, task cancelled)"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def p95(self):
+        """95th percentile of recent successful call latencies, or None"""
+        samples = sorted(self.latencies)
+        if len(samples) < 20:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'tier': self.tier,
+            'state': self.state,
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'failures': self.failures,
+            'quota_errors': self.quota_errors,
+            'prompt_errors': self.prompt_errors,
+            'p95_ms': round(self.p95() * 1000, 1) if self.p95() is not None else None
+        }
+
+
+class UpstreamPool:
+    """Load-balanced, hedged, circuit-broken access to several upstream clients"""
+
+    def __init__(self, clients, scheduler=None, max_retries=2, backoff_base=0.5,
+                 backoff_max=8.0, hedge=None, max_workers=32):
+        self.clients = list(clients)
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # None: no hedging, 'auto': hedge after the client's observed p95, float: fixed delay
+        self.hedge = hedge
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upstream') if hedge else None
+
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    # ---------- client selection ----------
+
+    def _remaining_quota(self, client):
+        if self.scheduler is None or client.api_key is None:
+            return float('inf')
+        return self.scheduler.available(client.api_key)
+
+    def pick(self, exclude=(), tier=None):
+        """Available client with the most quota left (fewest in flight on ties)
+
+        With a tier, clients of that tier are preferred; any other available
+        client is used when the tier has none.
+        """
+        candidates = [c for c in self.clients if c not in exclude and c.available()]
+        if tier is not None:
+            candidates = [c for c in candidates if c.tier == tier] or candidates
+        if not candidates:
+            return None
+        random.shuffle(candidates)
+        return max(candidates, key=lambda c: (self._remaining_quota(c), -c.in_flight))
+
+    def _next_client(self, exclude, tier=None):
+        """Pick a client, preferring ones not tried yet"""
+        if not self.clients:
+            raise UpstreamUnavailable('No Gemini API key configured (set GEMINI_API_KEY or GEMINI_API_KEYS)')
+        client = self.pick(exclude, tier) or self.pick(tier=tier)
+        if client is None:
+            raise UpstreamUnavailable('All upstream clients are unavailable (circuits open)')
+        return client
+
+    def _admit(self, client):
+        """Take a rate-limit token for the client's key (waits, may raise RateLimitExceeded)"""
+        if self.scheduler is not None and client.api_key is not None:
+            self.scheduler.acquire(client.api_key)
+
+    def _try_admit(self, client):
+        """Take a token only if one is free right now (used for hedges)"""
+        if self.scheduler is None or client.api_key is None:
+            return True
+        return not self.scheduler.try_acquire(client.api_key)
+
+    def _admit_background(self, client):
+        """Take a token for background work without waiting, leaving half the key's burst to chats
+
+        Raises RateLimitExceeded when the key has no spare token.
+        """
+        if self.scheduler is None or client.api_key is None:
+            return
+        retry_after = 1.0 / self.scheduler.key_rate
+        if self.scheduler.available(client.api_key) <= self.scheduler.key_burst / 2:
+            raise RateLimitExceeded(retry_after, 'background')
+        wait = self.scheduler.try_acquire(client.api_key)
+        if wait:
+            raise RateLimitExceeded(wait, 'background')
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _hedge_delay(self, client):
+        if self.hedge == 'auto':
+            return client.p95()
+        return self.hedge
+
+    # ---------- sync calls ----------
+
+    def _call(self, client, prompt, kwargs):
+        client.started()
+        start = time.perf_counter()
+        try:
+            response = client.model.generate_content(prompt, **kwargs)
+            text = response_text(response)
+        except Exception as e:
+            client.failed(e)
+            raise
+        except BaseException:
+            client.abandoned()
+            raise
+        client.succeeded(time.perf_counter() - start)
+        return text
+
+    def _hedged_call(self, client, prompt, kwargs):
+        delay = self._hedge_delay(client) if self._executor else None
+        if delay is None:
+            return self._call(client, prompt, kwargs)
+
+        primary = self._executor.submit(self._call, client, prompt, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        backup_client = self.pick(exclude=(client,), tier=client.tier)
+        if backup_client is None or not self._try_admit(backup_client):
+            return primary.result()
+
+        self.hedges += 1
+        backup = self._executor.submit(self._call, backup_client, prompt, kwargs)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def generate(self, prompt, tier=None, background=False, **kwargs):
+        """Generate text for a prompt, with failover, backoff and hedging
+
+        tier prefers clients of that model tier; other kwargs (e.g. a
+        per-call generation_config) go to the model unchanged. A background
+        call (e.g. a summary) never waits for a rate-limit token and is not
+        hedged: it raises RateLimitExceeded unless the key has tokens to
+        spare for chats.
+        """
+        tried = []
+        for attempt in range(self.max_retries + 1):
+            client = self._next_client(tried, tier)
+            tried.append(client)
+            with span('key_admission', client=client.name):
+                if background:
+                    self._admit_background(client)
+                else:
+                    self._admit(client)
+            try:
+                with span('upstream_attempt', client=client.name, attempt=attempt):
+                    if background:
+                        return self._call(client, prompt, kwargs)
+                    return self._hedged_call(client, prompt, kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(str(e)):
+                    raise
+                self.retries += 1
+                delay = self.backoff(attempt)
+                print(f"⚠️ Upstream error on {client.name}, retrying in {delay:.1f}s: {e}")
+                with span('retry_backoff', client=client.name):
+                    time.sleep(delay)
+
+    def stream(self, prompt, tier=None, **kwargs):
+        """Yield text chunks; failover and retries only happen before the first chunk"""
+        tried = []
+        for attempt in range(self.max_retries + 1):
+            client = self._next_client(tried, tier)
+            tried.append(client)
+            with span('key_admission', client=client.name):
+                self._admit(client)
+            client.started()
+            start = time.perf_counter()
+            try:
+                # Time to the first chunk; the rest is relayed by the caller
+                with span('upstream_attempt', client=client.name, attempt=attempt):
+                    chunks = iter(client.model.generate_content(prompt, stream=True, **kwargs))
+                    first = next((text for text in map(response_text, chunks) if text), '')
+                break
+            except Exception as e:
+                client.failed(e)
+                if attempt >= self.max_retries or not is_retryable_error(str(e)):
+                    raise
+                self.retries += 1
+                delay = self.backoff(attempt)
+                print(f"⚠️ Upstream error on {client.name}, retrying in {delay:.1f}s: {e}")
+                with span('retry_backoff', client=client.name):
+                    time.sleep(delay)
+            except BaseException:
+                client.abandoned()
+                raise
+
+        try:
+            if first:
+                yield first
+            for chunk in chunks:
+                text = response_text(chunk)
+                if text:
+                    yield text
+        except Exception as e:
+            client.failed(e)
+            raise
+        except BaseException:
+            # GeneratorExit when the client disconnects mid-stream, or cancellation
+            client.abandoned()
+            raise
+        client.succeeded(time.perf_counter() - start)
+
+    # ---------- async calls ----------
+
+    async def _admit_async(self, client):
+        if self.scheduler is not None and client.api_key is not None:
+            await self.scheduler.acquire_async(client.api_key)
+
+    async def _call_async(self, client, prompt, kwargs):
+        client.started()
+        start = time.perf_counter()
+        try:
+            response = await client.model.generate_content_async(prompt, **kwargs)
+            text = response_text(response)
+        except Exception as e:
+            client.failed(e)
+            raise
+        except BaseException:
+            client.abandoned()
+            raise
+        client.succeeded(time.perf_counter() - start)
+        return text
+
+    async def _hedged_call_async(self, client, prompt, kwargs):
+        delay = self._hedge_delay(client) if self.hedge else None
+        if delay is None:
+            return await self._call_async(client, prompt, kwargs)
+
+        primary = asyncio.ensure_future(self._call_async(client, prompt, kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        backup_client = self.pick(exclude=(client,), tier=client.tier)
+        if backup_client is None or not self._try_admit(backup_client):
+            return await primary
+
+        self.hedges += 1
+        backup = asyncio.ensure_future(self._call_async(backup_client, prompt, kwargs))
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        self.hedge_wins += 1
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def generate_async(self, prompt, tier=None, **kwargs):
+        """Async twin of generate"""
+        tried = []
+        for attempt in range(self.max_retries + 1):
+            client = self._next_client(tried, tier)
+            tried.append(client)
+            with span('key_admission', client=client.name):
+                await self._admit_async(client)
+            try:
+                with span('upstream_attempt', client=client.name, attempt=attempt):
+                    return await self._hedged_call_async(client, prompt, kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(str(e)):
+                    raise
+                self.retries += 1
+                delay = self.backoff(attempt)
+                print(f"⚠️ Upstream error on {client.name}, retrying in {delay:.1f}s: {e}")
+                with span('retry_backoff', client=client.name):
+                    await asyncio.sleep(delay)
+
+    async def stream_async(self, prompt, tier=None, **kwargs):
+        """Async twin of stream"""
+        tried = []
+        for attempt in range(self.max_retries + 1):
+            client = self._next_client(tried, tier)
+            tried.append(client)
+            with span('key_admission', client=client.name):
+                await self._admit_async(client)
+            client.started()
+            start = time.perf_counter()
+            try:
+                with span('upstream_attempt', client=client.name, attempt=attempt):
+                    response = await client.model.generate_content_async(prompt, stream=True, **kwargs)
+                    chunks = response.__aiter__()
+                    first = ''
+                    async for chunk in chunks:
+                        first = response_text(chunk)
+                        if first:
+                            break
+                break
+            except Exception as e:
+                client.failed(e)
+                if attempt >= self.max_retries or not is_retryable_error(str(e)):
+                    raise
+                self.retries += 1
+                delay = self.backoff(attempt)
+                print(f"⚠️ Upstream error on {client.name}, retrying in {delay:.1f}s: {e}")
+                with span('retry_backoff', client=client.name):
+                    await asyncio.sleep(delay)
+            except BaseException:
+                client.abandoned()
+                raise
+
+        try:
+            if first:
+                yield first
+            async for chunk in chunks:
+                text = response_text(chunk)
+                if text:
+                    yield text
+        except Exception as e:
+            client.failed(e)
+            raise
+        except BaseException:
+            # GeneratorExit when the client disconnects mid-stream, or cancellation
+            client.abandoned()
+            raise
+        client.succeeded(time.perf_counter() - start)
+
+    def connect(self):
+        """Create the underlying API clients now instead of on first use"""
+        for client in self.clients:
+            if hasattr(client.model, 'connect'):
+                client.model.connect()
+
+    def after_fork(self):
+        """Drop state that must not be shared with a forked parent"""
+        if self._executor is not None:
+            self._executor = ThreadPoolExecutor(max_workers=self._executor._max_workers,
+                                                thread_name_prefix='upstream')
+        for client in self.clients:
+            if hasattr(client.model, 'after_fork'):
+                client.model.after_fork()
+
+    def stats(self):
+        """Pool counters and per-client state"""
+        return {
+            'configured': bool(self.clients),
+            'clients': [client.stats() for client in self.clients],
+            'retries': self.retries,
+            'hedge': self.hedge,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins
+        }
+
+
+def preload_libraries():
+    """Import the Gemini SDK (slow) without creating any clients.
+
+    Safe before fork: gRPC channels are only created by GeminiModel on
+    first use, i.e. in the worker process.
+    """
+    import google.generativeai  # noqa: F401
+    from google.ai import generativelanguage  # noqa: F401
+
+
+class GeminiModel:
+    """genai.GenerativeModel bound to its own API key, created on first use"""
+
+    def __init__(self, model_name, api_key, generation_config=None):
+        self.model_name = model_name
+        self._api_key = api_key
+        self._generation_config = generation_config
+        self._glm = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Build the SDK model and its gRPC client (once per process)"""
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    from google.ai import generativelanguage as glm
+
+                    model = genai.GenerativeModel(self.model_name, generation_config=self._generation_config)
+                    model._client = glm.GenerativeServiceClient(client_options={'api_key': self._api_key})
+                    self._glm = glm
+                    self._model = model
+                model = self._model
+        return model
+
+    def after_fork(self):
+        # gRPC channels do not survive fork: the child builds its own
+        self._model = None
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        return self.connect().generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        model = self.connect()
+        # The async client must be created inside the running event loop
+        if model._async_client is None:
+            model._async_client = self._glm.GenerativeServiceAsyncClient(
+                client_options={'api_key': self._api_key}
+            )
+        return await model.generate_content_async(prompt, **kwargs)
+
+
+def upstream_pool_from_env(scheduler=None, generation_config=None):
+    """Build the upstream pool from GEMINI_API_KEYS / GEMINI_MODELS / GEMINI_FAST_MODELS"""
+    keys = [k.strip() for k in (os.getenv('GEMINI_API_KEYS') or os.getenv('GEMINI_API_KEY', '')).split(',') if k.strip()]
+    models = [(m.strip(), 'default') for m in os.getenv('GEMINI_MODELS', 'gemini-2.5-flash').split(',') if m.strip()]
+    # Cheaper/faster models for short replies (see generation_policy.py)
+    models += [(m.strip(), 'fast') for m in os.getenv('GEMINI_FAST_MODELS', '').split(',') if m.strip()]
+    hedge = os.getenv('UPSTREAM_HEDGE', 'off').strip().lower()
+    hedge = None if hedge in ('', 'off', '0') else ('auto' if hedge in ('auto', 'p95') else float(hedge))
+
+    clients = [
+        UpstreamClient(
+            f"{model_name}#{index}",
+            GeminiModel(model_name, key, generation_config),
+            api_key=key,
+            failure_threshold=int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('UPSTREAM_RESET_TIMEOUT', '30')),
+            tier=tier,
+        )
+        for index, key in enumerate(keys)
+        for model_name, tier in models
+    ]
+    return UpstreamPool(
+        clients,
+        scheduler=scheduler,
+        max_retries=int(os.getenv('UPSTREAM_MAX_RETRIES', '2')),
+        backoff_base=float(os.getenv('UPSTREAM_BACKOFF_BASE', '0.5')),
+        backoff_max=float(os.getenv('UPSTREAM_BACKOFF_MAX', '8')),
+        hedge=hedge,
+    )
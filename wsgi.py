@@ -0,0 +1,14 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app the app (compiled prompt, session store, Gemini SDK
+import) is built once in the master and shared copy-on-write by the
+workers; each worker creates its own gRPC clients after fork.
+"""
+import server
+
+server.preload()
+
+app = server.app